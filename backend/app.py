@@ -1,48 +1,119 @@
 import os
 import uuid
+import hashlib
+import asyncio
+import inspect
+import json
+import threading
+import time
 # import re # No longer needed for basic LLM parsing
 # import cv2 # No longer needed
 # import numpy as np # No longer needed
 from flask import Flask, request, jsonify, send_from_directory, g # Added g
+from flask.ctx import _AppCtxGlobals
 from flask_cors import CORS
 from PIL import Image # Still needed for handling image uploads
 # import pytesseract # No longer needed
-import requests
 # from collections import Counter # No longer needed
 from dotenv import load_dotenv
-import google.generativeai as genai
-import requests_cache
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import backend.rate_limit_storage  # noqa: F401  Registers the sqlite:// limiter storage
 import jwt # For JWT token generation/decoding
 from datetime import datetime, timedelta, timezone # For setting token expiry
 from functools import wraps # Added for decorator
+from concurrent.futures import ThreadPoolExecutor
 import logging  # Import the logging library
-import bleach  # For sanitizing user input
+from backend.providers import BookQuery, RecommendationPipeline, async_http_scope, preload_http_clients
+from backend.singleflight import SingleFlight
+from backend.llm_executor import AdaptiveLLMExecutor, LLMOverloaded
+from backend.detection import (STRUCTURED_DETECTION_PROMPT, STRUCTURED_GENERATION_CONFIG,
+                               GeminiBackend, create_detection_backend, gemini_error,
+                               normalize_detection)
+from backend.json_stream import JSONArrayStreamParser
+from backend.tiling import TilingConfig, merge_titles, split_into_tiles
+from backend.title_matching import TitleIndex, normalize_title
+from backend.public_cache import VersionedResponseCache
+from backend.json_provider import create_json_provider
+from backend.token_cache import VerifiedTokenCache
+from backend.passwords import HasherBusy, PasswordHasher
+from backend.sanitize import cache_stats as sanitize_cache_stats, sanitize_input
+from backend.validation import Field, Schema, ValidationError, add_request_bodies
+from backend.encoding import (JSON_MIMETYPE, MSGPACK_MIMETYPE, CompressionConfig,
+                              FieldsError, compress_response, encode_rows, negotiate_encoding,
+                              pack_msgpack, parse_fields)
+from backend.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as metrics_registry, RequestMetrics
+from sqlalchemy import event
+from sqlalchemy.orm import lazyload, validates
+from werkzeug.http import is_resource_modified
+
+try:
+    import asgiref
+except ImportError:  # Optional dependency (flask[async]); needed for /api/upload/async
+    asgiref = None
 
 # Load environment variables from .env file
 load_dotenv()  # Takes environment variables from .env
 
-# --- Configure Logging ---
-log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
-numeric_level = getattr(logging, log_level, logging.INFO)
-logging.basicConfig(level=numeric_level,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__) # Get a logger instance for this module
+
+
+# --- Configure Logging ---
+def configure_logging():
+    """Apply ``LOG_LEVEL`` to the root logger. Called by the entry points, not on import."""
+    log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    numeric_level = getattr(logging, log_level, logging.INFO)
+    logging.basicConfig(level=numeric_level,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # --- End Logging Config ---
 
-# Setup request caching to reduce API calls
-cache_expiry = int(os.getenv('CACHE_EXPIRY', '86400'))  # defaults to 24h
-requests_cache.install_cache('books_cache', expire_after=cache_expiry)
+# The recommendation provider pipeline (order, timeouts, budgets and the scoped
+# response cache - CACHE_EXPIRY defaults to 24h - all come from env). Built on
+# first use or by create_app, so importing the app opens no thread pools or
+# cache database; tests assign their own pipeline here.
+recommendation_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_recommendation_pipeline():
+    """Return the recommendation pipeline, building it from env on first call."""
+    global recommendation_pipeline
+    if recommendation_pipeline is None:
+        with _pipeline_lock:
+            if recommendation_pipeline is None:
+                recommendation_pipeline = RecommendationPipeline.from_env()
+    return recommendation_pipeline
 
 # Setup rate limiting
 rate_limit = os.getenv('RATE_LIMIT', '200 per hour')
-limiter = Limiter(key_func=get_remote_address, default_limits=[rate_limit])
+
+
+def rate_limit_key():
+    """Limit requests with a valid token per user (JWT subject), others per client address."""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        try:
+            return f"user:{_decode_token(auth_header[7:])['user_id']}"
+        except Exception:
+            pass  # Invalid tokens are rejected by token_required; count them per address
+    return get_remote_address()
+
+
+# RATE_LIMIT_STORAGE_URI=sqlite:///rate_limits.sqlite shares counters between workers
+limiter = Limiter(
+    key_func=rate_limit_key,
+    default_limits=[rate_limit],
+    storage_uri=os.getenv('RATE_LIMIT_STORAGE_URI', 'memory://'),
+    strategy=os.getenv('RATE_LIMIT_STRATEGY', 'sliding-window-counter'),
+)
 
 # JWT token expiry in hours (default 1 hour)
 token_expiry_hours = int(os.getenv('TOKEN_EXPIRY_HOURS', '1'))
+# Claims of recently verified tokens (TOKEN_CACHE_TTL, never past a token's expiry)
+token_cache = VerifiedTokenCache.from_env()
+# Password hashing method/cost (PASSWORD_HASH_*) and its bounded worker pool
+password_hasher = PasswordHasher.from_env()
 
 # --- Simple OpenAPI Specification ---
 OPENAPI_SPEC = {
@@ -63,7 +134,10 @@ OPENAPI_SPEC = {
             "put": {"summary": "Update a bookshelf"},
             "delete": {"summary": "Delete a bookshelf"},
         },
+        "/api/bookshelves/{id}/books": {"post": {"summary": "Add a book to a bookshelf"}},
+        "/api/bookshelves/{id}/books/bulk": {"post": {"summary": "Add many books to a bookshelf"}},
         "/api/upload": {"post": {"summary": "Upload an image for analysis"}},
+        "/api/upload/async": {"post": {"summary": "Upload an image for analysis (async view; needs flask[async])"}},
         "/api/friends": {"get": {"summary": "List confirmed friends"}},
         "/api/friends/requests": {"get": {"summary": "List incoming requests"}},
         "/api/friends/outgoing": {"get": {"summary": "List outgoing requests"}},
@@ -85,40 +159,93 @@ OPENAPI_SPEC = {
             "delete": {"summary": "Delete a community"},
         },
         "/api/users/{user_id}/bookshelves": {"get": {"summary": "View a user's bookshelves"}},
-        "/api/public/bookshelves": {"get": {"summary": "List public shelves"}},
+        "/api/public/bookshelves": {"get": {
+            "summary": "List public shelves",
+            "parameters": [
+                {"name": "page", "in": "query", "schema": {"type": "integer", "minimum": 1}},
+                {"name": "per_page", "in": "query", "schema": {"type": "integer", "maximum": 100}},
+            ],
+        }},
         "/api/public/bookshelves/{id}": {
             "get": {"summary": "View a public shelf"}
         },
-        "/api/health": {"get": {"summary": "Health check"}},
+        "/api/health": {"get": {"summary": "Readiness with dependency checks"}},
+        "/metrics": {"get": {"summary": "Metrics in the Prometheus text format"}},
+        "/api/providers/stats": {"get": {"summary": "Recommendation provider statistics"}},
+        "/api/cache/stats": {"get": {"summary": "Provider response cache statistics"}},
+        "/api/llm/stats": {"get": {"summary": "Detection model concurrency statistics"}},
+        "/api/sync": {"get": {
+            "summary": "Changes to visible shelves and communities since a cursor",
+            "parameters": [
+                {"name": "since", "in": "query", "schema": {"type": "integer"}},
+                {"name": "limit", "in": "query", "schema": {"type": "integer", "maximum": 1000}},
+            ],
+        }},
         "/api/spec": {"get": {"summary": "Retrieve this OpenAPI spec"}},
     },
 }
 
-# --- Input Sanitization Helper ---
-def sanitize_input(value: str) -> str:
-    """Return a cleaned version of the user-supplied string."""
-    if value is None:
-        return None
-    return bleach.clean(value, strip=True)
-# --- End Sanitization Helper ---
-
-# Configure the Gemini API key
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    logger.error("GOOGLE_API_KEY not found in environment. Uploads will be disabled.")
-else:
-    try:
-        genai.configure(api_key=api_key)
-        logger.info("Gemini API Key configured successfully.")
-    except Exception as e:
-        logger.error(f"Error configuring Gemini API: {e}")
-        api_key = None  # Ensure api_key is None if configuration fails
+# --- Request Body Schemas ---
+# Compiled once here; the same declarations fill in OPENAPI_SPEC request bodies below
+BULK_MAX_BOOKS = int(os.getenv('BULK_MAX_BOOKS', '500'))
+
+REGISTER_SCHEMA = Schema({
+    'username': Field(required=True, min_length=3, max_length=80),
+    'email': Field(required=True, format='email', lower=True, max_length=120),
+    'password': Field(required=True, clean=False, strip=False, min_length=6, max_length=1024),
+})
+LOGIN_SCHEMA = Schema({
+    'identifier': Field(required=True, max_length=120, description='Username or email'),
+    'password': Field(required=True, clean=False, strip=False, max_length=1024),
+})
+SHELF_FIELDS = {
+    'name': Field(required=True, max_length=100),
+    'description': Field(max_length=250),
+    'is_public': Field('boolean', default=False),
+}
+SHELF_CREATE_SCHEMA = Schema(SHELF_FIELDS)
+SHELF_UPDATE_SCHEMA = Schema(SHELF_FIELDS, partial=True)
+BOOK_SCHEMA = Schema({
+    'title': Field(required=True, max_length=255),
+    'author': Field(max_length=255),
+    'isbn': Field(max_length=13),
+    'cover_image_url': Field(format='url', clean=False, max_length=255),  # Escaping "&" would break URLs
+})
+BULK_BOOKS_SCHEMA = Schema({
+    'books': Field('array', required=True, items=BOOK_SCHEMA, min_items=1, max_items=BULK_MAX_BOOKS),
+})
+COMMUNITY_FIELDS = {
+    'name': Field(required=True, max_length=120),
+    'description': Field(max_length=250),
+}
+COMMUNITY_CREATE_SCHEMA = Schema(COMMUNITY_FIELDS)
+# An empty name in an update leaves the current name unchanged
+COMMUNITY_UPDATE_SCHEMA = Schema(dict(COMMUNITY_FIELDS, name=Field(max_length=120)), partial=True)
+
+add_request_bodies(OPENAPI_SPEC, {
+    ('/api/register', 'post'): REGISTER_SCHEMA,
+    ('/api/login', 'post'): LOGIN_SCHEMA,
+    ('/api/bookshelves', 'post'): SHELF_CREATE_SCHEMA,
+    ('/api/bookshelves/{id}', 'put'): SHELF_UPDATE_SCHEMA,
+    ('/api/bookshelves/{id}/books', 'post'): BOOK_SCHEMA,
+    ('/api/bookshelves/{id}/books/bulk', 'post'): BULK_BOOKS_SCHEMA,
+    ('/api/communities', 'post'): COMMUNITY_CREATE_SCHEMA,
+    ('/api/communities/{id}', 'put'): COMMUNITY_UPDATE_SCHEMA,
+})
+
+
+def parse_body(schema):
+    """Return the request's JSON body validated by ``schema``; raises ``ValidationError``."""
+    return schema.validate(request.get_json(silent=True))
+# --- End Request Body Schemas ---
+
 
 # Create upload folder if it doesn't exist
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app = Flask(__name__, static_folder='../frontend/dist', static_url_path='/')
+app.json = create_json_provider(app)  # orjson when installed; datetimes serialize as ISO 8601
 # --- Add JWT Secret Key Configuration ---
 # IMPORTANT: Use a strong, secret key and keep it out of version control (e.g., in .env)
 secret_key = os.getenv('SECRET_KEY')
@@ -138,6 +265,8 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit uploads to 16MB
 
 # Initialize SQLAlchemy database extension
 db = SQLAlchemy(app)
+# Registered before the limiter so rate-limited requests are timed too
+request_metrics = RequestMetrics(app)
 limiter.init_app(app)
 
 # --- Error Handlers ---
@@ -162,6 +291,22 @@ def handle_rate_limit(e):
     return jsonify({"error": "Too many requests"}), 429
 
 
+@app.errorhandler(ValidationError)
+def handle_validation_error(e):
+    """Return every problem with a request body in one uniform 400 response."""
+    logger.info(f"Invalid request body for {request.method} {request.path}: {e}")
+    return jsonify(e.to_dict()), 400
+
+
+@app.errorhandler(HasherBusy)
+def handle_hasher_busy(e):
+    """Return 503 when every password hashing worker and queue slot is taken."""
+    logger.warning(f"Password hashing busy: {request.path}")
+    response = jsonify({"error": "Server is busy. Please retry later."})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
 @app.errorhandler(500)
 def handle_500(e):
     """Return JSON response for internal server errors."""
@@ -169,16 +314,52 @@ def handle_500(e):
     return jsonify({"error": "Internal server error"}), 500
 # --- End Error Handlers ---
 
-# Initialize the specific Gemini model we want to use
-llm_model = None
-if api_key:
-    try:
-        # Using gemini-1.5-flash as it's fast and suitable for this kind of task
-        llm_model = genai.GenerativeModel('gemini-1.5-flash')
-        logger.info("Gemini model (gemini-1.5-flash) loaded successfully.")
-    except Exception as e:
-        logger.error(f"Error initializing Gemini model: {e}")
-        llm_model = None # Ensure model is None if init fails
+# Identical images uploaded concurrently share one detection call
+detection_flight = SingleFlight()
+
+# Bound concurrent model calls; safety blocks are content problems, not overload
+llm_executor = AdaptiveLLMExecutor.from_env(
+    is_overload_error=lambda e: not isinstance(
+        e, (gemini_error('BlockedPromptException'), gemini_error('StopCandidateException'))))
+
+# Wide panoramas and very large images are detected as overlapping tiles
+tiling_config = TilingConfig.from_env()
+tile_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DETECTION_TILE_WORKERS', '8')),
+                                   thread_name_prefix='detect-tile')
+
+# Initialize the detection backend selected by DETECTION_BACKEND (Gemini by default,
+# or the offline local stand-in). llm_model stays None when the backend is unavailable.
+# The Gemini client itself is created on the first upload unless create_app warms it.
+detection_backend = create_detection_backend()
+llm_model = detection_backend if detection_backend.available else None
+
+# 'json' asks the model for streamed structured output (title, author, confidence)
+detection_output = os.getenv('DETECTION_OUTPUT', 'text').lower()
+detection_min_confidence = float(os.getenv('DETECTION_MIN_CONFIDENCE', '0'))
+MAX_SEARCH_TERMS = 5  # Detected books used as recommendation queries
+
+DETECTION_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+# Serialized public shelf responses, invalidated by version bumps on commit
+public_cache = VersionedResponseCache.from_env()
+
+# gzip/brotli for JSON and MessagePack bodies above COMPRESS_MIN_BYTES
+compression_config = CompressionConfig.from_env()
+
+# Upload phase timings on /metrics (provider calls and stages are timed in backend/providers.py)
+detection_seconds = metrics_registry.histogram(
+    'bookshelf_detection_duration_seconds', 'Time to detect the books in an uploaded image, by upload path',
+    ('path',))
+recommendation_seconds = metrics_registry.histogram(
+    'bookshelf_recommendation_duration_seconds', 'Time to collect recommendations for an upload, by upload path',
+    ('path',))
+commit_seconds = metrics_registry.histogram(
+    'bookshelf_db_commit_duration_seconds', 'Time to flush and commit a database session')
 
 # === Database Models === 
 
@@ -201,12 +382,12 @@ class User(db.Model):
     bookshelves = db.relationship('Bookshelf', backref='owner', lazy=True)
 
     def set_password(self, password):
-        """Create hashed password using pbkdf2:sha256 method."""
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        """Hash the password with the configured method on the hashing pool."""
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        """Check hashed password."""
-        return check_password_hash(self.password_hash, password)
+        """Check hashed password (any supported method) on the hashing pool."""
+        return password_hasher.verify(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -221,6 +402,8 @@ class Bookshelf(db.Model):
     is_public = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+    # Incremented whenever the shelf, its books or its memberships change (used for ETags)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Relationship to Book (many-to-many)
     books = db.relationship('Book', secondary=shelf_books,
@@ -237,6 +420,8 @@ class Book(db.Model):
     __tablename__ = 'book'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
+    # Comparison key (see backend/title_matching.py), kept in sync with title
+    normalized_title = db.Column(db.String(255), nullable=True, index=True)
     # Storing authors as a simple comma-separated string for now
     # A separate Author table might be better for complex querying later
     authors = db.Column(db.String(255), nullable=True) 
@@ -247,9 +432,29 @@ class Book(db.Model):
     
     # Note: The relationship back to Bookshelf is defined via the backref in Bookshelf.books
 
+    @validates('title')
+    def _update_normalized_title(self, key, value):
+        self.normalized_title = normalize_title(value)
+        return value
+
     def __repr__(self):
         return f'<Book {self.title}>'
 
+# MinHash band and main-title keys of each book's title (TitleIndex.match_keys), kept
+# in sync on flush, so dedupe finds candidate matches through an index
+book_match_keys = db.Table('book_match_keys',
+    db.Column('book_id', db.Integer, db.ForeignKey('book.id'), primary_key=True),
+    db.Column('match_key', db.BigInteger, primary_key=True, index=True)
+)
+
+_title_keys = TitleIndex()  # Only computes keys; its band layout must match the stored keys
+
+
+def book_match_key_rows(book_id, title, key=None):
+    """Return the ``book_match_keys`` rows for a book's title."""
+    return [{'book_id': book_id, 'match_key': match_key}
+            for match_key in set(_title_keys.match_keys(title, key))]
+
 # Friend request relationship between users
 class FriendRequest(db.Model):
     """Represents a friendship invitation between two users."""
@@ -263,6 +468,194 @@ class FriendRequest(db.Model):
     def __repr__(self):
         return f'<FriendRequest from {self.requester_id} to {self.addressee_id}>'
 
+# --- Change Tracking ---
+def _bump_shelf_versions(session):
+    """Advance version and updated_at of shelves whose fields or books change.
+
+    Adding or removing a book only writes the association table, so the
+    shelf row is updated here to keep its validators meaningful.
+    """
+    shelves = set()
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Bookshelf):
+                if obj not in session.new and obj not in session.deleted and session.is_modified(obj):
+                    shelves.add(obj)
+            elif isinstance(obj, Book):
+                shelves.update(obj.bookshelves)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # Stored as naive UTC like CURRENT_TIMESTAMP
+    for shelf in shelves:
+        if shelf.id is not None and shelf not in session.deleted:
+            shelf.version = (shelf.version or 0) + 1
+            shelf.updated_at = now
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_flushed_shelf_versions(session, flush_context, instances):
+    _bump_shelf_versions(session)
+
+
+def _shelf_snapshot(shelf):
+    return {
+        'id': shelf.id,
+        'name': shelf.name,
+        'description': shelf.description,
+        'is_public': shelf.is_public,
+        'user_id': shelf.user_id,
+        'version': shelf.version,
+    }
+
+
+def _book_snapshot(book):
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.authors,
+        'isbn': book.isbn,
+        'cover_image_url': book.cover_image_url,
+    }
+
+
+def _community_snapshot(community):
+    return {
+        'id': community.id,
+        'name': community.name,
+        'description': community.description,
+        'owner_id': community.owner_id,
+    }
+
+
+def _change_log_rows(session):
+    """Describe the flushed shelf, book, membership and community changes as change-log rows.
+
+    Runs after the flush, while new/dirty/deleted and attribute history still
+    show what was written, so new rows already have their ids.
+    """
+    rows = []
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def record(entity, entity_id, action, user_id=None, shelf_id=None, community_id=None, data=None):
+        rows.append({
+            'entity': entity, 'entity_id': entity_id, 'action': action, 'user_id': user_id,
+            'shelf_id': shelf_id, 'community_id': community_id, 'created_at': now,
+            'payload': json.dumps(data) if data is not None else None,
+        })
+
+    with session.no_autoflush:
+        for obj in session.deleted:
+            if isinstance(obj, Bookshelf):
+                record('shelf', obj.id, 'deleted', obj.user_id, obj.id)
+            elif isinstance(obj, Book):
+                for shelf in obj.bookshelves:  # Loaded by _bump_shelf_versions before the flush
+                    record('membership', obj.id, 'removed', shelf.user_id, shelf.id)
+            elif isinstance(obj, Community):
+                record('community', obj.id, 'deleted', community_id=obj.id)
+
+        for obj in list(session.new) + list(session.dirty):
+            if obj in session.deleted:
+                continue
+            if isinstance(obj, Bookshelf):
+                if obj in session.new:
+                    record('shelf', obj.id, 'created', obj.user_id, obj.id, data=_shelf_snapshot(obj))
+                elif session.is_modified(obj):
+                    record('shelf', obj.id, 'updated', obj.user_id, obj.id, data=_shelf_snapshot(obj))
+                books = db.inspect(obj).attrs.books.history
+                for book in books.added:
+                    record('membership', book.id, 'added', obj.user_id, obj.id, data=_book_snapshot(book))
+                for book in books.deleted:
+                    record('membership', book.id, 'removed', obj.user_id, obj.id)
+            elif isinstance(obj, Book) and obj not in session.new \
+                    and session.is_modified(obj, include_collections=False):
+                for shelf in obj.bookshelves:
+                    record('book', obj.id, 'updated', shelf.user_id, shelf.id, data=_book_snapshot(obj))
+            elif isinstance(obj, Community):
+                if obj in session.new:
+                    record('community', obj.id, 'created', community_id=obj.id, data=_community_snapshot(obj))
+                elif session.is_modified(obj, include_collections=False):
+                    record('community', obj.id, 'updated', community_id=obj.id, data=_community_snapshot(obj))
+                members = db.inspect(obj).attrs.members.history
+                for user in members.added:
+                    record('community_member', user.id, 'added', user.id, community_id=obj.id,
+                           data={'id': user.id, 'username': user.username})
+                for user in members.deleted:
+                    record('community_member', user.id, 'removed', user.id, community_id=obj.id)
+    return rows
+
+
+@event.listens_for(db.session, 'after_flush')
+def _write_change_log(session, flush_context):
+    rows = _change_log_rows(session)
+    if rows:
+        # Core insert: same transaction as the change, without another ORM flush
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _write_match_keys(session, flush_context):
+    stale, rows = [], []
+    for obj in session.new:
+        if isinstance(obj, Book):
+            rows.extend(book_match_key_rows(obj.id, obj.title, obj.normalized_title))
+    for obj in session.dirty:
+        if isinstance(obj, Book) and db.inspect(obj).attrs.title.history.has_changes():
+            stale.append(obj.id)
+            rows.extend(book_match_key_rows(obj.id, obj.title, obj.normalized_title))
+    stale.extend(obj.id for obj in session.deleted if isinstance(obj, Book))
+    conn = session.connection()
+    if stale:
+        conn.execute(book_match_keys.delete().where(book_match_keys.c.book_id.in_(stale)))
+    if rows:
+        conn.execute(book_match_keys.insert(), rows)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_commit_timer(session):
+    session.info.pop('commit_started', None)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _observe_commit_time(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        commit_seconds.observe(time.perf_counter() - started)
+# --- End Change Tracking ---
+
+
+def upgrade_schema():
+    """Add columns introduced after a database was first created.
+
+    ``db.create_all`` only creates missing tables, so existing SQLite files
+    are altered here (and new columns backfilled) before serving.
+    """
+    columns = {c['name'] for c in db.inspect(db.engine).get_columns('book')}
+    if 'normalized_title' not in columns:
+        logger.info("Adding book.normalized_title column and index.")
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE book ADD COLUMN normalized_title VARCHAR(255)'))
+            conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_book_normalized_title ON book (normalized_title)'))
+            rows = conn.execute(db.text('SELECT id, title FROM book')).fetchall()
+            if rows:
+                conn.execute(db.text('UPDATE book SET normalized_title = :key WHERE id = :id'),
+                             [{'id': row.id, 'key': normalize_title(row.title)} for row in rows])
+    columns = {c['name'] for c in db.inspect(db.engine).get_columns('bookshelf')}
+    if 'version' not in columns:
+        logger.info("Adding bookshelf.version column.")
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE bookshelf ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+    with db.engine.begin() as conn:
+        rows = conn.execute(db.text(
+            'SELECT id, title, normalized_title FROM book '
+            'WHERE id NOT IN (SELECT book_id FROM book_match_keys)')).fetchall()
+        keys = [key for row in rows for key in book_match_key_rows(row.id, row.title, row.normalized_title)]
+        if keys:
+            logger.info(f"Backfilling title match keys for {len(rows)} books.")
+            conn.execute(book_match_keys.insert(), keys)
+
 # Association table between users and communities
 community_members = db.Table(
     'community_members',
@@ -281,6 +674,111 @@ class Community(db.Model):
     owner = db.relationship('User', backref='owned_communities')
     members = db.relationship('User', secondary=community_members, backref='communities')
 
+class ChangeLog(db.Model):
+    """Append-only record of shelf, book, membership and community changes.
+
+    The row id is the sync cursor; rows are written by the session hooks
+    above in the same transaction as the change they describe.
+    """
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse cursors, even after pruning
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # shelf, book, membership, community, community_member
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # created, updated, deleted, added, removed
+    user_id = db.Column(db.Integer, nullable=True, index=True)  # Shelf owner or community member
+    shelf_id = db.Column(db.Integer, nullable=True)
+    community_id = db.Column(db.Integer, nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON snapshot for created/updated/added
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'cursor': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'user_id': self.user_id,
+            'shelf_id': self.shelf_id,
+            'community_id': self.community_id,
+            'data': json.loads(self.payload) if self.payload else None,
+            'at': self.created_at.isoformat(),
+        }
+
+
+def prune_change_log(retention_days=None):
+    """Delete change-log rows older than ``CHANGE_LOG_RETENTION_DAYS`` (default 30)."""
+    if retention_days is None:
+        retention_days = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '30'))
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=retention_days)
+    deleted = ChangeLog.query.filter(ChangeLog.created_at < cutoff).delete()
+    db.session.commit()
+    if deleted:
+        logger.info(f"Pruned {deleted} change-log rows older than {retention_days} days.")
+    return deleted
+
+
+def init_database():
+    """Create tables, apply ``upgrade_schema`` and prune the change log.
+
+    Run once per deployment before serving (``backend/serve.py`` does this
+    in a separate process before starting workers), not in every worker.
+    """
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # Persistent per file; lets several worker processes read while one writes
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+        # Note: For more complex migrations later, consider Flask-Migrate
+        db.create_all()
+        upgrade_schema()
+        prune_change_log()
+        db.engine.dispose()
+    logger.info(f"Database {DB_NAME} initialized/checked.")
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema."""
+    init_database()
+
+
+def warm_up():
+    """Create the clients that are otherwise created on first use: the Gemini
+    model (``google.generativeai`` is not imported until then), the
+    recommendation pipeline and the provider HTTP clients."""
+    if isinstance(detection_backend, GeminiBackend):
+        detection_backend.load()
+    get_recommendation_pipeline()
+    preload_http_clients()
+
+
+def create_app(warm=None):
+    """Return the application, ready to serve.
+
+    Routes, models and extensions are registered on the module-level ``app``
+    when this module is imported; importing it does not configure logging or
+    create the detection model, the recommendation pipeline (its thread pools
+    and response cache) or the provider HTTP clients. This sets up logging,
+    builds the pipeline and, with ``warm=True`` (default from
+    ``LAZY_INIT=false``), creates the clients now instead of on the first upload.
+    """
+    configure_logging()
+    if warm is None:
+        warm = os.getenv('LAZY_INIT', 'true').lower() == 'false'
+    get_recommendation_pipeline()
+    if warm:
+        warm_up()
+    return app
+
+
+def shutdown_executors():
+    """Stop background pools so a worker exits promptly on shutdown."""
+    password_hasher.shutdown()
+    tile_executor.shutdown(wait=False, cancel_futures=True)
+    if recommendation_pipeline is not None:
+        recommendation_pipeline.shutdown()
+
 # === API Endpoints ===
 
 @app.route('/api/hello')
@@ -290,9 +788,75 @@ def hello_world():
 
 
 @app.route('/api/health')
+@limiter.exempt  # Polled by load balancers and orchestrators
 def health_check():
-    """Return a basic status message for monitoring."""
-    return jsonify({'status': 'ok'}), 200
+    """Report readiness with dependency checks.
+
+    ``status`` is ``ok`` (200) while the database answers and ``unavailable``
+    (503) when it does not. Dependencies the app can serve without are
+    listed in ``degraded``: the detection model, book providers whose
+    circuit is open and a full detection queue.
+    """
+    checks = {}
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception as e:
+        logger.error(f"Health check: database unavailable: {e}")
+        checks['database'] = 'unavailable'
+    checks['detection'] = 'ok' if llm_model else 'unavailable'
+    open_providers = [p.name for p in get_recommendation_pipeline().providers if p.breaker.state == 'open']
+    checks['providers'] = f"circuit open: {', '.join(open_providers)}" if open_providers else 'ok'
+    llm = llm_executor.stats()
+    checks['detection_queue'] = 'full' if llm['waiting'] >= llm_executor.max_queue else 'ok'
+
+    ready = checks['database'] == 'ok'
+    return jsonify({
+        'status': 'ok' if ready else 'unavailable',
+        'checks': checks,
+        'degraded': [name for name, result in checks.items() if result != 'ok' and name != 'database'],
+    }), 200 if ready else 503
+
+
+@app.route('/metrics')
+@limiter.exempt  # Scraped every few seconds
+def metrics():
+    """Return request, upload phase, cache and queue metrics in the Prometheus text format."""
+    return app.response_class(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@metrics_registry.add_collector
+def _component_metrics():
+    """Read the counters components keep anyway (see the /api/*/stats endpoints) at scrape time."""
+    pipeline = get_recommendation_pipeline()
+    provider_cache = pipeline.cache.stats() if pipeline.cache else None
+    caches = {'public': public_cache.stats(), 'tokens': token_cache.stats(), 'sanitize': sanitize_cache_stats()}
+    if provider_cache is not None:
+        caches['provider'] = dict(provider_cache, hits=provider_cache['memory_hits']
+                                  + provider_cache['disk_hits'] + provider_cache['stale_hits'])
+    llm = llm_executor.stats()
+    flight = detection_flight.stats()
+    return [
+        ('bookshelf_cache_hits_total', 'counter', 'Cache lookups answered from the cache',
+         [({'cache': name}, stats['hits']) for name, stats in caches.items()]),
+        ('bookshelf_cache_misses_total', 'counter', 'Cache lookups that missed',
+         [({'cache': name}, stats['misses']) for name, stats in caches.items()]),
+        ('bookshelf_cache_hit_ratio', 'gauge', 'Hits per lookup since the process started',
+         [({'cache': name}, stats['hit_ratio']) for name, stats in caches.items()]),
+        ('bookshelf_llm_in_flight', 'gauge', 'Detection model calls running', [({}, llm['in_flight'])]),
+        ('bookshelf_llm_waiting', 'gauge', 'Detection model calls queued for a slot', [({}, llm['waiting'])]),
+        ('bookshelf_llm_limit', 'gauge', 'Current adaptive limit on concurrent model calls',
+         [({}, llm['limit'])]),
+        ('bookshelf_llm_calls_total', 'counter', 'Detection model calls by outcome',
+         [({'outcome': 'success'}, llm['successes']), ({'outcome': 'error'}, llm['errors']),
+          ({'outcome': 'rejected'}, llm['rejected']), ({'outcome': 'timeout'}, llm['timeouts'])]),
+        ('bookshelf_detections_in_flight', 'gauge', 'Distinct images being detected (coalesced uploads share one)',
+         [({}, flight['in_flight'])]),
+        ('bookshelf_detections_shared_total', 'counter', 'Uploads that joined a detection already in flight',
+         [({}, flight['shared'])]),
+        ('bookshelf_provider_circuit_open', 'gauge', '1 while a provider\'s circuit breaker is open',
+         [({'provider': p.name}, int(p.breaker.state == 'open')) for p in get_recommendation_pipeline().providers]),
+    ]
 
 
 @app.route('/api/spec')
@@ -300,40 +864,110 @@ def openapi_spec():
     """Return a machine-readable OpenAPI specification."""
     return jsonify(OPENAPI_SPEC), 200
 
+
+@app.route('/api/providers/stats')
+def provider_stats():
+    """Return recommendation provider health, latency and hedging counters."""
+    return jsonify(get_recommendation_pipeline().stats()), 200
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Return hit/miss and eviction counters for the provider response cache,
+    the public shelf response cache (``public``), verified tokens (``tokens``)
+    and sanitized markup (``sanitize``)."""
+    stats = get_recommendation_pipeline().cache.stats()
+    stats['public'] = public_cache.stats()
+    stats['tokens'] = token_cache.stats()
+    stats['sanitize'] = sanitize_cache_stats()
+    return jsonify(stats), 200
+
+
+@app.route('/api/llm/stats')
+def llm_stats():
+    """Return the detection model concurrency limit and queue counters."""
+    return jsonify(llm_executor.stats()), 200
+
 # --- JWT Token Required Decorator ---
+class RequestGlobals(_AppCtxGlobals):
+    """``g`` with a ``user`` property loading the token's user on first access.
+
+    The user is loaded at most once per ``g.user_id``; ``None`` if it no longer exists.
+    """
+
+    @property
+    def user(self):
+        user_id = self.__dict__.get('user_id')
+        cached = self.__dict__.get('_user')
+        if cached is None or cached[0] != user_id:
+            cached = (user_id, db.session.get(User, user_id) if user_id is not None else None)
+            self.__dict__['_user'] = cached
+        return cached[1]
+
+
+app.app_ctx_globals_class = RequestGlobals
+
+
+def _decode_token(token):
+    """Return the claims of a valid token, from the verified-token cache when possible."""
+    secret = app.config['SECRET_KEY']
+    data = token_cache.get(token, secret)
+    if data is None:
+        data = jwt.decode(token, secret, algorithms=["HS256"])
+        token_cache.set(token, secret, data)
+    return data
+
+
 def token_required(f):
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async(*args, **kwargs):
+            error = _authenticate()
+            if error is not None:
+                return error
+            return await f(*args, **kwargs)
+        return decorated_async
+
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        # Check if 'Authorization' header exists and has the Bearer token
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                # Split 'Bearer <token>'
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({"error": "Bearer token malformed"}), 401
+        error = _authenticate()
+        if error is not None:
+            return error
+        return f(*args, **kwargs)
+    return decorated
 
-        if not token:
-            return jsonify({"error": "Token is missing"}), 401
 
+def _authenticate():
+    """Verify the request's bearer token and set ``g.user_id``; returns an error response or None."""
+    token = None
+    # Check if 'Authorization' header exists and has the Bearer token
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
         try:
-            # Decode the token using the secret key
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            # Store the user ID in Flask's g object for access within the route
-            g.user_id = data['user_id']
-            logger.info(f"Token verified for user_id: {g.user_id}")
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Token is invalid"}), 401
-        except Exception as e:
-             logger.error(f"Token verification failed: {e}")
-             return jsonify({"error": "Token verification failed"}), 401
+            # Split 'Bearer <token>'
+            token = auth_header.split(" ")[1]
+        except IndexError:
+            return jsonify({"error": "Bearer token malformed"}), 401
 
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    try:
+        # Decode the token using the secret key
+        data = _decode_token(token)
+        # Store the user ID in Flask's g object for access within the route
+        g.user_id = data['user_id']
+        logger.debug(f"Token verified for user_id: {g.user_id}")
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Token is invalid"}), 401
+    except Exception as e:
+         logger.error(f"Token verification failed: {e}")
+         return jsonify({"error": "Token verification failed"}), 401
+
+    return None
 
-        return f(*args, **kwargs)
-    return decorated
 
 @app.route('/api/upload', methods=['POST'])
 @token_required # Protect this route
@@ -345,158 +979,234 @@ def upload_file():
     user_id = g.user_id # Get user ID from token
     
     # Check if LLM is configured and available
-    if not api_key or not llm_model:
+    if not llm_model:
          logger.error("Upload attempt failed: LLM service is not available.")
          return jsonify({'error': 'Image analysis service is not available.'}), 503
 
+    file, error = _received_image(user_id)
+    if error:
+        return error
+
+    filepath = None
+    try:
+        # --- Save and Process Image --- 
+        filepath = _save_upload(file, user_id)
+
+        # Start provider searches for the first books while detection still streams
+        prefetched = TitleIndex.from_env()
+        prefetch_lock = threading.Lock()  # Tiles report books from several threads
+        def prefetch(book):
+            with prefetch_lock:
+                if len(prefetched) >= MAX_SEARCH_TERMS or not prefetched.add_if_new(book['title']):
+                    return
+            get_recommendation_pipeline().prefetch(_search_term(book))
+
+        detections = detect_books_detailed(filepath, on_book=prefetch)
+        recommendations = get_recommendations(detections)
+        save_message = _save_upload_results(user_id, detections, recommendations)
+    except LLMOverloaded as e:
+        return _busy_response(e, user_id)
+    except Exception as e:
+        return _upload_error_response(e, user_id)
+    finally:
+        # Ensure the temporary file is always cleaned up
+        _remove_upload(filepath, user_id)
+    return _upload_response(detections, recommendations, save_message)
+
+
+@token_required
+async def upload_file_async():
+    """
+    Same as upload_file, but detection and provider searches are awaited on
+    an event loop instead of each holding a thread (see get_recommendations_async).
+    Served at /api/upload/async when Flask's async extra (asgiref) is installed.
+    """
+    user_id = g.user_id
+
+    if not llm_model:
+         logger.error("Upload attempt failed: LLM service is not available.")
+         return jsonify({'error': 'Image analysis service is not available.'}), 503
+
+    file, error = _received_image(user_id)
+    if error:
+        return error
+
+    filepath = None
+    prefetch_tasks = []
+    try:
+        filepath = _save_upload(file, user_id)
+
+        # Start provider searches for the first books while detection still streams
+        prefetched = TitleIndex.from_env()
+        def prefetch(book):
+            if len(prefetched) >= MAX_SEARCH_TERMS or not prefetched.add_if_new(book['title']):
+                return
+            prefetch_tasks.extend(get_recommendation_pipeline().prefetch_async(_search_term(book)))
+
+        # One HTTP client for this upload's provider searches, closed before the request's loop is
+        async with async_http_scope():
+            detections = await detect_books_detailed_async(filepath, on_book=prefetch)
+            recommendations = await get_recommendations_async(detections)
+            # Normally finished already (the recommendations joined them); they must not outlive the client
+            await asyncio.gather(*prefetch_tasks, return_exceptions=True)
+        save_message = _save_upload_results(user_id, detections, recommendations)
+    except LLMOverloaded as e:
+        return _busy_response(e, user_id)
+    except Exception as e:
+        return _upload_error_response(e, user_id)
+    finally:
+        _remove_upload(filepath, user_id)
+    return _upload_response(detections, recommendations, save_message)
+
+
+if asgiref is not None:  # Flask runs async views through asgiref (pip install "flask[async]")
+    app.add_url_rule('/api/upload/async', view_func=upload_file_async, methods=['POST'])
+
+
+def _received_image(user_id):
+    """Return ``(file, None)`` for a valid image upload, or ``(None, error response)``."""
     # --- File Handling --- 
     if 'bookshelfImage' not in request.files:
         logger.warning(f"User {user_id}: Upload failed - No file part.")
-        return jsonify({'error': 'No file part in request'}), 400
+        return None, (jsonify({'error': 'No file part in request'}), 400)
     file = request.files['bookshelfImage']
     if file.filename == '':
         logger.warning(f"User {user_id}: Upload failed - No selected file.")
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
     if not file.mimetype.startswith('image/'):
         logger.warning(f"User {user_id}: Upload failed - Not an image file.")
-        return jsonify({'error': 'Uploaded file is not an image.'}), 400
+        return None, (jsonify({'error': 'Uploaded file is not an image.'}), 400)
+    return file, None
 
-    filepath = None
-    detected_books = []
-    recommendations = []
-    save_message = "" # Message about saving status
 
-    try:
-        # --- Save and Process Image --- 
-        filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        logger.info(f"User {user_id}: File saved temporarily to: {filepath}")
-
-        detected_books = detect_books_with_llm(filepath)
-        recommendations = get_recommendations(detected_books)
-
-        # --- Save Results to Database --- 
-        if detected_books or recommendations: # Only proceed if there's something to save
-            # Find/Create Target Bookshelves
-            detected_shelf_name = "Detected from Upload"
-            recs_shelf_name = "Recommendations from Upload"
-            
-            # Find user's first shelf OR the specific detected shelf
-            detected_shelf = Bookshelf.query.filter_by(user_id=user_id, name=detected_shelf_name).first()
-            if not detected_shelf:
-                # Fallback to first shelf if specific one doesn't exist
-                detected_shelf = Bookshelf.query.filter_by(user_id=user_id).order_by(Bookshelf.created_at).first()
-            if not detected_shelf:
-                 # If still no shelf, create the default "Detected" one
-                 logger.info(f"User {user_id}: No existing shelf found for detected books. Creating '{detected_shelf_name}'.")
-                 detected_shelf = Bookshelf(name=detected_shelf_name, user_id=user_id, description="Books automatically added from image uploads.")
-                 db.session.add(detected_shelf)
-                 db.session.flush() # Ensure shelf gets an ID if needed immediately
-                 
-            # Find or create the recommendations shelf
-            recs_shelf = Bookshelf.query.filter_by(user_id=user_id, name=recs_shelf_name).first()
-            if not recs_shelf:
-                logger.info(f"User {user_id}: Creating '{recs_shelf_name}' shelf.")
-                recs_shelf = Bookshelf(name=recs_shelf_name, user_id=user_id, description="Book recommendations generated from uploads.")
-                db.session.add(recs_shelf)
-                db.session.flush()
-
-            # Add Detected Books
-            added_detected_count = 0
-            valid_detected_titles = [t for t in detected_books if t and not t.lower().startswith("error")] # Filter out errors
-            if detected_shelf and valid_detected_titles:
-                existing_titles_detected = {b.title.lower() for b in detected_shelf.books}
-                for title in valid_detected_titles:
-                    if title.lower() not in existing_titles_detected:
-                        new_book = Book(title=title, authors=None, isbn=None) # Basic info for detected
-                        # Add book to the shelf's collection
-                        detected_shelf.books.append(new_book) 
-                        # No need to add book to session separately if using relationship append
-                        existing_titles_detected.add(title.lower())
-                        added_detected_count += 1
-            logger.info(f"User {user_id}: Added {added_detected_count} new detected books to shelf '{detected_shelf.name}'.")
-            
-            # Add Recommendations
-            added_recs_count = 0
-            if recs_shelf and recommendations:
-                existing_titles_recs = {b.title.lower() for b in recs_shelf.books}
-                for rec in recommendations:
-                    rec_title = rec.get('title', 'Unknown Title')
-                    if rec_title != 'Unknown Title' and rec_title.lower() not in existing_titles_recs:
-                         # Extract authors correctly (it's a list in the recommendation data)
-                         authors_list = rec.get('authors', [])
-                         authors_str = ", ".join(authors_list) if authors_list else None
-                         
-                         new_rec_book = Book(
-                             title=rec_title,
-                             authors=authors_str,
-                             isbn=None,
-                             # Consider storing more fields like cover_image_url, isbn if the Book model supports them
-                             # isbn=rec.get('isbn'), 
-                             # cover_image_url=rec.get('image')
-                         )
-                         recs_shelf.books.append(new_rec_book)
-                         existing_titles_recs.add(rec_title.lower())
-                         added_recs_count += 1
-            logger.info(f"User {user_id}: Added {added_recs_count} new recommended books to shelf '{recs_shelf.name}'.")
-            
-            if added_detected_count > 0 or added_recs_count > 0:
-                 db.session.commit() # Commit all additions
-                 save_message = f"Added {added_detected_count} detected and {added_recs_count} recommended books to your shelves."
-            else:
-                 save_message = "No new books needed to be added to your shelves."
-                 # No db.session.commit() needed if nothing was added
+def _save_upload(file, user_id):
+    """Save the uploaded image under a random name and return its path."""
+    filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(filepath)
+    logger.info(f"User {user_id}: File saved temporarily to: {filepath}")
+    return filepath
+
+
+def _remove_upload(filepath, user_id):
+    if filepath and os.path.exists(filepath):
+        try:
+            os.remove(filepath)
+            logger.info(f"User {user_id}: Cleaned up temporary file: {filepath}")
+        except OSError as rm_err:
+            logger.error(f"User {user_id}: Error removing temporary file: {rm_err}")
+
+
+def _save_upload_results(user_id, detections, recommendations):
+    """Add new detected and recommended books to the user's shelves; returns the save message."""
+    detected_books = [d['title'] for d in detections]
+    authors_by_title = {d['title'].lower(): d['author'] for d in detections if d.get('author')}
+
+    if detected_books or recommendations: # Only proceed if there's something to save
+        # Find/Create Target Bookshelves
+        detected_shelf_name = "Detected from Upload"
+        recs_shelf_name = "Recommendations from Upload"
+        
+        # Find user's first shelf OR the specific detected shelf
+        detected_shelf = Bookshelf.query.filter_by(user_id=user_id, name=detected_shelf_name).first()
+        if not detected_shelf:
+            # Fallback to first shelf if specific one doesn't exist
+            detected_shelf = Bookshelf.query.filter_by(user_id=user_id).order_by(Bookshelf.created_at).first()
+        if not detected_shelf:
+             # If still no shelf, create the default "Detected" one
+             logger.info(f"User {user_id}: No existing shelf found for detected books. Creating '{detected_shelf_name}'.")
+             detected_shelf = Bookshelf(name=detected_shelf_name, user_id=user_id, description="Books automatically added from image uploads.")
+             db.session.add(detected_shelf)
+             db.session.flush() # Ensure shelf gets an ID if needed immediately
+             
+        # Find or create the recommendations shelf
+        recs_shelf = Bookshelf.query.filter_by(user_id=user_id, name=recs_shelf_name).first()
+        if not recs_shelf:
+            logger.info(f"User {user_id}: Creating '{recs_shelf_name}' shelf.")
+            recs_shelf = Bookshelf(name=recs_shelf_name, user_id=user_id, description="Book recommendations generated from uploads.")
+            db.session.add(recs_shelf)
+            db.session.flush()
+
+        # Add Detected Books
+        added_detected_count = 0
+        valid_detected_titles = [t for t in detected_books if t and not t.lower().startswith("error")] # Filter out errors
+        if detected_shelf and valid_detected_titles:
+            # Model output; almost always skips the HTML parser
+            sanitized_titles = [sanitize_input(title) for title in valid_detected_titles]
+            existing_titles_detected = _shelf_title_index(detected_shelf, sanitized_titles)
+            for raw_title, title in zip(valid_detected_titles, sanitized_titles):
+                author = authors_by_title.get(raw_title.lower())
+                # Fuzzy match, so "Hobbit, The" does not duplicate "The Hobbit"
+                if existing_titles_detected.add_if_new(title):
+                    new_book = Book(title=title, authors=sanitize_input(author), isbn=None) # Basic info for detected
+                    # Add book to the shelf's collection
+                    detected_shelf.books.append(new_book) 
+                    # No need to add book to session separately if using relationship append
+                    added_detected_count += 1
+        logger.info(f"User {user_id}: Added {added_detected_count} new detected books to shelf '{detected_shelf.name}'.")
+        
+        # Add Recommendations
+        added_recs_count = 0
+        if recs_shelf and recommendations:
+            rec_titles = [sanitize_input(rec.get('title', 'Unknown Title')) for rec in recommendations]
+            existing_titles_recs = _shelf_title_index(recs_shelf, rec_titles)
+            for rec, rec_title in zip(recommendations, rec_titles):
+                if rec_title != 'Unknown Title' and existing_titles_recs.add_if_new(rec_title):
+                     # Extract authors correctly (it's a list in the recommendation data)
+                     authors_list = rec.get('authors', [])
+                     authors_str = sanitize_input(", ".join(authors_list)) if authors_list else None
+                     
+                     new_rec_book = Book(
+                         title=rec_title,
+                         authors=authors_str,
+                         isbn=None,
+                         # Consider storing more fields like cover_image_url, isbn if the Book model supports them
+                         # isbn=rec.get('isbn'), 
+                         # cover_image_url=rec.get('image')
+                     )
+                     recs_shelf.books.append(new_rec_book)
+                     added_recs_count += 1
+        logger.info(f"User {user_id}: Added {added_recs_count} new recommended books to shelf '{recs_shelf.name}'.")
+        
+        if added_detected_count > 0 or added_recs_count > 0:
+             db.session.commit() # Commit all additions
+             save_message = f"Added {added_detected_count} detected and {added_recs_count} recommended books to your shelves."
         else:
-            save_message = "No books detected or recommended to save."
+             save_message = "No new books needed to be added to your shelves."
+             # No db.session.commit() needed if nothing was added
+    else:
+        save_message = "No books detected or recommended to save."
+    return save_message
 
-    except Exception as e:
-        db.session.rollback() # Rollback any potential partial adds on error
-        logger.error(f"User {user_id}: Error during upload processing or saving: {e}", exc_info=True)
-        # Ensure cleanup even if processing fails
-        if filepath and os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                logger.info(f"User {user_id}: Cleaned up temporary file (on error): {filepath}")
-            except OSError as rm_err:
-                logger.error(f"User {user_id}: Error removing file during exception handling: {rm_err}")
-        return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
-    finally:
-        # Ensure the temporary file is always cleaned up
-        if filepath and os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                logger.info(f"User {user_id}: Cleaned up temporary file (in finally): {filepath}")
-            except OSError as rm_err:
-                logger.error(f"User {user_id}: Error removing file in finally block: {rm_err}")
 
+def _upload_response(detections, recommendations, save_message):
     # Return original results + save message
     return jsonify({
-        'detected_books': detected_books,
+        'detected_books': [d['title'] for d in detections],
+        # Title/author/confidence per detected book (author and confidence need DETECTION_OUTPUT=json)
+        'detections': [d for d in detections if not _is_detection_message(d['title'])],
         'recommendations': recommendations,
         'save_message': save_message # Add the message
     })
 
+
+def _busy_response(e, user_id):
+    logger.warning(f"User {user_id}: Upload rejected - {e}")
+    response = jsonify({'error': 'Image analysis service is busy. Please retry later.'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+def _upload_error_response(e, user_id):
+    db.session.rollback() # Rollback any potential partial adds on error
+    logger.error(f"User {user_id}: Error during upload processing or saving: {e}", exc_info=True)
+    return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     """Registers a new user."""
-    data = request.get_json()
-    
-    # Input validation
-    if not data or not data.get('username') or not data.get('email') or not data.get('password'):
-        return jsonify({'error': 'Missing username, email, or password'}), 400
-        
-    username = sanitize_input(data['username'].strip())
-    email = sanitize_input(data['email'].strip().lower())
-    password = data['password']
-    
-    # Basic validation checks (can be expanded)
-    if len(username) < 3:
-        return jsonify({'error': 'Username must be at least 3 characters long'}), 400
-    if '@' not in email or '.' not in email:
-         return jsonify({'error': 'Invalid email format'}), 400
-    if len(password) < 6:
-         return jsonify({'error': 'Password must be at least 6 characters long'}), 400
+    body = parse_body(REGISTER_SCHEMA)
+    username, email, password = body['username'], body['email'], body['password']
 
     # Check if user already exists (case-insensitive check for username/email)
     existing_user = User.query.filter(
@@ -531,22 +1241,32 @@ def register_user():
         logger.error(f"Error during registration DB commit: {e}")
         return jsonify({'error': 'Registration failed due to a server error.'}), 500
 
+def _upgrade_password_hash(user, password):
+    """Re-hash a verified password made with older settings; failures keep the old hash."""
+    try:
+        user.set_password(password)
+        db.session.commit()
+        password_hasher.record_rehash()
+        logger.info(f"Upgraded password hash of user {user.id} to {password_hasher.settings.label()}")
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not upgrade password hash of user {user.id}: {e}")
+
+
 @app.route('/api/login', methods=['POST'])
 @limiter.limit("5 per minute")
 def login_user():
     """Logs a user in by verifying credentials and returns a JWT."""
-    data = request.get_json()
-    if not data or not data.get('identifier') or not data.get('password'):
-        return jsonify({'error': 'Missing identifier (username or email) or password'}), 400
-
-    identifier = sanitize_input(data['identifier'].strip())
-    password = data['password']
+    body = parse_body(LOGIN_SCHEMA)
+    identifier, password = body['identifier'], body['password']
     user = User.query.filter(
         (db.func.lower(User.username) == db.func.lower(identifier)) | 
         (db.func.lower(User.email) == db.func.lower(identifier))
     ).first()
 
     if user and user.check_password(password):
+        if password_hasher.needs_rehash(user.password_hash):
+            _upgrade_password_hash(user, password)
         # Login successful - Generate JWT
         try:
             expiry_hours = int(os.getenv('TOKEN_EXPIRY_HOURS', str(token_expiry_hours)))
@@ -581,8 +1301,8 @@ def verify_token():
     """Verifies a JWT token sent in the Authorization header."""
     # If @token_required passes, the token is valid and g.user_id is set
     logger.info(f"Token verified successfully via /api/verify_token for user_id: {g.user_id}")
-    # Optionally return user info based on g.user_id if needed
-    user = User.query.get(g.user_id)
+    # g.user is loaded from g.user_id on first access
+    user = g.user
     if user:
         user_data = {"id": user.id, "username": user.username, "email": user.email}
         return jsonify({"message": "Token is valid", "user": user_data}), 200
@@ -592,6 +1312,64 @@ def verify_token():
 
 # --- Bookshelf & Book Management Endpoints --- 
 
+# --- Shelf Book Fields ---
+# Fields a shelf's books can be returned with (``?fields=``), in output order
+SHELF_BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'cover_image_url', 'added_at')
+
+
+def _shelf_book_rows(shelf_id, fields):
+    """Return tuples of the requested book fields for a shelf, ordered by book id.
+
+    Selects only the needed columns instead of loading Book objects, which
+    dominates serialization time on shelves with thousands of books.
+    """
+    columns = {
+        'id': Book.id, 'title': Book.title, 'author': Book.authors, 'isbn': Book.isbn,
+        'cover_image_url': Book.cover_image_url, 'added_at': Book.added_at,
+    }
+    return db.session.query(*(columns[name] for name in fields)) \
+        .join(shelf_books, shelf_books.c.book_id == Book.id) \
+        .filter(shelf_books.c.bookshelf_id == shelf_id) \
+        .order_by(Book.id).all()
+# --- End Shelf Book Fields ---
+
+# --- Conditional GET Helpers ---
+def _shelf_list_etag(query, scope):
+    """Return an ETag summarising the shelves selected by ``query``.
+
+    Count, highest id and the sum of shelf versions change whenever a shelf
+    in the result is created, deleted, edited or gains/loses a book. The
+    ``scope`` distinguishes differently filtered views of the same shelves.
+    """
+    count, max_id, version_sum = query.order_by(None).with_entities(
+        db.func.count(Bookshelf.id), db.func.max(Bookshelf.id), db.func.sum(Bookshelf.version)).one()
+    return hashlib.sha256(f"{scope}:{count}:{max_id}:{version_sum}".encode()).hexdigest()[:32]
+
+
+def _shelf_etag(shelf, fields=SHELF_BOOK_FIELDS, mimetype=JSON_MIMETYPE):
+    """ETag of one representation of a shelf; field selections and encodings differ."""
+    etag = f"shelf-{shelf.id}-v{shelf.version}"
+    if tuple(fields) != SHELF_BOOK_FIELDS or mimetype != JSON_MIMETYPE:
+        variant = f"{mimetype};{','.join(fields)}".encode()
+        etag += f"-{hashlib.sha256(variant).hexdigest()[:8]}"
+    return etag
+
+
+def _not_modified(etag, last_modified=None):
+    """Return a 304 response when the request's validators match, else None."""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _with_validators(app.response_class(status=304), etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'  # Always revalidate; per-user data
+    return response
+# --- End Conditional GET Helpers ---
+
 # GET (all) and POST (create) for the LOGGED-IN user's bookshelves
 @app.route('/api/bookshelves', methods=['GET', 'POST'])
 @token_required # Requires login for both GET and POST
@@ -600,7 +1378,12 @@ def handle_bookshelves():
 
     if request.method == 'GET':
         """Gets all bookshelves belonging to the logged-in user."""
-        user_shelves = Bookshelf.query.filter_by(user_id=user_id).order_by(Bookshelf.created_at.desc()).all()
+        query = Bookshelf.query.filter_by(user_id=user_id)
+        etag = _shelf_list_etag(query, f'own:{user_id}')
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        user_shelves = query.order_by(Bookshelf.created_at.desc()).all()
         shelves_data = []
         for shelf in user_shelves:
              shelves_data.append({
@@ -613,20 +1396,14 @@ def handle_bookshelves():
                  'updated_at': shelf.updated_at.isoformat() if shelf.updated_at else None
              })
         logger.info(f"Fetched {len(shelves_data)} bookshelves for user {user_id}")
-        return jsonify(shelves_data), 200
+        return _with_validators(jsonify(shelves_data), etag), 200
 
     elif request.method == 'POST':
         """Creates a new bookshelf for the logged-in user."""
-        data = request.get_json()
-        if not data or not data.get('name'):
-            return jsonify({'error': 'Bookshelf name is required'}), 400
-            
-        name = sanitize_input(data['name'].strip())
-        description = sanitize_input(data.get('description', '').strip())
-        is_public = data.get('is_public', False)
-        
-        if not name:
-            return jsonify({'error': 'Bookshelf name cannot be empty'}), 400
+        body = parse_body(SHELF_CREATE_SCHEMA)
+        name = body['name']
+        description = body.get('description') or ''
+        is_public = body['is_public']
 
         # Check for duplicate shelf name for the same user (optional but good practice)
         existing_shelf = Bookshelf.query.filter_by(user_id=user_id, name=name).first()
@@ -664,8 +1441,9 @@ def handle_bookshelves():
 @token_required # Requires login
 def handle_specific_bookshelf(shelf_id):
     user_id = g.user_id
-    # Query for the shelf ensuring it belongs to the logged-in user
-    shelf = Bookshelf.query.filter_by(id=shelf_id, user_id=user_id).first()
+    # Query for the shelf ensuring it belongs to the logged-in user.
+    # Books are loaded on first access, so a 304 never loads them.
+    shelf = Bookshelf.query.options(lazyload(Bookshelf.books)).filter_by(id=shelf_id, user_id=user_id).first()
 
     if not shelf:
         logger.warning(f"Attempt to access or modify non-existent or unauthorized bookshelf {shelf_id} by user {user_id}")
@@ -673,18 +1451,19 @@ def handle_specific_bookshelf(shelf_id):
 
     if request.method == 'GET':
         """Gets details of a specific bookshelf owned by the user."""
-        books_data = []
-        for book in shelf.books:
-            books_data.append({
-                 'id': book.id,
-                 'title': book.title,
-                 'author': book.authors,
-                 'isbn': book.isbn,
-                 'cover_image_url': book.cover_image_url,
-                 'added_at': book.added_at.isoformat() if book.added_at else None
-            })
+        try:
+            fields = parse_fields(request.args.get('fields'), SHELF_BOOK_FIELDS)
+        except FieldsError as e:
+            return jsonify({'error': str(e)}), 400
+        mimetype = negotiate_encoding(request.accept_mimetypes)
+        etag = _shelf_etag(shelf, fields, mimetype)
+        not_modified = _not_modified(etag, shelf.updated_at)
+        if not_modified is not None:
+            not_modified.vary.add('Accept')
+            return not_modified
+        books_data = encode_rows(_shelf_book_rows(shelf.id, fields), fields, mimetype)
         logger.info(f"Fetched bookshelf {shelf_id} for user {user_id}")
-        return jsonify({
+        payload = {
             'id': shelf.id,
             'name': shelf.name,
             'description': shelf.description,
@@ -692,20 +1471,22 @@ def handle_specific_bookshelf(shelf_id):
             'created_at': shelf.created_at.isoformat(),
             'updated_at': shelf.updated_at.isoformat(),
             'books': books_data
-        }), 200
+        }
+        if mimetype == MSGPACK_MIMETYPE:
+            response = app.response_class(pack_msgpack(payload), mimetype=mimetype)
+        else:
+            response = app.response_class(_json_bytes(payload), mimetype=mimetype)
+        response.vary.add('Accept')
+        return _with_validators(response, etag, shelf.updated_at), 200
 
     elif request.method == 'PUT':
         """Updates a specific bookshelf owned by the user."""
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'Request body is required for update'}), 400
+        body = parse_body(SHELF_UPDATE_SCHEMA)
 
         # Update fields if they are provided in the request
         updated = False
-        if 'name' in data:
-            new_name = data['name'].strip()
-            if not new_name:
-                return jsonify({"error": "Bookshelf name cannot be empty"}), 400
+        if 'name' in body:
+            new_name = body['name']
             if new_name != shelf.name:
                  # Optional: check if the new name conflicts with another shelf of the same user
                  existing_shelf = Bookshelf.query.filter(Bookshelf.user_id == user_id, Bookshelf.name == new_name, Bookshelf.id != shelf_id).first()
@@ -713,11 +1494,11 @@ def handle_specific_bookshelf(shelf_id):
                      return jsonify({'error': f'Another bookshelf named "{new_name}" already exists'}), 409
                  shelf.name = new_name
                  updated = True
-        if 'description' in data:
-            shelf.description = data['description'].strip()
+        if 'description' in body:
+            shelf.description = body['description'] or ''
             updated = True
-        if 'is_public' in data and isinstance(data['is_public'], bool):
-            shelf.is_public = data['is_public']
+        if 'is_public' in body:
+            shelf.is_public = body['is_public']
             updated = True
 
         if not updated:
@@ -763,17 +1544,11 @@ def add_book_to_shelf(shelf_id):
         logger.warning(f"Attempt to add book to non-existent or unauthorized bookshelf {shelf_id} by user {user_id}")
         return jsonify({"error": "Bookshelf not found or access denied"}), 404
 
-    data = request.get_json()
-    if not data or not data.get('title'):
-        return jsonify({"error": "Book title is required"}), 400
-
-    title = data['title'].strip()
-    author = data.get('author', '').strip()
-    isbn = data.get('isbn', '').strip()
-    cover_image_url = data.get('cover_image_url', '').strip()
-    
-    if not title:
-        return jsonify({"error": "Book title cannot be empty"}), 400
+    body = parse_body(BOOK_SCHEMA)
+    title = body['title']
+    author = body.get('author') or ''
+    isbn = body.get('isbn')  # None rather than '' so books without an ISBN do not collide on the unique column
+    cover_image_url = body.get('cover_image_url') or ''
 
     # Optional: Check if book already exists in this shelf (e.g., by ISBN or title/author)
     # if existing_book:
@@ -805,6 +1580,64 @@ def add_book_to_shelf(shelf_id):
         logger.error(f"Failed to add book '{title}' to bookshelf {shelf_id} for user {user_id}: {e}")
         return jsonify({"error": "Failed to add book"}), 500
 
+# POST (add many books) to a specific bookshelf
+@app.route('/api/bookshelves/<int:shelf_id>/books/bulk', methods=['POST'])
+@token_required # Requires login
+def add_books_to_shelf(shelf_id):
+    """Adds up to BULK_MAX_BOOKS books in one request and one transaction.
+
+    Every item is validated before anything is written; any invalid item
+    rejects the whole request with all problems listed. Titles already on
+    the shelf (fuzzy match) and ISBNs already stored are skipped, not errors.
+    """
+    user_id = g.user_id
+    shelf = Bookshelf.query.filter_by(id=shelf_id, user_id=user_id).first()
+    if not shelf:
+        logger.warning(f"Attempt to bulk add books to non-existent or unauthorized bookshelf {shelf_id} by user {user_id}")
+        return jsonify({"error": "Bookshelf not found or access denied"}), 404
+
+    items = parse_body(BULK_BOOKS_SCHEMA)['books']
+
+    existing_titles = _shelf_title_index(shelf, [item['title'] for item in items])
+    isbns = {item['isbn'] for item in items if item.get('isbn')}
+    taken_isbns = {isbn for (isbn,) in db.session.query(Book.isbn).filter(Book.isbn.in_(isbns))} if isbns else set()
+    new_books, skipped = [], []
+    for i, item in enumerate(items):
+        isbn = item.get('isbn')
+        if isbn and isbn in taken_isbns:
+            skipped.append({'index': i, 'title': item['title'], 'reason': 'isbn already exists'})
+            continue
+        if not existing_titles.add_if_new(item['title']):
+            skipped.append({'index': i, 'title': item['title'], 'reason': 'already on shelf'})
+            continue
+        if isbn:
+            taken_isbns.add(isbn)
+        new_books.append(Book(
+            title=item['title'],
+            authors=item.get('author') or '',
+            isbn=isbn,
+            cover_image_url=item.get('cover_image_url') or '',
+        ))
+
+    try:
+        shelf.books.extend(new_books)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to bulk add {len(new_books)} books to bookshelf {shelf_id} for user {user_id}: {e}")
+        return jsonify({"error": "Failed to add books"}), 500
+    logger.info(f"Bulk added {len(new_books)} books to bookshelf {shelf_id} by user {user_id} ({len(skipped)} skipped)")
+    return jsonify({
+        'added': [{
+            'id': book.id,
+            'title': book.title,
+            'author': book.authors,
+            'isbn': book.isbn,
+            'cover_image_url': book.cover_image_url,
+        } for book in new_books],
+        'skipped': skipped,
+    }), 201
+
 # DELETE a specific book from a bookshelf
 # Note: This route operates on the book ID directly, but still checks ownership via the shelf
 @app.route('/api/books/<int:book_id>', methods=['DELETE'])
@@ -812,7 +1645,7 @@ def add_book_to_shelf(shelf_id):
 def delete_book_from_shelf(book_id):
     user_id = g.user_id
     # Find the book and ensure its shelf belongs to the logged-in user
-    book = db.session.query(Book).join(Bookshelf).filter(
+    book = db.session.query(Book).join(Book.bookshelves).filter(
         Book.id == book_id, 
         Bookshelf.user_id == user_id
     ).first()
@@ -833,26 +1666,71 @@ def delete_book_from_shelf(book_id):
 
 # --- Public Bookshelf Endpoints ---
 
+@app.after_request
+def compress(response):
+    """Compress large JSON/MessagePack responses when the client accepts it."""
+    return compress_response(response, request.accept_encodings, compression_config)
+
+
+def _json_bytes(payload):
+    """Serialize a payload exactly as jsonify would."""
+    return app.json.dumps_bytes(payload)
+
+
+def _cached_json_response(entry):
+    """Serve a cached body with a strong ETag, answering If-None-Match with 304."""
+    response = app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
+
+
 @app.route('/api/public/bookshelves', methods=['GET'])
 def list_public_bookshelves():
-    """Return all bookshelves marked as public."""
-    shelves = Bookshelf.query.filter_by(is_public=True).order_by(Bookshelf.created_at.desc()).all()
-    results = []
-    for shelf in shelves:
-        results.append({
-            'id': shelf.id,
-            'name': shelf.name,
-            'description': shelf.description,
-            'owner': {'id': shelf.owner.id, 'username': shelf.owner.username},
-            'book_count': len(shelf.books),
-            'created_at': shelf.created_at.isoformat() if shelf.created_at else None
-        })
-    return jsonify(results), 200
+    """Return all bookshelves marked as public.
+    Optional ``page``/``per_page`` query parameters return one page of the list.
+    """
+    page = request.args.get('page', type=int)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    if page is not None and page < 1:
+        return jsonify({'error': 'page must be a positive integer'}), 400
+
+    def build():
+        query = Bookshelf.query.filter_by(is_public=True).order_by(Bookshelf.created_at.desc(), Bookshelf.id.desc())
+        if page is not None:
+            query = query.limit(per_page).offset((page - 1) * per_page)
+        results = []
+        for shelf in query.all():
+            results.append({
+                'id': shelf.id,
+                'name': shelf.name,
+                'description': shelf.description,
+                'owner': {'id': shelf.owner.id, 'username': shelf.owner.username},
+                'book_count': len(shelf.books),
+                'created_at': shelf.created_at
+            })
+        return _json_bytes(results)
+
+    key = f'public_list:{page}:{per_page}' if page is not None else 'public_list:all'
+    # Every shelf, membership and book change writes a change-log row, so the latest id
+    # versions the list for all workers (a max() over the primary key is one index lookup)
+    version = db.session.query(db.func.max(ChangeLog.id)).scalar()
+    return _cached_json_response(public_cache.get_or_build(key, version, build))
 
 
 @app.route('/api/public/bookshelves/<int:shelf_id>', methods=['GET'])
 def get_public_bookshelf(shelf_id):
     """Retrieve a single public bookshelf and its books."""
+    # Checked on every request, also for cached bodies: the persisted version changes with
+    # any write to the shelf or its books, in whichever worker process made it
+    version = db.session.query(Bookshelf.version).filter_by(id=shelf_id, is_public=True).scalar()
+    if version is None:
+        return jsonify({'error': 'Bookshelf not found'}), 404
+    key = f'shelf:{shelf_id}'
+    entry = public_cache.get(key, version)
+    if entry is not None:
+        return _cached_json_response(entry)
+
     shelf = Bookshelf.query.filter_by(id=shelf_id, is_public=True).first()
     if not shelf:
         return jsonify({'error': 'Bookshelf not found'}), 404
@@ -865,17 +1743,18 @@ def get_public_bookshelf(shelf_id):
             'author': book.authors,
             'isbn': book.isbn,
             'cover_image_url': book.cover_image_url,
-            'added_at': book.added_at.isoformat() if book.added_at else None
+            'added_at': book.added_at
         })
 
-    return jsonify({
+    body = _json_bytes({
         'id': shelf.id,
         'name': shelf.name,
         'description': shelf.description,
         'owner': {'id': shelf.owner.id, 'username': shelf.owner.username},
-        'created_at': shelf.created_at.isoformat() if shelf.created_at else None,
+        'created_at': shelf.created_at,
         'books': books_data
-    }), 200
+    })
+    return _cached_json_response(public_cache.set(key, version, body))
 
 # --- Social / Friends Endpoints ---
 
@@ -1007,17 +1886,14 @@ def list_communities():
 @token_required
 def create_community():
     """Create a new community and join it."""
-    data = request.get_json()
-    if not data or not data.get('name'):
-        return jsonify({'error': 'Community name is required'}), 400
-
-    name = sanitize_input(data['name'].strip())
-    description = sanitize_input(data.get('description', '').strip())
+    body = parse_body(COMMUNITY_CREATE_SCHEMA)
+    name = body['name']
+    description = body.get('description') or ''
     if Community.query.filter_by(name=name).first():
         return jsonify({'error': 'Community already exists'}), 409
 
     community = Community(name=name, description=description, owner_id=g.user_id)
-    user = User.query.get(g.user_id)
+    user = g.user
     community.members.append(user)
     db.session.add(community)
     db.session.commit()
@@ -1031,7 +1907,7 @@ def join_community(comm_id):
     community = Community.query.get(comm_id)
     if not community:
         return jsonify({'error': 'Community not found'}), 404
-    user = User.query.get(g.user_id)
+    user = g.user
     if user in community.members:
         return jsonify({'message': 'Already a member'}), 200
     community.members.append(user)
@@ -1046,7 +1922,7 @@ def leave_community(comm_id):
     community = Community.query.get(comm_id)
     if not community:
         return jsonify({'error': 'Community not found'}), 404
-    user = User.query.get(g.user_id)
+    user = g.user
     if user not in community.members:
         return jsonify({'error': 'Not a member'}), 404
     community.members.remove(user)
@@ -1068,7 +1944,7 @@ def list_community_members(comm_id):
 @token_required
 def list_my_communities():
     """List communities the logged-in user belongs to."""
-    user = User.query.get(g.user_id)
+    user = g.user
     results = [
         {
             'id': c.id,
@@ -1102,9 +1978,9 @@ def get_or_update_community(comm_id):
     # PUT - only owner may update
     if community.owner_id != g.user_id:
         return jsonify({'error': 'Only the owner can update this community'}), 403
-    data = request.get_json() or {}
-    new_name = sanitize_input(data.get('name', community.name).strip())
-    new_desc = sanitize_input(data.get('description', community.description or '').strip())
+    body = parse_body(COMMUNITY_UPDATE_SCHEMA)
+    new_name = body.get('name')
+    new_desc = body.get('description', community.description) or ''
     if new_name:
         existing = Community.query.filter(Community.name == new_name, Community.id != comm_id).first()
         if existing:
@@ -1139,7 +2015,8 @@ def list_user_bookshelves(target_id):
     """
     viewer_id = g.user_id
     if viewer_id == target_id:
-        shelves = Bookshelf.query.filter_by(user_id=target_id).order_by(Bookshelf.created_at.desc()).all()
+        query = Bookshelf.query.filter_by(user_id=target_id)
+        scope = 'all'
     else:
         friendship = FriendRequest.query.filter(
             FriendRequest.status == 'accepted',
@@ -1147,9 +2024,18 @@ def list_user_bookshelves(target_id):
             ((FriendRequest.requester_id == target_id) & (FriendRequest.addressee_id == viewer_id))
         ).first()
         if friendship:
-            shelves = Bookshelf.query.filter_by(user_id=target_id).order_by(Bookshelf.created_at.desc()).all()
+            query = Bookshelf.query.filter_by(user_id=target_id)
+            scope = 'all'
         else:
-            shelves = Bookshelf.query.filter_by(user_id=target_id, is_public=True).order_by(Bookshelf.created_at.desc()).all()
+            query = Bookshelf.query.filter_by(user_id=target_id, is_public=True)
+            scope = 'public'
+
+    # Visibility is part of the ETag, so gaining or losing friendship changes it
+    etag = _shelf_list_etag(query, f'user:{target_id}:{scope}')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    shelves = query.order_by(Bookshelf.created_at.desc()).all()
 
     results = []
     for shelf in shelves:
@@ -1161,13 +2047,110 @@ def list_user_bookshelves(target_id):
             'book_count': len(shelf.books),
             'created_at': shelf.created_at.isoformat() if shelf.created_at else None,
         })
-    return jsonify(results), 200
+    return _with_validators(jsonify(results), etag), 200
+
+# --- Sync Endpoint ---
+
+def _friend_ids(user_id):
+    """Return the ids of users with an accepted friendship with ``user_id``."""
+    friendships = FriendRequest.query.filter(
+        FriendRequest.status == 'accepted',
+        ((FriendRequest.requester_id == user_id) | (FriendRequest.addressee_id == user_id))
+    ).all()
+    return [fr.addressee_id if fr.requester_id == user_id else fr.requester_id for fr in friendships]
+
+
+@app.route('/api/sync', methods=['GET'])
+@token_required
+def sync_changes():
+    """Return changes after the ``since`` cursor that are visible to the caller.
+
+    Covers the caller's shelves, all shelves of friends (friends can view
+    each other's shelves) and the communities the caller belongs to.
+    Answers 410 when ``since`` is older than the retained change log, in
+    which case the client should refetch everything and continue from
+    the returned cursor.
+    """
+    user_id = g.user_id
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+
+    head = db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    if since and oldest is not None and since < oldest - 1:
+        return jsonify({'error': 'Cursor is older than the retained change log; refetch and resume from cursor.',
+                        'cursor': head}), 410
+
+    owner_ids = [user_id] + _friend_ids(user_id)
+    community_ids = [row.community_id for row in db.session.query(community_members.c.community_id)
+                     .filter(community_members.c.user_id == user_id)]
+    visible = db.or_(
+        db.and_(ChangeLog.shelf_id.isnot(None), ChangeLog.user_id.in_(owner_ids)),
+        ChangeLog.community_id.in_(community_ids),
+        # Leaving a community, or its deletion, must still reach former members
+        db.and_(ChangeLog.entity == 'community_member', ChangeLog.user_id == user_id),
+        db.and_(ChangeLog.entity == 'community', ChangeLog.action == 'deleted'),
+    )
+    changes = (ChangeLog.query.filter(ChangeLog.id > since, ChangeLog.id <= head, visible)
+               .order_by(ChangeLog.id).limit(limit + 1).all())
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    # Skip past invisible rows too, unless the page was cut short
+    cursor = changes[-1].id if has_more else max(since, head)
+    return jsonify({
+        'changes': [c.to_dict() for c in changes],
+        'cursor': cursor,
+        'has_more': has_more,
+    }), 200
 
 # === Core Logic Functions ===
 
+def _shelf_title_index(shelf, titles):
+    """Build a fuzzy title index of the shelf's books that could match any of ``titles``.
+
+    Candidates come from two indexed lookups, so the cost follows the number
+    of incoming titles rather than the size of the shelf: books whose
+    ``normalized_title`` is a title's key or main-title key, and books sharing
+    a MinHash band or main-title key in ``book_match_keys``. ``add_if_new``
+    on the result then dedupes ``titles`` as an index of the whole shelf would.
+    """
+    index = TitleIndex.from_env()
+    if shelf.id is None:
+        return index
+    normalized, match_keys = set(), set()
+    for title in titles:
+        title_normalized, title_match_keys = _title_keys.candidate_keys(title)
+        normalized |= title_normalized
+        match_keys |= title_match_keys
+    if not normalized:
+        return index
+    # Written as "id IN (...)" so SQLite starts from the key indexes, not the shelf's rows
+    candidates = db.union(
+        db.select(Book.id).where(Book.normalized_title.in_(normalized)),
+        db.select(book_match_keys.c.book_id).where(book_match_keys.c.match_key.in_(match_keys)),
+    )
+    rows = (db.session.query(Book.title, Book.normalized_title)
+            .join(shelf_books, shelf_books.c.book_id == Book.id)
+            .filter(shelf_books.c.bookshelf_id == shelf.id, Book.id.in_(candidates)))
+    for title, key in rows:
+        index.add(title, key=key if key is not None else normalize_title(title))
+    return index
+
+
+def _hash_image_file(image_path):
+    """Return the SHA-256 hex digest of an image file's bytes."""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def detect_books_with_llm(image_path):
     """
-    Uses the configured Google Gemini Vision model to detect book titles from an image.
+    Uses the configured detection backend (Google Gemini Vision or the local
+    stand-in) to detect book titles from an image.
+    Concurrent calls for byte-identical images share a single LLM request.
 
     Args:
         image_path (str): The file path to the temporarily saved image.
@@ -1176,372 +2159,472 @@ def detect_books_with_llm(image_path):
         list[str]: A list of detected book titles. Returns a list containing 
                    error messages if detection fails or the LLM is unavailable.
     """
+    return [d['title'] for d in detect_books_detailed(image_path)]
+
+
+def detect_books_detailed(image_path, on_book=None):
+    """
+    Like detect_books_with_llm, but returns ``{title, author, confidence}`` dicts.
+    Author and confidence are only filled in with DETECTION_OUTPUT=json;
+    error messages are returned as dicts whose title is the message.
+
+    Args:
+        image_path (str): The file path to the temporarily saved image.
+        on_book (callable): Called with each detected book as soon as it is
+                            parsed (before the response is complete when streaming).
+                            Callers joining a coalesced detection are not called.
+    """
+    image_key, error = _detection_key(image_path)
+    if error:
+        return error
+    with detection_seconds.time(path='sync'):
+        detections = detection_flight.do(image_key, lambda: _run_llm_detection(image_path, on_book))
+    # Copy so callers sharing a coalesced result cannot affect each other
+    return [dict(d) for d in detections]
+
+
+def _detection_key(image_path):
+    """Return ``(coalescing key, None)`` for an image, or ``(None, error detections)``."""
     if not llm_model:
         logger.error("LLM model not initialized during detection call.")
-        return ["Error: LLM service not available"]
+        return None, [_as_detection("Error: LLM service not available")]
+    try:
+        return _hash_image_file(image_path), None
+    except OSError as e:
+        logger.error(f"Error: Could not read image file {image_path}: {e}")
+        return None, [_as_detection("Error: Temporary image file not found for analysis.")]
 
+
+def _as_detection(title, author=None, confidence=None):
+    return {'title': title, 'author': author, 'confidence': confidence}
+
+
+def _is_detection_message(text):
+    """Return True for the status/error strings detection returns instead of titles."""
+    lowered = text.lower()
+    return (lowered.startswith("error") or lowered.startswith("llm analysis")
+            or lowered.startswith("no valid book titles"))
+
+
+def _open_for_detection(image_path):
+    """Return ``(image, tiles or None, None)`` for an upload, or ``(None, None, error detections)``."""
     try:
         logger.info(f"Processing image with LLM: {image_path}")
         # Verify file exists before opening
         if not os.path.exists(image_path):
             logger.error(f"Error: Image file not found at {image_path}")
-            return ["Error: Temporary image file not found for analysis."]
+            return None, None, [_as_detection("Error: Temporary image file not found for analysis.")]
 
         img = Image.open(image_path) # Open image using Pillow
+        if not tiling_config.should_tile(img.size):
+            return img, None, None
+        tiles = split_into_tiles(img, tiling_config)
+        logger.info(f"Splitting {img.size[0]}x{img.size[1]} image into {len(tiles)} tiles for detection.")
+        return img, tiles, None
+    except Exception as e:
+        return None, None, [_as_detection(_detection_failure(e))]
 
-        # Define the prompt for the LLM
-        prompt = (
-            "Your task is to identify book titles from the provided image of a bookshelf. "
-            "Focus ONLY on the text that represents book titles on the spines or covers. "
-            "List each distinct book title you can clearly identify on a new line. "
-            "Do NOT include author names unless they are undeniably part of the main title. "
-            "Do NOT include publisher logos or series names unless part of the title. "
-            "Provide ONLY the list of titles, with no introduction, explanation, numbering, or formatting like bullet points."
-        )
 
-        # Call the Gemini API (using the initialized llm_model)
+def _run_llm_detection(image_path, on_book=None):
+    """Open the uploaded image and detect books, tiling very wide or large images.
+
+    Tiles are detected concurrently and go through llm_executor, so they
+    share the normal LLM concurrency limit with other uploads.
+    """
+    img, tiles, error = _open_for_detection(image_path)
+    if error:
+        return error
+    if tiles is None:
+        return _detect_books_in_image(img, on_book)
+    futures = [tile_executor.submit(_detect_books_in_image, tile, on_book) for tile in tiles]
+    return _merge_tile_detections([future.result() for future in futures])  # Re-raises LLMOverloaded
+
+
+def _merge_tile_detections(results):
+    """Merge per-tile detections, collapsing titles repeated across overlaps."""
+    per_tile = [[d for d in books if not _is_detection_message(d['title'])] for books in results]
+    by_title = {}
+    for books in per_tile:
+        for d in books:
+            if d['author'] or d['title'] not in by_title:
+                by_title[d['title']] = d
+    merged = merge_titles([[d['title'] for d in books] for books in per_tile])
+    logger.debug(f"Merged tiled titles: {merged}")
+    if merged:
+        return [by_title[title] for title in merged]
+    return results[0] if results else [_as_detection("No valid book titles identified by LLM.")]
+
+
+def _detect_books_in_image(img, on_book=None):
+    """Detect the books in one image (or tile) using the configured output mode."""
+    if detection_output == 'json':
+        return _detect_books_structured(img, on_book)
+    return _report_titles(_detect_titles_in_image(img), on_book)
+
+
+def _report_titles(titles, on_book=None):
+    """Turn text-mode titles into detections, passing the real books to ``on_book``."""
+    detections = [_as_detection(title) for title in titles]
+    if on_book:
+        for d in detections:
+            if not _is_detection_message(d['title']):
+                on_book(d)
+    return detections
+
+
+def _detect_books_structured(img, on_book=None):
+    """Stream structured JSON detections, reporting each book as soon as it parses.
+
+    The concurrency slot is held until the stream is exhausted, since the
+    model keeps generating while chunks are consumed.
+    """
+    books = []
+    parser = JSONArrayStreamParser()
+    try:
+        with llm_executor.slot():
+            response = llm_model.generate_content(
+                [STRUCTURED_DETECTION_PROMPT, img],
+                safety_settings=DETECTION_SAFETY_SETTINGS,
+                generation_config=STRUCTURED_GENERATION_CONFIG,
+                stream=True,
+            )
+            blocked = _blocked_stream_message(response)
+            if blocked:
+                return [_as_detection(blocked)]
+
+            for chunk in response:
+                if not _feed_structured_chunk(parser, chunk, books, on_book):
+                    break
+    except LLMOverloaded:
+        raise  # Let the upload handler answer 503 with Retry-After
+    except Exception as e:
+        message = _detection_failure(e, partial=bool(books))
+        if message:
+            return [_as_detection(message)]
+    return _structured_result(books)
+
+
+def _blocked_stream_message(response):
+    """Return the status message for a streamed response whose prompt was blocked, else None."""
+    feedback = getattr(response, 'prompt_feedback', None)
+    if feedback is not None and feedback.block_reason:
+        logger.warning(f"LLM Prompt Blocked: {feedback.block_reason}")
+        return f"LLM analysis failed: Blocked by safety filter ({feedback.block_reason})"
+    return None
+
+
+def _structured_result(books):
+    logger.debug(f"Structured detections: {books}")
+    return books if books else [_as_detection("No valid book titles identified by LLM.")]
+
+
+def _feed_structured_chunk(parser, chunk, books, on_book):
+    """Parse one streamed chunk into ``books``; returns False when the stream must stop."""
+    try:
+        text = chunk.text
+    except ValueError as ve:
+        # Raised when a chunk carries no text, e.g. the stream was stopped by safety filters
+        logger.error(f"ValueError accessing streamed response text: {ve}")
+        return False
+    for item in parser.feed(text):
+        book = normalize_detection(item, detection_min_confidence)
+        if book is None:
+            continue
+        books.append(book)
+        if on_book:
+            on_book(book)
+    return True
+
+
+TITLE_DETECTION_PROMPT = (
+    "Your task is to identify book titles from the provided image of a bookshelf. "
+    "Focus ONLY on the text that represents book titles on the spines or covers. "
+    "List each distinct book title you can clearly identify on a new line. "
+    "Do NOT include author names unless they are undeniably part of the main title. "
+    "Do NOT include publisher logos or series names unless part of the title. "
+    "Provide ONLY the list of titles, with no introduction, explanation, numbering, or formatting like bullet points."
+)
+
+
+def _detect_titles_in_image(img):
+    """Send one image (or tile) to the LLM and parse the returned titles."""
+    try:
+        # Call the detection backend (Gemini API or local stand-in)
         # Include safety settings to understand potential blocks
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-        response = llm_model.generate_content(
-            [prompt, img],
-            safety_settings=safety_settings,
+        response = llm_executor.call(
+            llm_model.generate_content,
+            [TITLE_DETECTION_PROMPT, img],
+            safety_settings=DETECTION_SAFETY_SETTINGS,
             # stream=False # Ensure non-streaming response for .text access
         )
+        return _titles_from_response(response)
+    except LLMOverloaded:
+        raise  # Let the upload handler answer 503 with Retry-After
+    except Exception as e:
+        return [_detection_failure(e)]
 
-        # Debugging: Log the raw response for inspection
-        logger.debug("--- LLM Raw Response Start ---")
-        extracted_text = "" # Initialize default value
-        try:
-            # Check for safety blocks before accessing text
-            # Accessing prompt_feedback raises AttributeError if no safety settings block it
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-                logger.warning(f"LLM Prompt Blocked: {response.prompt_feedback.block_reason}")
-                logger.debug(f"Safety Ratings: {response.prompt_feedback.safety_ratings}")
-                return [f"LLM analysis failed: Blocked by safety filter ({response.prompt_feedback.block_reason})"]
-
-            # Check if response candidate finished properly
-            if not response.candidates or response.candidates[0].finish_reason != 1: # 1 = STOP
-                 logger.warning(f"LLM Warning: Response did not finish normally. Reason: {response.candidates[0].finish_reason if response.candidates else 'Unknown'}")
-                 # Potentially still try to access text, but be aware it might be incomplete
-
-            extracted_text = response.text
-            logger.debug(extracted_text)
-        except ValueError as ve:
-            # This might indicate issues during text generation itself
-            logger.error(f"ValueError accessing response text: {ve}")
-            # Log feedback if available
-            if hasattr(response, 'prompt_feedback'):
-                 logger.debug(f"Prompt Feedback: {response.prompt_feedback}")
-            return ["LLM analysis blocked (Safety/Invalid Response)"]
-        except AttributeError as ae:
-            # Fallback if response.text doesn't exist - check prompt_feedback first
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-                 # If it was blocked, we already handled it above or should have
-                 logger.warning(f"AttributeError accessing text, but prompt feedback indicates block: {response.prompt_feedback.block_reason}")
-                 # Return the block reason if available
-                 return [f"LLM analysis failed: Blocked by safety filter ({response.prompt_feedback.block_reason})"]
-
-            logger.error(f"AttributeError accessing response text: {ae}. Checking parts...")
-            if hasattr(response, 'parts') and response.parts:
-                try:
-                    extracted_text = '\n'.join(part.text for part in response.parts if hasattr(part, 'text'))
-                    logger.debug(f"Extracted from parts: {extracted_text}")
-                except Exception as part_err:
-                    logger.error(f"Error extracting text from parts: {part_err}")
-                    return ["LLM analysis failed: Error parsing response parts."]
-            else:
-                logger.error("Could not extract text. No .text or valid .parts found.")
-                return ["LLM analysis failed: Unexpected response structure."]
-        except Exception as e:
-            logger.error(f"An unexpected error occurred accessing LLM response text: {e}")
-            return ["LLM analysis failed: Error reading response."]
-        finally:
-             logger.debug("--- LLM Raw Response End ---")
-
-        # Process the extracted text
-        if extracted_text:
-            titles = [line.strip() for line in extracted_text.split('\n') if line.strip()]
-            titles = [title for title in titles if 3 < len(title) < 150]
-            logger.debug(f"Processed titles: {titles}")
-            return titles if titles else ["No valid book titles identified by LLM."]
+
+def _detection_failure(e, partial=False):
+    """Log an error from a model call and return the status message to report.
+
+    Returns None when generation stopped or failed after ``partial`` results
+    were parsed; the caller keeps those instead.
+    """
+    if isinstance(e, gemini_error('BlockedPromptException')):
+        logger.error(f"LLM Error: Prompt was blocked by API - {e}")
+        return "LLM analysis failed: Prompt blocked by safety filters."
+    if isinstance(e, gemini_error('StopCandidateException')):
+        logger.error(f"LLM Error: Generation stopped unexpectedly - {e}")
+        return None if partial else "LLM analysis failed: Generation stopped prematurely."
+    # Network issues, image errors and other failures
+    logger.error(f"Generic error during LLM book detection: {str(e)}")
+    return None if partial else f"Error during LLM analysis: {str(e)}"
+
+
+def _titles_from_response(response):
+    """Extract the list of titles (or a status message) from a text-mode response."""
+    # Debugging: Log the raw response for inspection
+    logger.debug("--- LLM Raw Response Start ---")
+    extracted_text = "" # Initialize default value
+    try:
+        # Check for safety blocks before accessing text
+        # Accessing prompt_feedback raises AttributeError if no safety settings block it
+        if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
+            logger.warning(f"LLM Prompt Blocked: {response.prompt_feedback.block_reason}")
+            logger.debug(f"Safety Ratings: {response.prompt_feedback.safety_ratings}")
+            return [f"LLM analysis failed: Blocked by safety filter ({response.prompt_feedback.block_reason})"]
+
+        # Check if response candidate finished properly
+        if not response.candidates or response.candidates[0].finish_reason != 1: # 1 = STOP
+             logger.warning(f"LLM Warning: Response did not finish normally. Reason: {response.candidates[0].finish_reason if response.candidates else 'Unknown'}")
+             # Potentially still try to access text, but be aware it might be incomplete
+
+        extracted_text = response.text
+        logger.debug(extracted_text)
+    except ValueError as ve:
+        # This might indicate issues during text generation itself
+        logger.error(f"ValueError accessing response text: {ve}")
+        # Log feedback if available
+        if hasattr(response, 'prompt_feedback'):
+             logger.debug(f"Prompt Feedback: {response.prompt_feedback}")
+        return ["LLM analysis blocked (Safety/Invalid Response)"]
+    except AttributeError as ae:
+        # Fallback if response.text doesn't exist - check prompt_feedback first
+        if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
+             # If it was blocked, we already handled it above or should have
+             logger.warning(f"AttributeError accessing text, but prompt feedback indicates block: {response.prompt_feedback.block_reason}")
+             # Return the block reason if available
+             return [f"LLM analysis failed: Blocked by safety filter ({response.prompt_feedback.block_reason})"]
+
+        logger.error(f"AttributeError accessing response text: {ae}. Checking parts...")
+        if hasattr(response, 'parts') and response.parts:
+            try:
+                extracted_text = '\n'.join(part.text for part in response.parts if hasattr(part, 'text'))
+                logger.debug(f"Extracted from parts: {extracted_text}")
+            except Exception as part_err:
+                logger.error(f"Error extracting text from parts: {part_err}")
+                return ["LLM analysis failed: Error parsing response parts."]
         else:
-            logger.warning("LLM response processing yielded no text. Check raw response above.")
-            return ["LLM analysis returned no parseable text."]
-
-    # Specific exception handling for Google AI library
-    except genai.types.BlockedPromptException as bpe:
-        logger.error(f"LLM Error: Prompt was blocked by API - {bpe}")
-        return ["LLM analysis failed: Prompt blocked by safety filters."]
-    except genai.types.StopCandidateException as sce:
-        logger.error(f"LLM Error: Generation stopped unexpectedly - {sce}")
-        return ["LLM analysis failed: Generation stopped prematurely."]
+            logger.error("Could not extract text. No .text or valid .parts found.")
+            return ["LLM analysis failed: Unexpected response structure."]
     except Exception as e:
-        # Catch other potential errors (e.g., network issues, image opening errors)
-        logger.error(f"Generic error during LLM book detection: {str(e)}")
-        return [f"Error during LLM analysis: {str(e)}"]
+        logger.error(f"An unexpected error occurred accessing LLM response text: {e}")
+        return ["LLM analysis failed: Error reading response."]
+    finally:
+         logger.debug("--- LLM Raw Response End ---")
+
+    # Process the extracted text
+    if extracted_text:
+        titles = [line.strip() for line in extracted_text.split('\n') if line.strip()]
+        titles = [title for title in titles if 3 < len(title) < 150]
+        logger.debug(f"Processed titles: {titles}")
+        return titles if titles else ["No valid book titles identified by LLM."]
+    else:
+        logger.warning("LLM response processing yielded no text. Check raw response above.")
+        return ["LLM analysis returned no parseable text."]
+
+def _search_term(book):
+    """Turn a detection into a provider query: title+author when the author is known."""
+    if isinstance(book, dict):
+        return BookQuery(book['title'], book['author']) if book.get('author') else book['title']
+    return book
+
 
 def get_recommendations(detected_books):
     """
     Get book recommendations based on detected books from LLM.
-    Enhances recommendations by searching based on categories of initial results.
+    Accepts title strings or detection dicts; books with a detected author
+    are searched with precise title+author queries.
+    The configured providers (see backend/providers.py) are queried stage by stage:
+    title searches first, then category searches based on the categories of the
+    initial results. Their results are merged, deduplicated and ranked.
     """
-    recommendations = []
-    unique_titles_found = set() # Avoid duplicate recommendations
+    search_terms = _search_terms(detected_books)
+    if not search_terms:
+        logger.info("No valid books detected to search for recommendations. Returning samples.")
+        return list(SAMPLE_RECOMMENDATIONS)
 
-    # Sample recommendations for fallback cases
-    sample_recs = [
-        {
-            'title': 'Sample Rec: The Hitchhiker\'s Guide',
-            'authors': ['Douglas Adams'], 'description': 'A hilarious sci-fi adventure...','image': '',
-            'publisher': 'Pan Books', 'publishedDate': '1979', 'pageCount': 180, 'categories': ['Fiction'], 'language': 'en', 'previewLink': ''
-        },
-        {
-            'title': 'Sample Rec: Sapiens',
-            'authors': ['Yuval Noah Harari'], 'description': 'A brief history of humankind...','image': '',
-            'publisher': 'Harvill Secker', 'publishedDate': '2011', 'pageCount': 464, 'categories': ['History'], 'language': 'en', 'previewLink': ''
-        }
-    ]
+    try:
+        with recommendation_seconds.time(path='sync'):
+            recommendations = get_recommendation_pipeline().recommend(search_terms)
+    except Exception as e:
+        logger.error(f"Unexpected error while collecting recommendations: {str(e)}")
+        recommendations = []
+    return _with_fallback(recommendations)
 
-    # Filter out error messages or non-book strings from detection results
-    valid_books = [book for book in detected_books 
-                   if book and 
-                   not book.lower().startswith("error") and 
-                   not book.lower().startswith("llm analysis") and 
-                   not book.lower().startswith("no valid book titles")]
-    
-    if not valid_books:
-        logger.info("No valid books detected to search for recommendations. Returning samples.")
-        return sample_recs
 
-    # --- Initial Search based on Titles --- 
-    max_search_terms = 5 # Use up to 5 detected books
-    search_terms = valid_books[:max_search_terms]
-    logger.info(f"Phase 2.1: Getting recommendations based on detected books: {search_terms}")
+# Sample recommendations for fallback cases
+SAMPLE_RECOMMENDATIONS = [
+    {
+        'title': 'Sample Rec: The Hitchhiker\'s Guide',
+        'authors': ['Douglas Adams'], 'description': 'A hilarious sci-fi adventure...','image': '',
+        'publisher': 'Pan Books', 'publishedDate': '1979', 'pageCount': 180, 'categories': ['Fiction'], 'language': 'en', 'previewLink': ''
+    },
+    {
+        'title': 'Sample Rec: Sapiens',
+        'authors': ['Yuval Noah Harari'], 'description': 'A brief history of humankind...','image': '',
+        'publisher': 'Harvill Secker', 'publishedDate': '2011', 'pageCount': 464, 'categories': ['History'], 'language': 'en', 'previewLink': ''
+    }
+]
 
-    initial_categories = set() # Collect categories from initial results
 
+def _search_terms(detected_books):
+    """Return up to MAX_SEARCH_TERMS provider queries, skipping messages and title variants."""
+    # Filter out error messages or non-book strings from detection results
+    valid_books = []
+    seen_titles = TitleIndex.from_env()  # Skip variants of a title already queued for searching
+    for book in detected_books:
+        title = book['title'] if isinstance(book, dict) else book
+        if title and not _is_detection_message(title) and seen_titles.add_if_new(title):
+            valid_books.append(_search_term(book))
+    search_terms = valid_books[:MAX_SEARCH_TERMS]
+    if search_terms:
+        logger.info(f"Getting recommendations based on detected books: {[str(t) for t in search_terms]}")
+    return search_terms
+
+
+def _with_fallback(recommendations):
+    # --- Final Fallback & Return --- 
+    if not recommendations:
+        logger.info("Could not find any recommendations after all searches. Returning samples.")
+        return list(SAMPLE_RECOMMENDATIONS)
+
+    logger.info(f"Returning final {len(recommendations)} recommendations.")
+    return recommendations
+
+# --- Async Upload Path ---
+# Coroutine forms of detection and recommendation for upload_file_async. Only
+# the model and provider calls differ: they are awaited instead of blocking a
+# thread. Image checks, tiling, response parsing and error mapping are the
+# helpers of the sync functions above, as are the LLM concurrency limit, image
+# coalescing and provider caches.
+
+async def detect_books_detailed_async(image_path, on_book=None):
+    """Coroutine form of detect_books_detailed."""
+    image_key, error = _detection_key(image_path)
+    if error:
+        return error
+    with detection_seconds.time(path='async'):
+        detections = await detection_flight.do_async(image_key,
+                                                     lambda: _run_llm_detection_async(image_path, on_book))
+    return [dict(d) for d in detections]
+
+
+async def _run_llm_detection_async(image_path, on_book=None):
+    img, tiles, error = _open_for_detection(image_path)
+    if error:
+        return error
+    if tiles is None:
+        return await _detect_books_in_image_async(img, on_book)
+    results = await asyncio.gather(*(_detect_books_in_image_async(tile, on_book) for tile in tiles))
+    return _merge_tile_detections(results)
+
+
+async def _detect_books_in_image_async(img, on_book=None):
+    if detection_output == 'json':
+        return await _detect_books_structured_async(img, on_book)
+    return _report_titles(await _detect_titles_in_image_async(img), on_book)
+
+
+async def _detect_books_structured_async(img, on_book=None):
+    books = []
+    parser = JSONArrayStreamParser()
     try:
-        for search_term in search_terms:
-            if len(recommendations) >= 6: 
-                break
-            
-            logger.debug(f"Querying Google Books for title: {search_term}")
-            quoted_search_term = requests.utils.quote(search_term)
-            # More results per query initially to gather categories
-            response = requests.get(
-                f"https://www.googleapis.com/books/v1/volumes?q={quoted_search_term}&maxResults=8&orderBy=relevance&printType=books" 
+        async with llm_executor.async_slot():
+            response = await llm_model.generate_content_async(
+                [STRUCTURED_DETECTION_PROMPT, img],
+                safety_settings=DETECTION_SAFETY_SETTINGS,
+                generation_config=STRUCTURED_GENERATION_CONFIG,
+                stream=True,
             )
-            response.raise_for_status() 
-            
-            books_data = response.json()
-            
-            if 'items' in books_data:
-                for item in books_data['items']:
-                    if len(recommendations) >= 6:
-                        break 
-                        
-                    volume_info = item.get('volumeInfo', {})
-                    title = volume_info.get('title', 'Unknown Title')
-                    authors = volume_info.get('authors', ['Unknown Author'])
-                    categories = volume_info.get('categories', [])
-                    
-                    normalized_title = title.lower()
-                    normalized_search_term = search_term.lower()
-                    is_self_recommendation = normalized_search_term == normalized_title
-                    
-                    if title != 'Unknown Title' and normalized_title not in unique_titles_found and not is_self_recommendation:
-                        unique_titles_found.add(normalized_title)
-                        
-                        # Add book to recommendations
-                        book = {
-                            'title': title,
-                            'authors': authors,
-                            'description': volume_info.get('description', 'No description available.')[:250] + '...' if volume_info.get('description') else 'No description available.',
-                            'image': volume_info.get('imageLinks', {}).get('thumbnail', ''),
-                            'publisher': volume_info.get('publisher', ''),
-                            'publishedDate': volume_info.get('publishedDate', ''),
-                            'pageCount': volume_info.get('pageCount', 0),
-                            'categories': categories,
-                            'language': volume_info.get('language', ''),
-                            'previewLink': volume_info.get('previewLink', '')
-                        }
-                        recommendations.append(book)
-                        logger.debug(f"Added recommendation (from title search): {title}")
-                        
-                        # Collect categories for phase 2 search
-                        if categories:
-                            initial_categories.update(cat.lower() for cat in categories)
-                            
-                    # (Keep logging for skipped books)
-                    # ... existing logging logic ...
-                         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error querying Google Books API (Initial Search): {str(e)}")
-    except Exception as e:
-        logger.error(f"Unexpected error processing initial recommendations: {str(e)}")
-
-    # --- Phase 2.2: Category-Based Search --- 
-    logger.debug(f"Phase 2.2: Found initial categories: {initial_categories}")
-    if len(recommendations) < 6 and initial_categories:
-        # Limit the number of category searches to avoid too many API calls
-        category_search_limit = 3
-        categories_to_search = list(initial_categories)[:category_search_limit]
-        logger.debug(f"Searching based on categories: {categories_to_search}")
+            blocked = _blocked_stream_message(response)
+            if blocked:
+                return [_as_detection(blocked)]
 
-        try:
-            for category in categories_to_search:
-                if len(recommendations) >= 6:
+            async for chunk in response:
+                if not _feed_structured_chunk(parser, chunk, books, on_book):
                     break
-                
-                # Construct category search query (e.g., subject:Fiction)
-                # Note: Google Books API uses 'subject:' for category searches
-                category_query = f"subject:{category}"
-                logger.debug(f"Querying Google Books for category: {category_query}")
-                quoted_category_query = requests.utils.quote(category_query)
-                
-                # Fetch a few books for this category
-                response = requests.get(
-                   f"https://www.googleapis.com/books/v1/volumes?q={quoted_category_query}&maxResults=5&orderBy=relevance&printType=books"
-                )
-                response.raise_for_status()
-                
-                books_data = response.json()
-
-                if 'items' in books_data:
-                    for item in books_data['items']:
-                        if len(recommendations) >= 6:
-                            break
-                            
-                        volume_info = item.get('volumeInfo', {})
-                        title = volume_info.get('title', 'Unknown Title')
-                        authors = volume_info.get('authors', ['Unknown Author'])
-                        
-                        normalized_title = title.lower()
-                        
-                        # Check if valid title and not already recommended (less strict on self-rec here)
-                        if title != 'Unknown Title' and normalized_title not in unique_titles_found:
-                            unique_titles_found.add(normalized_title)
-                            
-                            book = {
-                                'title': title,
-                                'authors': authors,
-                                'description': volume_info.get('description', 'No description available.')[:250] + '...' if volume_info.get('description') else 'No description available.',
-                                'image': volume_info.get('imageLinks', {}).get('thumbnail', ''),
-                                'publisher': volume_info.get('publisher', ''),
-                                'publishedDate': volume_info.get('publishedDate', ''),
-                                'pageCount': volume_info.get('pageCount', 0),
-                                'categories': volume_info.get('categories', []),
-                                'language': volume_info.get('language', ''),
-                                'previewLink': volume_info.get('previewLink', '')
-                            }
-                            recommendations.append(book)
-                            logger.debug(f"Added recommendation (from category search '{category}'): {title}")
-                        # (Optional: Log skipped category results)
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error querying Google Books API (Category Search): {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected error processing category recommendations: {str(e)}")
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        message = _detection_failure(e, partial=bool(books))
+        if message:
+            return [_as_detection(message)]
+    return _structured_result(books)
 
-    # --- Phase 2.3: Open Library Search (Experimental) ---
-    # Try Open Library if we still need more recommendations
-    if len(recommendations) < 6:
-        logger.debug("Phase 2.3: Trying Open Library search as fallback/supplement.")
-        try:
-            # Use the same initial search terms 
-            for search_term in search_terms: 
-                if len(recommendations) >= 6:
-                    break
 
-                logger.debug(f"Querying Open Library for: {search_term}")
-                # Open Library Search API endpoint
-                ol_search_url = f"https://openlibrary.org/search.json?q={requests.utils.quote(search_term)}&limit=3" 
-                response_ol = requests.get(ol_search_url, timeout=10) # Add timeout
-                response_ol.raise_for_status()
-                ol_data = response_ol.json()
-
-                if 'docs' in ol_data:
-                    for doc in ol_data['docs']: 
-                        if len(recommendations) >= 6:
-                            break
-
-                        title = doc.get('title', 'Unknown Title')
-                        authors = doc.get('author_name', ['Unknown Author'])
-                        normalized_title = title.lower()
-                        
-                        # Check if valid title and not already found
-                        if title != 'Unknown Title' and normalized_title not in unique_titles_found:
-                            unique_titles_found.add(normalized_title)
-
-                            # Extract additional details (may require more API calls or parsing)
-                            # Cover images often use OLID/ISBN: https://openlibrary.org/dev/docs/api/covers
-                            cover_id = doc.get('cover_i', None)
-                            image_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else ''
-                            
-                            # Get description (might require separate Works API call using doc['key'])
-                            description = doc.get('first_sentence_value', 'No description available.')[:250] + '...' if doc.get('first_sentence_value') else 'No description available.'
-
-                            book = {
-                                'title': title,
-                                'authors': authors,
-                                'description': description,
-                                'image': image_url,
-                                'publisher': ", ".join(doc.get('publisher', [])[:2]), # Limit publishers shown
-                                'publishedDate': str(doc.get('first_publish_year', '')),
-                                'pageCount': doc.get('number_of_pages_median', 0),
-                                'categories': doc.get('subject', [])[:5], # Limit subjects shown
-                                'language': ", ".join(doc.get('language', [])[:2]),
-                                'previewLink': f"https://openlibrary.org{doc.get('key', '')}" if doc.get('key') else ''
-                            }
-                            recommendations.append(book)
-                            logger.debug(f"Added recommendation (from Open Library search): {title}")
-                        else:
-                             if title == 'Unknown Title':
-                                 logger.debug("Skipped OL item: Unknown Title")
-                             elif normalized_title in unique_titles_found:
-                                 logger.debug(f"Skipped OL item (duplicate rec): {title}")
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error querying Open Library API: {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected error processing Open Library recommendations: {str(e)}")
+async def _detect_titles_in_image_async(img):
+    try:
+        async with llm_executor.async_slot():
+            response = await llm_model.generate_content_async(
+                [TITLE_DETECTION_PROMPT, img],
+                safety_settings=DETECTION_SAFETY_SETTINGS,
+            )
+        return _titles_from_response(response)
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        return [_detection_failure(e)]
 
-    # --- Final Fallback & Return --- 
-    if not recommendations:
-        logger.info("Could not find any recommendations after all searches. Returning samples.")
-        return sample_recs
 
-    # Ensure the final list does not exceed the limit
-    logger.info(f"Returning final {len(recommendations[:6])} recommendations.")
-    return recommendations[:6]
+async def get_recommendations_async(detected_books):
+    """Coroutine form of get_recommendations; each stage's queries run concurrently."""
+    search_terms = _search_terms(detected_books)
+    if not search_terms:
+        logger.info("No valid books detected to search for recommendations. Returning samples.")
+        return list(SAMPLE_RECOMMENDATIONS)
+
+    try:
+        with recommendation_seconds.time(path='async'):
+            recommendations = await get_recommendation_pipeline().recommend_async(search_terms)
+    except Exception as e:
+        logger.error(f"Unexpected error while collecting recommendations: {str(e)}")
+        recommendations = []
+    return _with_fallback(recommendations)
+# --- End Async Upload Path ---
 
 if __name__ == '__main__':
-    with app.app_context():
-        # Create database tables if they don't exist
-        # Note: For more complex migrations later, consider Flask-Migrate
-        db.create_all()
-        logger.info(f"Database {DB_NAME} initialized/checked.")
+    create_app(warm=True)
+    init_database()
     
     logger.info("Starting Bookshelf Recommender Backend...")
     logger.info("----------------------------------------")
-    # Check for API key presence on startup
-    if not api_key:
+    # Check the detection backend on startup
+    if detection_backend.name == 'local':
+        logger.info("Local stand-in detection backend ready (DETECTION_BACKEND=local).")
+    elif not os.getenv('GOOGLE_API_KEY'):
         logger.warning("*** WARNING: GOOGLE_API_KEY not found in backend/.env ***")
         logger.warning("*** Image analysis will fail. Please create .env file. ***")
     else:
         logger.info("GOOGLE_API_KEY found.")
-        if not llm_model:
+        if not detection_backend.available:
             logger.warning("*** WARNING: Failed to initialize Gemini Model. Check API Key and backend logs. ***")
         else:
-            logger.info("Gemini Model (gemini-1.5-flash) ready.")
+            logger.info(f"Gemini Model ({detection_backend.model_name}) ready.")
     logger.info("----------------------------------------")
     logger.info("Requirements reminder:")
     logger.info("- Ensure GOOGLE_API_KEY is set in backend/.env")
     logger.info("- Run: pip install -r backend/requirements.txt")
+    logger.info("- For production, serve with: python -m backend.serve")
     logger.info("----------------------------------------")
     app.run(debug=True, port=5001)
@@ -0,0 +1,302 @@
+"""Detection model backends.
+
+``detect_books_with_llm`` talks to a backend exposing ``generate_content``,
+the same call shape as ``google.generativeai.GenerativeModel``. The Gemini
+backend wraps the real model; the local backend is a deterministic stand-in
+returning canned or fixture-driven titles with configurable latency and error
+injection, so the upload pipeline can run and be benchmarked offline.
+The backend is chosen with the ``DETECTION_BACKEND`` environment variable.
+
+With ``DETECTION_OUTPUT=json`` the model is asked for structured output
+(title, author and confidence per book, following ``DETECTION_SCHEMA``) and
+the response is streamed, so books can be used before generation finishes.
+
+``generate_content_async`` is the awaitable form used by the async upload
+path: Gemini's native async API, and ``asyncio.sleep`` for the stand-in's
+latency. A streamed async response is consumed with ``async for``.
+
+The Gemini client is created on first use rather than on import; see
+``GeminiBackend``.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+DEFAULT_LOCAL_TITLES = ['The Hobbit', 'Dune', 'Pride and Prejudice', 'Neuromancer', 'The Left Hand of Darkness']
+
+STRUCTURED_DETECTION_PROMPT = (
+    "Your task is to identify the books in the provided image of a bookshelf. "
+    "Read the titles and, where visible, the author names on the spines or covers. "
+    "Return a JSON array with one object per distinct book, in shelf order, each with "
+    "\"title\" (string), \"author\" (string, or null if not legible) and \"confidence\" "
+    "(number from 0 to 1 expressing how sure you are of the title). "
+    "Do NOT include publisher logos or series names unless part of the title."
+)
+
+# OpenAPI-style schema accepted by Gemini's ``response_schema``
+DETECTION_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'author': {'type': 'string', 'nullable': True},
+            'confidence': {'type': 'number'},
+        },
+        'required': ['title'],
+    },
+}
+
+STRUCTURED_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': DETECTION_SCHEMA,
+}
+
+
+def normalize_detection(item, min_confidence=0.0):
+    """Validate one structured detection and return ``{title, author, confidence}``.
+
+    Returns None for items without a plausible title or below ``min_confidence``.
+    Titles get the same length filter as free-text detection.
+    """
+    if isinstance(item, str):
+        item = {'title': item}
+    if not isinstance(item, dict):
+        return None
+    title = item.get('title')
+    if not isinstance(title, str) or not 3 < len(title.strip()) < 150:
+        return None
+    author = item.get('author')
+    if not isinstance(author, str) or not author.strip() or author.strip().lower() in ('unknown', 'null', 'n/a'):
+        author = None
+    confidence = item.get('confidence')
+    try:
+        confidence = min(1.0, max(0.0, float(confidence))) if confidence is not None else None
+    except (TypeError, ValueError):
+        confidence = None
+    if confidence is not None and confidence < min_confidence:
+        return None
+    return {'title': title.strip(), 'author': author.strip() if author else None, 'confidence': confidence}
+
+
+class DetectionBackend:
+    """Interface for models that turn a shelf image into text."""
+    name = 'base'
+    available = False
+
+    def generate_content(self, contents, **kwargs):
+        raise NotImplementedError
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await asyncio.to_thread(self.generate_content, contents, **kwargs)
+
+
+class GeminiBackend(DetectionBackend):
+    """Google Gemini Vision model.
+
+    ``google.generativeai`` is imported and the model created on first use
+    (or by ``load``), so processes that never analyse an image skip both.
+    """
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name=GEMINI_MODEL_NAME):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._failed = False
+        self._lock = threading.Lock()
+        if not api_key:
+            logger.error("GOOGLE_API_KEY not found in environment. Uploads will be disabled.")
+
+    @property
+    def available(self):
+        return bool(self.api_key) and not self._failed
+
+    def load(self):
+        """Create the model if it does not exist yet; returns None if that fails."""
+        if self._model is None and self.available:
+            with self._lock:
+                if self._model is None and not self._failed:
+                    try:
+                        import google.generativeai as genai
+                        genai.configure(api_key=self.api_key)
+                        logger.info("Gemini API Key configured successfully.")
+                        # Using gemini-1.5-flash as it's fast and suitable for this kind of task
+                        self._model = genai.GenerativeModel(self.model_name)
+                        logger.info(f"Gemini model ({self.model_name}) loaded successfully.")
+                    except Exception as e:
+                        logger.error(f"Error initializing Gemini model: {e}")
+                        self._failed = True
+        return self._model
+
+    @property
+    def model(self):
+        model = self.load()
+        if model is None:
+            raise RuntimeError('Gemini model is not available')
+        return model
+
+    def generate_content(self, contents, **kwargs):
+        return self.model.generate_content(contents, **kwargs)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await self.model.generate_content_async(contents, **kwargs)
+
+
+class _NotRaised(Exception):
+    """Stands in for Gemini exception types before the Gemini client is loaded."""
+
+
+def gemini_error(name):
+    """Return the exception class ``google.generativeai.types.<name>``.
+
+    Only a loaded Gemini client raises these, so until ``google.generativeai``
+    has been imported a placeholder that is never raised is returned instead.
+    """
+    genai = sys.modules.get('google.generativeai')
+    return getattr(genai.types, name) if genai is not None else _NotRaised
+
+
+class LocalDetectionError(Exception):
+    """Error injected by the local backend to simulate upstream failures."""
+
+
+class LocalBackend(DetectionBackend):
+    """Deterministic offline stand-in for the detection model.
+
+    Args:
+        title_sets (list[list]): Books returned per call, cycled in order. Each
+            book is a title string or a ``{title, author, confidence}`` dict.
+        latency (float): Seconds to sleep per call.
+        jitter (float): Extra random latency, up to this many seconds.
+        error_rate (float): Probability (0-1) of raising ``LocalDetectionError``.
+        seed (int): Seed for the jitter/error random generator.
+        chunk_delay (float): Seconds between chunks of a streamed response.
+    """
+    name = 'local'
+    available = True
+
+    def __init__(self, title_sets=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, chunk_delay=0.0):
+        self.title_sets = title_sets or [DEFAULT_LOCAL_TITLES]
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._cycle = itertools.cycle(self.title_sets)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build the stand-in from ``LOCAL_DETECTION_*`` settings.
+
+        ``LOCAL_DETECTION_FIXTURE`` may point at a JSON file holding either a
+        list of books or a list of book lists (one per call, cycled); a book
+        is a title or a ``{"title", "author", "confidence"}`` object.
+        ``LOCAL_DETECTION_TITLES`` is a ``|``-separated list used otherwise.
+        """
+        title_sets = None
+        fixture_path = os.getenv('LOCAL_DETECTION_FIXTURE')
+        if fixture_path:
+            with open(fixture_path) as f:
+                data = json.load(f)
+            title_sets = data if data and isinstance(data[0], list) else [data]
+        elif os.getenv('LOCAL_DETECTION_TITLES'):
+            title_sets = [[t.strip() for t in os.getenv('LOCAL_DETECTION_TITLES').split('|') if t.strip()]]
+        return cls(
+            title_sets=title_sets,
+            latency=float(os.getenv('LOCAL_DETECTION_LATENCY_MS', '0')) / 1000.0,
+            jitter=float(os.getenv('LOCAL_DETECTION_JITTER_MS', '0')) / 1000.0,
+            error_rate=float(os.getenv('LOCAL_DETECTION_ERROR_RATE', '0')),
+            seed=int(os.getenv('LOCAL_DETECTION_SEED', '0')),
+            chunk_delay=float(os.getenv('LOCAL_DETECTION_CHUNK_DELAY_MS', '0')) / 1000.0,
+        )
+
+    def _next_call(self):
+        """Return ``(books, delay, fail)`` for the next call."""
+        with self._lock:
+            self.calls += 1
+            titles = next(self._cycle)
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        return titles, delay, fail
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        titles, delay, fail = self._next_call()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise LocalDetectionError('429 Resource has been exhausted (injected by local backend)')
+        return self._respond(titles, generation_config, stream)
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False, **kwargs):
+        titles, delay, fail = self._next_call()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise LocalDetectionError('429 Resource has been exhausted (injected by local backend)')
+        return self._respond(titles, generation_config, stream)
+
+    def _respond(self, titles, generation_config, stream):
+        if (generation_config or {}).get('response_mime_type') == 'application/json':
+            books = [b if isinstance(b, dict) else {'title': b, 'author': None, 'confidence': 0.9} for b in titles]
+            text = json.dumps(books)
+        else:
+            text = '\n'.join(b['title'] if isinstance(b, dict) else b for b in titles)
+        if stream:
+            # Split into a few chunks, roughly like a token stream
+            size = max(1, len(text) // 4)
+            return _LocalStream([text[i:i + size] for i in range(0, len(text), size)], self.chunk_delay)
+        return _local_response(text)
+
+
+def _local_response(text):
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(finish_reason=1)],
+        prompt_feedback=SimpleNamespace(block_reason=None, safety_ratings=[]),
+    )
+
+
+class _LocalStream:
+    """Iterable (sync or async) of response chunks mimicking a streamed ``generate_content`` result."""
+
+    def __init__(self, chunks, chunk_delay=0.0):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.candidates = [SimpleNamespace(finish_reason=1)]
+        self.prompt_feedback = SimpleNamespace(block_reason=None, safety_ratings=[])
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield _local_response(chunk)
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield _local_response(chunk)
+
+
+def create_detection_backend():
+    """Return the backend selected by ``DETECTION_BACKEND`` (default ``gemini``)."""
+    name = os.getenv('DETECTION_BACKEND', 'gemini').lower()
+    if name == 'local':
+        logger.info("Using the local stand-in detection backend.")
+        return LocalBackend.from_env()
+    if name != 'gemini':
+        logger.warning(f"Unknown DETECTION_BACKEND '{name}'. Falling back to gemini.")
+    return GeminiBackend(os.getenv('GOOGLE_API_KEY'))
@@ -0,0 +1,144 @@
+"""Response shaping: sparse fieldsets, compact encodings and compression.
+
+Large shelves are expensive to ship as one verbose JSON object per book.
+Clients can ask for a subset of fields (``?fields=id,title``), a compact
+representation negotiated with the ``Accept`` header (MessagePack when the
+optional ``msgpack`` package is installed, or columnar JSON where rows are
+arrays under a single ``columns`` list), and responses above a size
+threshold are compressed with brotli (optional ``brotli`` package) or gzip.
+"""
+import gzip
+import logging
+import os
+from datetime import date
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.bookshelf.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+COMPRESSIBLE_MIMETYPES = (JSON_MIMETYPE, COLUMNAR_MIMETYPE, MSGPACK_MIMETYPE)
+
+
+class FieldsError(ValueError):
+    """Raised when ``fields`` names a field the resource does not have."""
+
+
+def parse_fields(value, allowed):
+    """Parse a ``fields`` query value into an ordered list of allowed names.
+
+    Returns all of ``allowed`` when ``value`` is empty.
+
+    Raises:
+        FieldsError: if a requested field is unknown.
+    """
+    if not value:
+        return list(allowed)
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in allowed:
+            raise FieldsError(f"Unknown field '{name}'. Allowed: {', '.join(allowed)}")
+        fields.append(name)
+    return fields or list(allowed)
+
+
+def available_encodings():
+    """Mimetypes the server can produce, in order of preference for ties."""
+    encodings = [JSON_MIMETYPE, COLUMNAR_MIMETYPE]
+    if msgpack is not None:
+        encodings.append(MSGPACK_MIMETYPE)
+    return encodings
+
+
+def negotiate_encoding(accept_mimetypes):
+    """Pick the response mimetype from a werkzeug ``MIMEAccept``; JSON by default."""
+    if not accept_mimetypes:
+        return JSON_MIMETYPE
+    return accept_mimetypes.best_match(available_encodings(), default=JSON_MIMETYPE)
+
+
+def encode_rows(rows, fields, mimetype):
+    """Return rows (tuples ordered like ``fields``) in the shape the encoding expects."""
+    if mimetype == COLUMNAR_MIMETYPE:
+        return {'columns': list(fields), 'rows': [list(row) for row in rows]}
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _msgpack_default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not MessagePack serializable")
+
+
+def pack_msgpack(payload):
+    """Pack a payload as MessagePack, with dates as ISO 8601 strings like the JSON encodings."""
+    return msgpack.packb(payload, use_bin_type=True, default=_msgpack_default)
+
+
+class CompressionConfig:
+    """Settings for compressing responses.
+
+    Args:
+        min_size (int): Bodies smaller than this many bytes are sent as-is.
+        gzip_level (int): gzip compression level (1-9).
+        brotli_quality (int): brotli quality (0-11).
+        enabled (bool): Turn compression off entirely.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, enabled=True):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            min_size=int(os.getenv('COMPRESS_MIN_BYTES', '1024')),
+            gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+            brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '4')),
+            enabled=os.getenv('COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes'),
+        )
+
+
+def compress_response(response, accept_encodings, config):
+    """Compress a Flask response in place when the client and payload allow it.
+
+    Strong ETags become weak, since the compressed bytes differ from the
+    identity encoding; ``If-None-Match`` uses weak comparison anyway.
+    """
+    response.vary.add('Accept-Encoding')
+    if (not config.enabled or response.direct_passthrough or response.is_streamed
+            or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < config.min_size:
+        return response
+
+    if brotli is not None and accept_encodings['br']:
+        compressed, coding = brotli.compress(body, quality=config.brotli_quality), 'br'
+    elif accept_encodings['gzip']:
+        compressed, coding = gzip.compress(body, compresslevel=config.gzip_level), 'gzip'
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,102 @@
+"""Flask JSON providers with a fast serializer and ISO 8601 datetimes.
+
+``OrjsonProvider`` serializes with orjson when it is installed; it writes
+bytes straight into the response without an intermediate ``str``.
+``StdlibJSONProvider`` keeps Flask's ``json`` module based behaviour. Both
+encode ``datetime``/``date`` values as ISO 8601 strings (the format the API
+has always returned via ``isoformat()``), so views can hand datetimes to
+``jsonify`` directly. Output matches between the two apart from non-ASCII
+text, which orjson writes as UTF-8 rather than ``\\u`` escapes.
+"""
+import dataclasses
+import decimal
+import logging
+import os
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _default(o):
+    """Encode the types Flask supports, with dates as ISO 8601 instead of HTTP dates."""
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider, encoding dates as ISO 8601."""
+
+    default = staticmethod(_default)
+    name = 'stdlib'
+
+    def dumps_bytes(self, obj):
+        """Serialize compactly to UTF-8 bytes with a trailing newline, as ``jsonify`` would."""
+        return f"{self.dumps(obj, separators=(',', ':'))}\n".encode('utf-8')
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """Provider serializing with orjson.
+
+    Values orjson rejects (such as integers wider than 64 bits) fall back to
+    the stdlib encoder, so switching providers never changes which payloads
+    can be returned.
+    """
+
+    name = 'orjson'
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=_default, option=self._options(indent))
+        except TypeError:
+            kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+            return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def dumps_bytes(self, obj):
+        return self._encode(obj) + b'\n'
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self._encode(obj, indent=indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def create_json_provider(app, name=None):
+    """Return the provider selected by ``name`` or ``JSON_PROVIDER`` (auto, orjson, stdlib)."""
+    name = (name or os.getenv('JSON_PROVIDER', 'auto')).lower()
+    if name == 'stdlib':
+        return StdlibJSONProvider(app)
+    if orjson is None:
+        if name == 'orjson':
+            logger.warning("JSON_PROVIDER=orjson but orjson is not installed; using the stdlib encoder")
+        return StdlibJSONProvider(app)
+    return OrjsonProvider(app)
@@ -0,0 +1,61 @@
+"""Incremental parsing of a JSON array arriving in text chunks.
+
+A streamed model response delivers its JSON a few tokens at a time. The
+parser hands back each element object of the first top-level array as soon
+as its closing brace arrives, so callers can act on early items while the
+rest of the response is still being generated. Text before the array (such
+as a Markdown code fence or a wrapping object key) is ignored.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JSONArrayStreamParser:
+    """Yield the objects of a JSON array as soon as each one is complete."""
+
+    def __init__(self):
+        self.done = False
+        self._depth = 0
+        self._array_depth = None  # Depth inside the array we extract from
+        self._in_string = False
+        self._escape = False
+        self._current = None  # Characters of the object being read
+
+    def feed(self, chunk):
+        """Consume a text chunk and return the objects it completed."""
+        completed = []
+        for char in chunk:
+            if self.done:
+                break
+            if self._current is not None:
+                self._current.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+                if char == '[' and self._array_depth is None:
+                    self._array_depth = self._depth
+                elif char == '{' and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._current = ['{']
+            elif char in ']}':
+                self._depth -= 1
+                if self._current is not None and self._depth == self._array_depth:
+                    text = ''.join(self._current)
+                    self._current = None
+                    try:
+                        completed.append(json.loads(text))
+                    except ValueError:
+                        logger.debug(f"Skipping malformed streamed JSON element: {text[:80]}")
+                elif self._array_depth is not None and self._depth < self._array_depth:
+                    self.done = True
+        return completed
@@ -0,0 +1,209 @@
+"""Bounded, adaptive executor for calls to the detection model.
+
+Upload bursts must not turn into upstream quota errors, so model calls go
+through an ``AdaptiveLLMExecutor``: at most ``limit`` calls run at once, extra
+callers wait in a bounded queue, and the limit adapts AIMD-style (additive
+increase on fast successes, multiplicative decrease on errors or slow
+responses) between ``min_limit`` and ``max_in_flight``.
+
+Threads use ``slot``/``call``; coroutines use ``async_slot``, which waits
+for capacity without blocking the event loop. Both draw on the same limit
+and queue.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloaded(Exception):
+    """Raised when the executor cannot accept a call right now.
+
+    Attributes:
+        retry_after (int): Suggested number of seconds before retrying.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveLLMExecutor:
+    """Concurrency limiter with a bounded wait queue and AIMD limit control."""
+
+    def __init__(self, max_in_flight=4, min_limit=1, max_queue=16, queue_timeout=30.0,
+                 latency_target=20.0, decrease_factor=0.5, is_overload_error=None):
+        self.max_in_flight = max_in_flight
+        self.min_limit = min_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.is_overload_error = is_overload_error or (lambda e: True)
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.successes = 0
+        self.errors = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.avg_latency = None  # Exponentially weighted, in seconds
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) pairs woken on release
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build an executor from ``LLM_*`` environment settings."""
+        return cls(
+            max_in_flight=int(os.getenv('LLM_MAX_IN_FLIGHT', '4')),
+            max_queue=int(os.getenv('LLM_QUEUE_SIZE', '16')),
+            queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '30')),
+            latency_target=float(os.getenv('LLM_LATENCY_TARGET', '20')),
+            **kwargs,
+        )
+
+    def _retry_after(self):
+        """Estimate how long until a queued call would get a slot."""
+        per_call = self.avg_latency if self.avg_latency is not None else 5.0
+        estimate = per_call * (self.waiting + 1) / max(1.0, self.limit)
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def _acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloaded('Image analysis queue is full', self._retry_after())
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise LLMOverloaded('Timed out waiting for image analysis capacity',
+                                            self._retry_after())
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+
+    async def _acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloaded('Image analysis queue is full', self._retry_after())
+            self.waiting += 1
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while True:
+                waiter = loop.create_future()
+                with self._cond:
+                    if self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise LLMOverloaded('Timed out waiting for image analysis capacity',
+                                            self._retry_after())
+                    self._async_waiters.append((loop, waiter))
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass  # Checked again above
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def _release(self, latency, error):
+        with self._cond:
+            self.in_flight -= 1
+            if self.avg_latency is None:
+                self.avg_latency = latency
+            else:
+                self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+            if error is not None:
+                self.errors += 1
+            else:
+                self.successes += 1
+
+            if (error is not None and self.is_overload_error(error)) or latency > self.latency_target:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                logger.warning(f"LLM concurrency limit decreased to {int(self.limit)}")
+            elif error is None:
+                self.limit = min(float(self.max_in_flight), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # The waiter's event loop has already closed
+
+    @contextmanager
+    def slot(self):
+        """Hold one concurrency slot for the duration of the block.
+
+        Raises:
+            LLMOverloaded: if the queue is full or the wait times out.
+        """
+        self._acquire()
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(time.monotonic() - started, error)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Like ``slot``, awaiting capacity instead of blocking the thread."""
+        await self._acquire_async()
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(time.monotonic() - started, error)
+
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` inside a concurrency slot."""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'successes': self.successes,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'avg_latency': self.avg_latency,
+            }
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,318 @@
+"""Counters, gauges and histograms exposed in the Prometheus text format.
+
+Metrics are created once at import time on a ``MetricsRegistry`` (the
+module-level ``REGISTRY`` by default) and updated in place: an update is a
+dict lookup and an addition under a per-metric lock, so timing a hot path
+costs a few microseconds. Values that components already count (cache
+hits, executor queues, breaker states) are not duplicated; a collector
+function reads them when ``/metrics`` is scraped.
+
+``RequestMetrics`` instruments a Flask app: a duration histogram per
+endpoint, method and status, an in-flight gauge and the number of SQL
+statements each request executes.
+
+Values are kept per process. Under ``python -m backend.serve`` each worker
+reports its own numbers; Prometheus aggregates them when every worker is
+scraped (or sums them per instance in queries).
+"""
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers cache hits (milliseconds) up to slow uploads waiting on the model
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Statements per request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # Tuple of label values -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) == len(self.labelnames):
+            try:
+                return tuple([str(labels[name]) for name in self.labelnames])
+            except KeyError:
+                pass
+        raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+
+    def samples(self):
+        """Return ``[(suffix, label names, label values, value)]`` for rendering."""
+        with self._lock:
+            return [('', self.labelnames, key, value) for key, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests or queries."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative ``le`` buckets, with sum and count.
+
+    Args:
+        buckets (tuple): Ascending upper bounds; ``+Inf`` is always added.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)  # First bucket with value <= bound
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum of values
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the ``with`` block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+
+    def sum(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] if state else 0.0
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        bucket_names = self.labelnames + ('le',)
+        samples = []
+        for key, counts, total in states:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', bucket_names, key + (_format_value(bound),), cumulative))
+            samples.append(('_sum', self.labelnames, key, total))
+            samples.append(('_count', self.labelnames, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metrics plus collector functions, rendered together for ``/metrics``.
+
+    A collector is called on every scrape and returns
+    ``[(name, kind, help, [(labels dict, value), ...]), ...]``.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.help)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, names, values, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f'# HELP {name} {_escape_help(help)}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} '
+                                 f'{_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Flask extension recording request duration, status, in-flight requests and SQL statements.
+
+    Requests are labelled with their URL rule (``/api/bookshelves/<int:shelf_id>``),
+    not the raw path, so the number of series stays bounded; unmatched paths
+    share the ``unmatched`` endpoint. Durations run from the first
+    ``before_request`` hook to ``after_request`` (for streamed bodies, up to
+    the start of the body).
+
+    Call ``init_app`` before extensions whose ``before_request`` hooks can
+    reject a request (the rate limiter), so rejected requests are timed too.
+    """
+
+    def __init__(self, app=None, registry=REGISTRY):
+        self.duration = registry.histogram(
+            'bookshelf_http_request_duration_seconds', 'Time to handle a request',
+            ('method', 'endpoint', 'status'))
+        self.in_flight = registry.gauge(
+            'bookshelf_http_requests_in_flight', 'Requests currently being handled')
+        self.queries = registry.histogram(
+            'bookshelf_http_request_sql_queries', 'SQL statements executed per request',
+            ('method', 'endpoint'), buckets=QUERY_COUNT_BUCKETS)
+        self.queries_total = registry.counter(
+            'bookshelf_sql_queries_total', 'SQL statements executed, in and outside of requests')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from flask import g, has_request_context, request
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        def endpoint():
+            return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+        @app.before_request
+        def _start_request_timer():
+            self.in_flight.inc()
+            g._metrics = [time.perf_counter(), 0, False]  # Start, SQL statements, recorded
+
+        def record(state, status):
+            state[2] = True
+            method, rule = request.method, endpoint()
+            self.duration.observe(time.perf_counter() - state[0], method=method, endpoint=rule, status=status)
+            self.queries.observe(state[1], method=method, endpoint=rule)
+
+        @app.after_request
+        def _observe_request(response):
+            state = g.get('_metrics')
+            if state is not None and not state[2]:
+                record(state, response.status_code)
+            return response
+
+        @app.teardown_request
+        def _finish_request(exc):
+            # Popped so a context torn down twice (test clients preserving it) counts once
+            state = g.pop('_metrics', None)
+            if state is not None:
+                if not state[2]:
+                    record(state, 500)  # An exception escaped the error handlers
+                self.in_flight.dec()
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def _count_query(conn, cursor, statement, parameters, context, executemany):
+            self.queries_total.inc()
+            if has_request_context():
+                state = g.get('_metrics')
+                if state is not None:
+                    state[1] += 1
+
+        return self
@@ -0,0 +1,218 @@
+"""Password hashing with a configurable algorithm and a bounded worker pool.
+
+Password hashes are deliberately slow, so a burst of logins can occupy every
+request thread with hashing. ``PasswordHasher`` runs hashing and
+verification on a fixed pool of workers (threads by default; hashlib and
+argon2 release the GIL while hashing), so at most ``workers`` hashes use
+CPU at once and at most ``max_queue`` more wait for one. A caller arriving
+when both are full waits up to ``queue_timeout`` seconds for room and then
+gets ``HasherBusy``.
+
+Supported methods are ``pbkdf2`` (``PASSWORD_HASH_ITERATIONS``), ``scrypt``
+(``PASSWORD_HASH_SCRYPT_N``/``_R``/``_P``) and ``argon2``. ``argon2`` needs
+the optional ``argon2-cffi`` package and falls back to scrypt without it.
+Hashes made with other settings still verify; ``needs_rehash`` reports them
+so they can be upgraded after a successful login.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # Optional dependency
+    argon2 = None
+
+logger = logging.getLogger(__name__)
+
+ARGON2_PREFIX = '$argon2'
+
+
+class HasherBusy(Exception):
+    """Raised when no hashing worker becomes free in time.
+
+    Attributes:
+        retry_after (int): Suggested number of seconds before retrying.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HashSettings:
+    """Algorithm and cost of newly created hashes.
+
+    Args:
+        method (str): ``pbkdf2``, ``scrypt`` or ``argon2``.
+        iterations (int): PBKDF2-SHA256 iterations.
+        scrypt_n (int): scrypt CPU/memory cost (a power of two).
+        scrypt_r (int): scrypt block size.
+        scrypt_p (int): scrypt parallelism.
+        argon2_time_cost (int): argon2 passes.
+        argon2_memory_cost (int): argon2 memory in KiB.
+        argon2_parallelism (int): argon2 lanes.
+    """
+
+    def __init__(self, method='pbkdf2', iterations=1_000_000, scrypt_n=2 ** 15, scrypt_r=8, scrypt_p=1,
+                 argon2_time_cost=3, argon2_memory_cost=65536, argon2_parallelism=4):
+        if method == 'argon2' and argon2 is None:
+            logger.warning("PASSWORD_HASH_METHOD=argon2 but argon2-cffi is not installed; using scrypt")
+            method = 'scrypt'
+        if method not in ('pbkdf2', 'scrypt', 'argon2'):
+            raise ValueError(f"Unknown password hash method '{method}'")
+        self.method = method
+        self.iterations = iterations
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.argon2_time_cost = argon2_time_cost
+        self.argon2_memory_cost = argon2_memory_cost
+        self.argon2_parallelism = argon2_parallelism
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            method=os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2').lower(),
+            iterations=int(os.getenv('PASSWORD_HASH_ITERATIONS', '1000000')),
+            scrypt_n=int(os.getenv('PASSWORD_HASH_SCRYPT_N', str(2 ** 15))),
+            scrypt_r=int(os.getenv('PASSWORD_HASH_SCRYPT_R', '8')),
+            scrypt_p=int(os.getenv('PASSWORD_HASH_SCRYPT_P', '1')),
+            argon2_time_cost=int(os.getenv('PASSWORD_HASH_ARGON2_TIME_COST', '3')),
+            argon2_memory_cost=int(os.getenv('PASSWORD_HASH_ARGON2_MEMORY_KIB', '65536')),
+            argon2_parallelism=int(os.getenv('PASSWORD_HASH_ARGON2_PARALLELISM', '4')),
+        )
+
+    @property
+    def werkzeug_method(self):
+        """The ``generate_password_hash`` method string (prefix of the stored hash)."""
+        if self.method == 'scrypt':
+            return f"scrypt:{self.scrypt_n}:{self.scrypt_r}:{self.scrypt_p}"
+        return f"pbkdf2:sha256:{self.iterations}"
+
+    def label(self):
+        if self.method == 'argon2':
+            return f"argon2:t={self.argon2_time_cost}:m={self.argon2_memory_cost}:p={self.argon2_parallelism}"
+        return self.werkzeug_method
+
+    def _argon2_hasher(self):
+        return argon2.PasswordHasher(time_cost=self.argon2_time_cost, memory_cost=self.argon2_memory_cost,
+                                     parallelism=self.argon2_parallelism)
+
+    def hash(self, password):
+        if self.method == 'argon2':
+            return self._argon2_hasher().hash(password)
+        return generate_password_hash(password, method=self.werkzeug_method)
+
+    def needs_rehash(self, stored):
+        """Return True if ``stored`` was made with another method or cost."""
+        if stored.startswith(ARGON2_PREFIX):
+            return self.method != 'argon2' or self._argon2_hasher().check_needs_rehash(stored)
+        return self.method == 'argon2' or stored.split('$', 1)[0] != self.werkzeug_method
+
+
+def verify_hash(stored, password):
+    """Check a password against a stored werkzeug or argon2 hash."""
+    if not stored:
+        return False
+    if stored.startswith(ARGON2_PREFIX):
+        if argon2 is None:
+            logger.error("Found an argon2 password hash but argon2-cffi is not installed")
+            return False
+        try:
+            return argon2.PasswordHasher().verify(stored, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    return check_password_hash(stored, password)
+
+
+def _hash(settings, password):
+    return settings.hash(password)
+
+
+class PasswordHasher:
+    """Run password hashing and verification on a bounded pool.
+
+    Args:
+        settings (HashSettings): Algorithm and cost for new hashes.
+        workers (int): Hashes computed concurrently.
+        max_queue (int): Callers allowed to wait for a worker.
+        queue_timeout (float): Seconds a caller waits for room in the queue before ``HasherBusy``.
+        use_processes (bool): Use a process pool instead of threads.
+    """
+
+    def __init__(self, settings=None, workers=None, max_queue=64, queue_timeout=10.0, use_processes=False):
+        self.settings = settings or HashSettings()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.use_processes = use_processes
+        self.rehashed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            settings=HashSettings.from_env(),
+            workers=int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or None,
+            max_queue=int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', '64')),
+            queue_timeout=float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '10')),
+            use_processes=os.getenv('PASSWORD_HASH_POOL', 'thread').lower() == 'process',
+        )
+
+    def _pool(self):
+        # Created on first use so importing the app does not start workers
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='password-hash')
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy('Password hashing queue is full', retry_after=max(1, int(self.queue_timeout)))
+        try:
+            return self._pool().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, self.settings, password)
+
+    def verify(self, stored, password):
+        return self._run(verify_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        return self.settings.needs_rehash(stored)
+
+    def record_rehash(self):
+        """Count a stored hash upgraded to the current settings."""
+        with self._lock:
+            self.rehashed += 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.settings.label(),
+                'workers': self.workers,
+                'pool': 'process' if self.use_processes else 'thread',
+                'rehashed': self.rehashed,
+                'rejected': self.rejected,
+            }
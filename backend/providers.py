@@ -0,0 +1,905 @@
+"""Book recommendation providers.
+
+Each provider wraps one external book search API (Google Books title search,
+Google Books category search, Open Library search). Providers are looked up in
+a registry by name so a deployment can reorder, parallelize or disable them
+through environment variables, and every provider gets its own timeout,
+latency budget, circuit breaker and response cache TTL.
+
+``RecommendationPipeline.recommend_async`` is the coroutine form used by the
+async upload path: each stage's queries run as tasks on the caller's event
+loop. Only the upstream call differs between the two paths; breakers,
+latency tracking, hedging, coalescing, the response cache and result
+merging are shared.
+
+HTTP clients are created on first use: one ``requests.Session`` per thread
+(so connections to each API are kept alive between queries). Async searches
+use the ``httpx.AsyncClient`` of the enclosing ``async_http_scope``, which
+the async view opens for one upload (Flask runs each async request on a new
+event loop, so a client cannot outlive the request); without httpx, or
+outside a scope, they run ``requests`` on a worker thread. Neither library
+is imported before then; ``preload_http_clients`` imports them ahead of time.
+"""
+import asyncio
+import contextvars
+import importlib.util
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+# Optional dependency, imported when an async_http_scope opens
+HTTPX_AVAILABLE = importlib.util.find_spec('httpx') is not None
+
+from backend.metrics import REGISTRY as metrics_registry
+from backend.response_cache import TieredCache
+from backend.singleflight import SingleFlight
+from backend.title_matching import TitleIndex, normalize_title
+
+logger = logging.getLogger(__name__)
+
+MAX_RECOMMENDATIONS = 6  # Number of recommendations returned per upload
+DEFAULT_PROVIDERS = 'google_title,google_category,openlibrary'
+
+# Upstream calls only; cache hits and coalesced joins do not reach _fetch
+fetch_seconds = metrics_registry.histogram(
+    'bookshelf_provider_fetch_duration_seconds', 'Time of upstream book API calls by provider and outcome',
+    ('provider', 'outcome'))
+stage_seconds = metrics_registry.histogram(
+    'bookshelf_recommendation_stage_duration_seconds', 'Time to run one stage of the provider pipeline',
+    ('stage',))
+
+
+def _env_float(name, default):
+    """Read a float from the environment, falling back to ``default``."""
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid value for {name}: {value!r}. Using {default}.")
+        return default
+
+
+def _truncate_description(text):
+    """Shorten long descriptions the same way for every provider."""
+    if not text:
+        return 'No description available.'
+    return text[:250] + '...'
+
+
+def make_book(title, authors=None, description=None, image='', publisher='',
+              published_date='', page_count=0, categories=None, language='',
+              preview_link=''):
+    """Build the recommendation dict returned to the frontend."""
+    return {
+        'title': title,
+        'authors': authors or ['Unknown Author'],
+        'description': _truncate_description(description),
+        'image': image,
+        'publisher': publisher,
+        'publishedDate': published_date,
+        'pageCount': page_count,
+        'categories': categories or [],
+        'language': language,
+        'previewLink': preview_link,
+    }
+
+
+class BookQuery(namedtuple('BookQuery', ['title', 'author'])):
+    """A detected title with its author, searched as a precise title+author query.
+
+    Plain strings are still accepted wherever a query is expected.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.title} by {self.author}" if self.author else self.title
+
+
+def query_title(query):
+    """Return the title part of a query (the query itself for plain strings)."""
+    return query.title if isinstance(query, BookQuery) else query
+
+
+class ProviderError(Exception):
+    """Raised when a provider query fails or is skipped by its circuit breaker."""
+
+
+class CircuitBreaker:
+    """Skip a provider after repeated failures until a cool-down period passes.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and all
+    calls are rejected. Once ``reset_timeout`` seconds have passed a single
+    trial call is let through (half-open); its outcome closes or re-opens the
+    breaker.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow_request(self):
+        """Return True if a call may be made right now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies (in seconds) for one provider."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """Return the ``pct`` percentile latency, or None without samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[index]
+
+
+class HedgePolicy:
+    """Decide when to fire a hedge request and keep hedging statistics.
+
+    A hedge is fired once the primary call has been running longer than the
+    provider's ``percentile`` latency. The number of hedges is capped at
+    ``budget_percent`` of all hedgeable calls so hedging cannot multiply load.
+    """
+
+    def __init__(self, percentile=95.0, budget_percent=10.0, min_samples=20, default_delay=1.0):
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_denied = 0
+        self._lock = threading.Lock()
+
+    def delay_for(self, provider):
+        """Seconds to wait on the primary call before hedging."""
+        if len(provider.latency) < self.min_samples:
+            return self.default_delay
+        return provider.latency.percentile(self.percentile)
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire(self):
+        """Reserve a hedge if the extra-request budget allows it."""
+        with self._lock:
+            if (self.hedges + 1) * 100.0 > self.budget_percent * self.requests:
+                self.budget_denied += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def record_winner(self, hedged):
+        with self._lock:
+            if hedged:
+                self.hedge_wins += 1
+            else:
+                self.primary_wins += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges_fired': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'primary_wins_after_hedge': self.primary_wins,
+                'budget_denied': self.budget_denied,
+                'hedge_win_rate': (self.hedge_wins / self.hedges) if self.hedges else 0.0,
+            }
+
+
+# AsyncClient of the enclosing async_http_scope; tasks created inside the scope inherit it
+_async_client = contextvars.ContextVar('provider_async_client', default=None)
+
+_sessions = threading.local()
+
+
+def _http_session():
+    """Return this thread's ``requests.Session``, creating it on first use."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        import requests
+        session = _sessions.session = requests.Session()
+    return session
+
+
+@asynccontextmanager
+async def async_http_scope():
+    """Share one ``httpx.AsyncClient`` among the async searches started in this block.
+
+    The client (and its connections) is closed on exit, so searches must
+    finish inside the block. Without httpx this is a no-op.
+    """
+    if not HTTPX_AVAILABLE:
+        yield
+        return
+    import httpx
+    async with httpx.AsyncClient() as client:
+        token = _async_client.set(client)
+        try:
+            yield
+        finally:
+            _async_client.reset(token)
+
+
+def preload_http_clients():
+    """Import the HTTP client libraries now instead of on the first provider query."""
+    import requests  # noqa: F401
+    if HTTPX_AVAILABLE:
+        import httpx  # noqa: F401
+
+
+# --- Provider Registry ---
+PROVIDER_REGISTRY = {}
+
+
+def register_provider(cls):
+    """Class decorator adding a provider to the registry under ``cls.name``."""
+    PROVIDER_REGISTRY[cls.name] = cls
+    return cls
+# --- End Provider Registry ---
+
+
+class BookProvider:
+    """Base class for an external book search source.
+
+    Subclasses implement ``build_url`` and ``parse``. The base class applies the
+    request timeout and the circuit breaker. Providers in a later ``stage`` run
+    after earlier stages and can use the categories those stages collected.
+    """
+    name = 'base'
+    stage = 1
+    max_queries = 5
+    exclude_self = False  # Skip results whose title equals the query
+    collects_categories = False  # Feed result categories to later stages
+
+    def __init__(self, timeout=5.0, budget=8.0, breaker=None, cache=None, cache_ttl=86400):
+        self.timeout = timeout
+        self.budget = budget
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.latency = LatencyTracker()
+        self.flight = SingleFlight()  # Shares identical in-flight upstream calls
+        self.hedge_target = None  # Provider raced against slow calls, if hedging
+
+    def queries(self, context):
+        """Return the list of query strings this provider should run."""
+        return context['search_terms'][:self.max_queries]
+
+    def build_url(self, query):
+        raise NotImplementedError
+
+    def parse(self, payload):
+        """Convert a decoded JSON payload into a list of book dicts."""
+        raise NotImplementedError
+
+    def fetch_json(self, url, timeout):
+        response = _http_session().get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_json_async(self, url, timeout):
+        client = _async_client.get()
+        if client is None:
+            return await asyncio.to_thread(self.fetch_json, url, timeout)
+        response = await client.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    # --- Shared by the sync and async paths; only the upstream call differs ---
+
+    def _start_fetch(self):
+        if not self.breaker.allow_request():
+            raise ProviderError(f"{self.name}: circuit open, skipping query")
+        return time.monotonic()
+
+    def _fetch_failed(self, started, error):
+        """Record a failed upstream call; returns the ProviderError to raise."""
+        self.breaker.record_failure()
+        fetch_seconds.observe(time.monotonic() - started, provider=self.name, outcome='error')
+        return ProviderError(f"{self.name}: {error}")
+
+    def _fetch_succeeded(self, started):
+        elapsed = time.monotonic() - started
+        self.breaker.record_success()
+        self.latency.record(elapsed)
+        fetch_seconds.observe(elapsed, provider=self.name, outcome='ok')
+
+    def _request(self, query, timeout):
+        """Return ``(url, timeout, key)`` for one query."""
+        url = self.build_url(query)
+        return url, timeout or self.timeout, f"{self.name}:{url}"
+
+    def _parse(self, payload):
+        try:
+            return self.parse(payload)
+        except Exception as e:
+            raise ProviderError(f"{self.name}: could not parse response: {e}") from e
+
+    # --- End shared ---
+
+    def _fetch(self, url, timeout):
+        """Call the upstream API through the circuit breaker."""
+        started = self._start_fetch()
+        try:
+            payload = self.fetch_json(url, timeout)
+        except Exception as e:
+            raise self._fetch_failed(started, e) from e
+        self._fetch_succeeded(started)
+        return payload
+
+    async def _fetch_async(self, url, timeout):
+        started = self._start_fetch()
+        try:
+            payload = await self.fetch_json_async(url, timeout)
+        except Exception as e:
+            raise self._fetch_failed(started, e) from e
+        self._fetch_succeeded(started)
+        return payload
+
+    def search(self, query, timeout=None, coalesce=True):
+        """Run one query and return parsed book dicts.
+
+        Concurrent identical queries share one upstream call unless
+        ``coalesce`` is False (used for hedge requests, which must be real
+        duplicates).
+
+        Raises:
+            ProviderError: if the breaker is open or the request fails.
+        """
+        url, timeout, key = self._request(query, timeout)
+        if coalesce:
+            fetch = lambda: self.flight.do(key, lambda: self._fetch(url, timeout))
+        else:
+            fetch = lambda: self._fetch(url, timeout)
+        if self.cache is None:
+            return self._parse(fetch())
+        return self._parse(self.cache.get_or_fetch(key, fetch, self.cache_ttl))
+
+    async def search_async(self, query, timeout=None, coalesce=True):
+        """Coroutine form of ``search``; joins identical calls from either path."""
+        url, timeout, key = self._request(query, timeout)
+        if coalesce:
+            fetch = lambda: self.flight.do_async(key, lambda: self._fetch_async(url, timeout))
+        else:
+            fetch = lambda: self._fetch_async(url, timeout)
+        if self.cache is None:
+            return self._parse(await fetch())
+        return self._parse(await self.cache.get_or_fetch_async(key, fetch, self.cache_ttl,
+                                                               refresh=lambda: self._fetch(url, timeout)))
+
+
+def _google_volumes_to_books(payload):
+    books = []
+    for item in payload.get('items', []):
+        volume_info = item.get('volumeInfo', {})
+        books.append(make_book(
+            title=volume_info.get('title', 'Unknown Title'),
+            authors=volume_info.get('authors'),
+            description=volume_info.get('description'),
+            image=volume_info.get('imageLinks', {}).get('thumbnail', ''),
+            publisher=volume_info.get('publisher', ''),
+            published_date=volume_info.get('publishedDate', ''),
+            page_count=volume_info.get('pageCount', 0),
+            categories=volume_info.get('categories', []),
+            language=volume_info.get('language', ''),
+            preview_link=volume_info.get('previewLink', ''),
+        ))
+    return books
+
+
+@register_provider
+class GoogleBooksTitleProvider(BookProvider):
+    """Google Books search using the detected titles."""
+    name = 'google_title'
+    exclude_self = True
+    collects_categories = True
+
+    def build_url(self, query):
+        if isinstance(query, BookQuery) and query.author:
+            # Field-restricted search returns far fewer loosely related volumes
+            query = f'intitle:"{query.title}" inauthor:"{query.author}"'
+        return (f"https://www.googleapis.com/books/v1/volumes?q={quote(query_title(query))}"
+                "&maxResults=8&orderBy=relevance&printType=books")
+
+    def parse(self, payload):
+        return _google_volumes_to_books(payload)
+
+
+@register_provider
+class GoogleBooksCategoryProvider(BookProvider):
+    """Google Books ``subject:`` search over categories found by earlier stages."""
+    name = 'google_category'
+    stage = 2
+    max_queries = 3
+
+    def queries(self, context):
+        return [f"subject:{category}" for category in context['categories'][:self.max_queries]]
+
+    def build_url(self, query):
+        return (f"https://www.googleapis.com/books/v1/volumes?q={quote(query)}"
+                "&maxResults=5&orderBy=relevance&printType=books")
+
+    def parse(self, payload):
+        return _google_volumes_to_books(payload)
+
+
+@register_provider
+class OpenLibraryProvider(BookProvider):
+    """Open Library search API using the detected titles."""
+    name = 'openlibrary'
+
+    def build_url(self, query):
+        if isinstance(query, BookQuery) and query.author:
+            return (f"https://openlibrary.org/search.json?title={quote(query.title)}"
+                    f"&author={quote(query.author)}&limit=3")
+        return f"https://openlibrary.org/search.json?q={quote(query_title(query))}&limit=3"
+
+    def parse(self, payload):
+        books = []
+        for doc in payload.get('docs', []):
+            cover_id = doc.get('cover_i')
+            books.append(make_book(
+                title=doc.get('title', 'Unknown Title'),
+                authors=doc.get('author_name'),
+                description=doc.get('first_sentence_value'),
+                image=f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else '',
+                publisher=", ".join(doc.get('publisher', [])[:2]),
+                published_date=str(doc.get('first_publish_year', '')),
+                page_count=doc.get('number_of_pages_median', 0),
+                categories=doc.get('subject', [])[:5],
+                language=", ".join(doc.get('language', [])[:2]),
+                preview_link=f"https://openlibrary.org{doc['key']}" if doc.get('key') else '',
+            ))
+        return books
+
+
+_LOCAL_TITLE_WORDS = ['Amber', 'Harbor', 'Lantern', 'Meridian', 'Orchard', 'Quarry', 'Saffron', 'Tundra',
+                      'Velvet', 'Willow', 'Cobalt', 'Falcon', 'Granite', 'Juniper', 'Marble', 'Nomad',
+                      'Pilgrim', 'Raven', 'Sparrow', 'Thistle', 'Umber', 'Vesper', 'Zephyr', 'Cinder']
+
+
+@register_provider
+class LocalProvider(BookProvider):
+    """Deterministic offline stand-in for the book APIs (``RECOMMENDATION_PROVIDERS=local``).
+
+    Each query returns ``results`` made-up books derived from the query after
+    ``delay`` seconds (plus up to ``jitter``), and fails with probability
+    ``error_rate``, so uploads can be load-tested without network access.
+    Settings default to ``LOCAL_PROVIDER_*`` environment variables.
+    """
+    name = 'local'
+
+    def __init__(self, delay=None, jitter=None, error_rate=None, results=None, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay if delay is not None else _env_float('LOCAL_PROVIDER_LATENCY_MS', 0) / 1000.0
+        self.jitter = jitter if jitter is not None else _env_float('LOCAL_PROVIDER_JITTER_MS', 0) / 1000.0
+        self.error_rate = error_rate if error_rate is not None else _env_float('LOCAL_PROVIDER_ERROR_RATE', 0)
+        self.results = results if results is not None else int(_env_float('LOCAL_PROVIDER_RESULTS', 3))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def build_url(self, query):
+        return f"local:{query_title(query)}"
+
+    def _next_call(self):
+        with self._lock:
+            delay = self.delay + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        return delay, fail
+
+    def _payload(self, url, fail):
+        if fail:
+            raise ConnectionError('Upstream unavailable (injected by local provider)')
+        title = url.split(':', 1)[1]
+        books = []
+        for i in range(self.results):
+            # Distinct made-up titles (similar ones would be merged as variants)
+            words = random.Random(f'{title}:{i}').sample(_LOCAL_TITLE_WORDS, 3)
+            books.append({'title': f'{words[0]} {words[1]} and the {words[2]}', 'author': f'{words[2]} Author'})
+        return books
+
+    def fetch_json(self, url, timeout):
+        delay, fail = self._next_call()
+        if delay:
+            time.sleep(delay)
+        return self._payload(url, fail)
+
+    async def fetch_json_async(self, url, timeout):
+        delay, fail = self._next_call()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._payload(url, fail)
+
+    def parse(self, payload):
+        return [make_book(title=item['title'], authors=[item['author']], categories=['Fiction'])
+                for item in payload]
+
+
+class RecommendationMerger:
+    """Deduplicate and rank book dicts coming from several providers.
+
+    Candidates are ranked by provider priority (configured order), then by
+    query order, then by the position the provider returned them in.
+    """
+
+    def __init__(self, limit=MAX_RECOMMENDATIONS):
+        self.limit = limit
+        self._seen = TitleIndex.from_env()  # Catches "Hobbit, The" vs "The Hobbit" and near-spellings
+        self._candidates = []
+        self.categories = {}  # Ordered set of lower-cased categories
+
+    def is_full(self):
+        return len(self._candidates) >= self.limit
+
+    def add(self, provider, priority, query_index, query, books):
+        """Add one query's results; returns the number of books accepted."""
+        accepted = 0
+        self_titles = None
+        if provider.exclude_self:
+            self_titles = TitleIndex(self._seen.threshold)
+            self_titles.add(query_title(query))
+        for position, book in enumerate(books):
+            title = book.get('title', 'Unknown Title')
+            if title == 'Unknown Title' or not normalize_title(title):
+                continue
+            if self_titles is not None and self_titles.find(title) is not None:
+                continue
+            if not self._seen.add_if_new(title):
+                continue
+            self._candidates.append((priority, query_index, position, book))
+            accepted += 1
+            if provider.collects_categories:
+                for category in book.get('categories', []):
+                    self.categories.setdefault(category.lower(), None)
+        return accepted
+
+    def ranked(self):
+        ordered = sorted(self._candidates, key=lambda c: c[:3])
+        return [c[3] for c in ordered[:self.limit]]
+
+
+class RecommendationPipeline:
+    """Run the configured providers stage by stage and merge their results."""
+
+    def __init__(self, providers, parallel=False, limit=MAX_RECOMMENDATIONS, max_workers=8,
+                 hedge_policy=None, cache=None):
+        self.providers = list(providers)
+        self.cache = cache
+        self.parallel = parallel
+        self.limit = limit
+        self.hedge_policy = hedge_policy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='provider') if parallel else None
+        # Hedged calls get their own pool so parallel stages cannot starve them
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_workers * 2,
+                                                  thread_name_prefix='hedge') if hedge_policy else None
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+
+    @classmethod
+    def from_env(cls):
+        """Build a pipeline from ``RECOMMENDATION_PROVIDERS`` and related settings."""
+        names = [n.strip() for n in os.getenv('RECOMMENDATION_PROVIDERS', DEFAULT_PROVIDERS).split(',') if n.strip()]
+        default_timeout = _env_float('PROVIDER_TIMEOUT', 5.0)
+        default_budget = _env_float('PROVIDER_BUDGET', 8.0)
+        failure_threshold = int(_env_float('PROVIDER_FAILURE_THRESHOLD', 3))
+        reset_timeout = _env_float('PROVIDER_RESET_TIMEOUT', 60.0)
+        default_ttl = _env_float('CACHE_EXPIRY', 86400)
+        cache = TieredCache.from_env()
+        providers = []
+        for name in names:
+            provider_cls = PROVIDER_REGISTRY.get(name)
+            if provider_cls is None:
+                logger.warning(f"Unknown recommendation provider '{name}' ignored.")
+                continue
+            suffix = name.upper()
+            providers.append(provider_cls(
+                timeout=_env_float(f'PROVIDER_TIMEOUT_{suffix}', default_timeout),
+                budget=_env_float(f'PROVIDER_BUDGET_{suffix}', default_budget),
+                breaker=CircuitBreaker(failure_threshold, reset_timeout),
+                cache=cache,
+                cache_ttl=_env_float(f'PROVIDER_CACHE_TTL_{suffix}', default_ttl),
+            ))
+        parallel = os.getenv('PROVIDER_PARALLEL', 'false').lower() in ('1', 'true', 'yes')
+        max_workers = int(_env_float('PROVIDER_MAX_WORKERS', 8))
+
+        hedge_policy = None
+        if os.getenv('PROVIDER_HEDGING', 'false').lower() in ('1', 'true', 'yes'):
+            hedge_policy = HedgePolicy(
+                percentile=_env_float('HEDGE_PERCENTILE', 95.0),
+                budget_percent=_env_float('HEDGE_BUDGET_PERCENT', 10.0),
+                min_samples=int(_env_float('HEDGE_MIN_SAMPLES', 20)),
+                default_delay=_env_float('HEDGE_DEFAULT_DELAY', 1.0),
+            )
+            by_name = {p.name: p for p in providers}
+            for provider in providers:
+                default_target = 'openlibrary' if provider.name == 'google_title' and 'openlibrary' in by_name else 'self'
+                target = os.getenv(f'PROVIDER_HEDGE_{provider.name.upper()}', default_target)
+                if target == 'self':
+                    provider.hedge_target = provider
+                elif target in by_name:
+                    provider.hedge_target = by_name[target]
+                elif target != 'none':
+                    logger.warning(f"Unknown hedge target '{target}' for provider '{provider.name}'.")
+        logger.info(f"Recommendation providers: {[p.name for p in providers]} "
+                    f"(parallel={parallel}, hedging={hedge_policy is not None})")
+        return cls(providers, parallel=parallel, max_workers=max_workers,
+                   hedge_policy=hedge_policy, cache=cache)
+
+    def shutdown(self):
+        """Stop the provider, hedge and prefetch pools without waiting for running calls."""
+        for executor in (self._executor, self._hedge_executor, self._prefetch_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Return breaker state, latency percentiles and hedging counters."""
+        providers = {}
+        for p in self.providers:
+            providers[p.name] = {
+                'breaker': p.breaker.state,
+                'failures': p.breaker.failures,
+                'latency_p50': p.latency.percentile(50),
+                'latency_p95': p.latency.percentile(95),
+                'hedge_target': p.hedge_target.name if p.hedge_target else None,
+                'coalescing': p.flight.stats(),
+            }
+        return {
+            'providers': providers,
+            'parallel': self.parallel,
+            'hedging': self.hedge_policy.snapshot() if self.hedge_policy else None,
+        }
+
+    def _hedges(self, provider):
+        return self.hedge_policy is not None and provider.hedge_target is not None
+
+    def _hedge_winner(self, done, hedge, errors):
+        """Return the books of the first successful call in ``done``, or None (errors are collected)."""
+        for call in done:
+            try:
+                books = call.result()
+            except ProviderError as e:
+                errors.append(e)
+                continue
+            self.hedge_policy.record_winner(hedged=call is hedge)
+            return books
+        return None
+
+    def search(self, provider, query, timeout=None):
+        """Run one provider query, racing a hedge request if the call is slow."""
+        if not self._hedges(provider):
+            return provider.search(query, timeout=timeout)
+
+        policy = self.hedge_policy
+        policy.record_request()
+        primary = self._hedge_executor.submit(provider.search, query, timeout)
+        done, _ = wait([primary], timeout=policy.delay_for(provider))
+        if done or not policy.try_acquire():
+            return primary.result()
+
+        target = provider.hedge_target
+        logger.debug(f"{provider.name}: hedging '{query}' with {target.name}")
+        hedge = self._hedge_executor.submit(target.search, query, timeout, False)
+        pending, errors = {primary, hedge}, []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            books = self._hedge_winner(done, hedge, errors)
+            if books is not None:
+                return books
+        raise errors[-1]
+
+    async def search_async(self, provider, query, timeout=None):
+        """Coroutine form of ``search``; the slower call is cancelled once one succeeds."""
+        if not self._hedges(provider):
+            return await provider.search_async(query, timeout=timeout)
+
+        policy = self.hedge_policy
+        policy.record_request()
+        loop = asyncio.get_running_loop()
+        primary = loop.create_task(provider.search_async(query, timeout))
+        done, _ = await asyncio.wait([primary], timeout=policy.delay_for(provider))
+        if done or not policy.try_acquire():
+            return await primary
+
+        target = provider.hedge_target
+        logger.debug(f"{provider.name}: hedging '{query}' with {target.name}")
+        hedge = loop.create_task(target.search_async(query, timeout, coalesce=False))
+        pending, errors = {primary, hedge}, []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                books = self._hedge_winner(done, hedge, errors)
+                if books is not None:
+                    return books
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def prefetch(self, query):
+        """Start the first-stage searches for one term in the background.
+
+        Used while detection is still streaming: the later ``recommend`` call
+        then joins the in-flight request or reads the warmed cache.
+        """
+        first_stage = min((p.stage for p in self.providers), default=None)
+        for provider in self.providers:
+            if provider.stage == first_stage:
+                self._prefetch_executor.submit(self._prefetch_one, provider, query)
+
+    def prefetch_async(self, query):
+        """Start the first-stage searches for one term as tasks on the running loop.
+
+        Returns the tasks so the caller can wait for them before its loop closes.
+        """
+        first_stage = min((p.stage for p in self.providers), default=None)
+        loop = asyncio.get_running_loop()
+        return [loop.create_task(self._prefetch_one_async(provider, query))
+                for provider in self.providers if provider.stage == first_stage]
+
+    @staticmethod
+    async def _prefetch_one_async(provider, query):
+        try:
+            await provider.search_async(query)
+        except ProviderError as e:
+            logger.debug(f"Prefetch failed: {e}")
+
+    @staticmethod
+    def _prefetch_one(provider, query):
+        try:
+            provider.search(query)
+        except ProviderError as e:
+            logger.debug(f"Prefetch failed: {e}")
+
+    def _stages(self, merger, context):
+        """Yield ``(stage, [(priority, provider)])`` in stage order until the merger is full."""
+        for stage in sorted({p.stage for p in self.providers}):
+            if merger.is_full():
+                break
+            context['categories'] = list(merger.categories)
+            yield stage, [(priority, p) for priority, p in enumerate(self.providers) if p.stage == stage]
+
+    def recommend(self, search_terms):
+        """Return up to ``limit`` ranked recommendation dicts for the search terms."""
+        merger = RecommendationMerger(self.limit)
+        context = {'search_terms': list(search_terms), 'categories': []}
+        for stage, stage_providers in self._stages(merger, context):
+            with stage_seconds.time(stage=stage):
+                if self.parallel:
+                    self._run_parallel(stage_providers, context, merger)
+                else:
+                    self._run_sequential(stage_providers, context, merger)
+        return merger.ranked()
+
+    async def recommend_async(self, search_terms):
+        """Coroutine form of ``recommend``; every stage runs its queries concurrently."""
+        merger = RecommendationMerger(self.limit)
+        context = {'search_terms': list(search_terms), 'categories': []}
+        for stage, stage_providers in self._stages(merger, context):
+            with stage_seconds.time(stage=stage):
+                await self._run_async(stage_providers, context, merger)
+        return merger.ranked()
+
+    def _run_sequential(self, stage_providers, context, merger):
+        for priority, provider in stage_providers:
+            deadline = time.monotonic() + provider.budget
+            for query_index, query in enumerate(provider.queries(context)):
+                if merger.is_full():
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"{provider.name}: latency budget of {provider.budget}s exhausted.")
+                    break
+                try:
+                    books = self.search(provider, query, timeout=min(provider.timeout, remaining))
+                except ProviderError as e:
+                    logger.error(f"Provider query failed: {e}")
+                    if provider.breaker.state != 'closed':
+                        break
+                    continue
+                accepted = merger.add(provider, priority, query_index, query, books)
+                logger.debug(f"{provider.name}: accepted {accepted} results for '{query}'")
+
+    def _run_parallel(self, stage_providers, context, merger):
+        submitted = []
+        for priority, provider in stage_providers:
+            futures = [(query_index, query, self._executor.submit(self.search, provider, query))
+                       for query_index, query in enumerate(provider.queries(context))]
+            submitted.append((priority, provider, futures))
+
+        started = time.monotonic()
+        for priority, provider, futures in submitted:
+            remaining = max(0.0, provider.budget - (time.monotonic() - started))
+            wait([f for _, _, f in futures], timeout=remaining)
+            self._merge_finished(priority, provider, futures, merger)
+
+    async def _run_async(self, stage_providers, context, merger):
+        loop = asyncio.get_running_loop()
+        submitted = []
+        for priority, provider in stage_providers:
+            tasks = [(query_index, query, loop.create_task(self.search_async(provider, query)))
+                     for query_index, query in enumerate(provider.queries(context))]
+            submitted.append((priority, provider, tasks))
+
+        started = time.monotonic()
+        for priority, provider, tasks in submitted:
+            if not tasks:
+                continue
+            remaining = max(0.0, provider.budget - (time.monotonic() - started))
+            await asyncio.wait([t for _, _, t in tasks], timeout=remaining)
+            # Overdue tasks are cancelled: they must not outlive the upload's event loop and HTTP client
+            self._merge_finished(priority, provider, tasks, merger)
+
+    @staticmethod
+    def _merge_finished(priority, provider, calls, merger):
+        """Merge the results of finished ``(query_index, query, future or task)`` calls; cancel the rest."""
+        for query_index, query, call in calls:
+            if not call.done():
+                call.cancel()
+                logger.warning(f"{provider.name}: query '{query}' exceeded the {provider.budget}s budget.")
+                continue
+            try:
+                books = call.result()
+            except ProviderError as e:
+                logger.error(f"Provider query failed: {e}")
+                continue
+            merger.add(provider, priority, query_index, query, books)
@@ -0,0 +1,95 @@
+"""Cache of serialized responses for the public (unauthenticated) shelf endpoints.
+
+Shared shelf links are read far more often than shelves change. Each response
+body is stored as bytes together with a strong ETag, under the version of
+the data it was built from. Callers read that version from the database
+(a shelf's persisted ``version``, the latest change-log id) with one cheap
+query per request, so a cached body is used only while it matches what is
+committed, in every worker process.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'version', 'expires'])
+
+
+def strong_etag(body):
+    """Return an ETag value (unquoted) derived from the response bytes."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class VersionedResponseCache:
+    """LRU of serialized bodies keyed by request, validated by the caller's version.
+
+    Args:
+        max_entries (int): Bodies kept before the least recently used is evicted.
+        ttl (float): Seconds a body is kept at most, even while its version is current.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('PUBLIC_CACHE_ENTRIES', '1024')),
+            ttl=float(os.getenv('PUBLIC_CACHE_TTL', '30')),
+        )
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or entry.expires <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, version, body):
+        entry = CachedResponse(body, strong_etag(body), version, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_or_build(self, key, version, build):
+        """Return the cached body for ``key`` at ``version`` or store the bytes returned by ``build()``.
+
+        Read ``version`` before building, so a write committed while
+        building leaves an entry that the next request treats as outdated.
+        """
+        entry = self.get(key, version)
+        if entry is None:
+            entry = self.set(key, version, build())
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,153 @@
+"""SQLite storage for flask-limiter counters shared by all workers on a host.
+
+The default ``memory://`` storage keeps counters per process, so with N
+workers every limit is effectively N times higher. ``SQLiteStorage``
+registers the ``sqlite://`` scheme with the ``limits`` package. Its
+counters live in one WAL-mode SQLite file (``sqlite:///rate_limits.sqlite``
+or ``sqlite:////abs/path.sqlite``) that every worker opens.
+
+It implements the sliding-window-counter strategy. Each key keeps one
+counter per window, and the previous window's count is weighted by how much
+of it still overlaps the sliding window. A hit costs one short write
+transaction: read both counters, then increment the current one. A
+rejected hit writes nothing, so a client hammering a limit does not turn
+into a write storm. Expired counters are deleted every ``trim_interval``
+writes rather than on each request. The fixed-window strategy is supported
+too.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from math import floor
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Rate limit counters in a shared SQLite file.
+
+    Args:
+        uri (str): ``sqlite:///<path>``; ``sqlite:///:memory:`` keeps counters
+            in a private per-thread database (for tests).
+        trim_interval (int): Writes between deletions of expired counters.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri='sqlite:///rate_limits.sqlite', wrap_exceptions=False, trim_interval=1000, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split('://', 1)[1][1:] or 'rate_limits.sqlite'
+        self.trim_interval = int(trim_interval)
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limits ('
+                'key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _after_write(self):
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.trim_interval == 0
+        if trim:
+            self._connection().execute('DELETE FROM rate_limits WHERE expires_at <= ?', (time.time(),))
+
+    def _count(self, conn, key, now):
+        row = conn.execute('SELECT count, expires_at FROM rate_limits WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1]) if row and row[1] > now else (0, 0.0)
+
+    def _incr(self, conn, key, expires_at, amount, now):
+        """Increment a counter, restarting it if it expired; returns the new count."""
+        return conn.execute(
+            'INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            'count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, '
+            'expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END '
+            'RETURNING count',
+            (key, amount, expires_at, now, now),
+        ).fetchone()[0]
+
+    # --- Fixed window ---
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        count = self._incr(self._connection(), key, now + expiry, amount, now)
+        self._after_write()
+        return count
+
+    def get(self, key):
+        return self._count(self._connection(), key, time.time())[0]
+
+    def get_expiry(self, key):
+        expires_at = self._count(self._connection(), key, time.time())[1]
+        return expires_at or time.time()
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+    # --- Sliding window counter ---
+
+    def _window_info(self, conn, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._count(conn, previous_key, now)[0]
+        current_count = self._count(conn, current_key, now)[0]
+        # Share of the previous window still inside the sliding window, in seconds
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key, expiry):
+        return self._window_info(self._connection(), key, expiry, time.time())
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')  # Serializes hits across processes
+        try:
+            now = time.time()
+            previous_count, previous_ttl, current_count, current_ttl = self._window_info(conn, key, expiry, now)
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                conn.execute('ROLLBACK')
+                return False
+            _, current_key = self.sliding_window_keys(key, expiry, now)
+            self._incr(conn, current_key, now + current_ttl, amount, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._after_write()
+        return True
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
@@ -0,0 +1,280 @@
+"""Scoped, tiered cache for external book API responses.
+
+Only the recommendation providers use it, so no other HTTP traffic in the
+process is cached. An in-memory LRU tier sits in front of a
+WAL-mode SQLite tier shared by all workers on the host. Entries have a fresh
+period (per-provider TTL) followed by a stale period during which the cached
+value is served while a background refresh runs (stale-while-revalidate).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'fresh_until', 'stale_until'])
+_MISS = object()
+
+
+class MemoryTier:
+    """Size-bounded LRU of cache entries held in process memory."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.stale_until <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteTier:
+    """SQLite-backed tier in WAL mode so concurrent workers do not block readers.
+
+    Each thread gets its own connection. Reads never write (no access-time
+    bookkeeping), and the table is trimmed to ``max_entries`` oldest-first
+    every ``trim_interval`` writes.
+    """
+
+    def __init__(self, path, max_entries=50000, trim_interval=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_interval = trim_interval
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, '
+                'fresh_until REAL NOT NULL, stale_until REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_stored_at ON responses (stored_at)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                'SELECT value, fresh_until, stale_until FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache read failed: {e}")
+            return None
+        if row is None or row[2] <= time.time():
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2])
+
+    def set(self, key, entry):
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, stored_at, fresh_until, stale_until) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, json.dumps(entry.value), time.time(), entry.fresh_until, entry.stale_until),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache write failed: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.trim_interval == 0
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """Drop expired rows and the oldest rows beyond ``max_entries``."""
+        try:
+            conn = self._connection()
+            removed = conn.execute('DELETE FROM responses WHERE stale_until <= ?', (time.time(),)).rowcount
+            removed += conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            ).rowcount
+            conn.commit()
+            self.evictions += removed
+        except sqlite3.Error as e:
+            logger.error(f"Response cache trim failed: {e}")
+
+    def count(self):
+        try:
+            return self._connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM responses')
+        conn.commit()
+
+
+class TieredCache:
+    """Memory LRU in front of an optional persistent tier, with stale-while-revalidate."""
+
+    def __init__(self, memory=None, disk=None, stale_ttl=3600, revalidate_workers=2):
+        self.memory = memory if memory is not None else MemoryTier()
+        self.disk = disk
+        self.stale_ttl = stale_ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.revalidation_errors = 0
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=revalidate_workers,
+                                            thread_name_prefix='cache-revalidate')
+
+    @classmethod
+    def from_env(cls):
+        """Build the provider cache from ``PROVIDER_CACHE_*`` settings."""
+        memory = MemoryTier(int(os.getenv('PROVIDER_CACHE_MEMORY_ENTRIES', '1024')))
+        disk = None
+        if os.getenv('PROVIDER_CACHE_BACKEND', 'sqlite').lower() == 'sqlite':
+            disk = SQLiteTier(os.getenv('PROVIDER_CACHE_PATH', 'provider_cache.sqlite'),
+                              max_entries=int(os.getenv('PROVIDER_CACHE_DISK_ENTRIES', '50000')))
+        return cls(memory, disk, stale_ttl=int(os.getenv('PROVIDER_CACHE_STALE_TTL', '3600')))
+
+    def _lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry, 'memory'
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)  # Promote to the fast tier
+                return entry, 'disk'
+        return None, None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, now + ttl + self.stale_ttl)
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def _cached(self, key, refresh, ttl):
+        """Return the usable cached value for ``key`` or ``_MISS``, refreshing stale entries."""
+        entry, tier = self._lookup(key)
+        if entry is not None:
+            if time.time() < entry.fresh_until:
+                with self._lock:
+                    if tier == 'memory':
+                        self.memory_hits += 1
+                    else:
+                        self.disk_hits += 1
+                return entry.value
+            with self._lock:
+                self.stale_hits += 1
+            self._schedule_revalidate(key, refresh, ttl)
+            return entry.value
+
+        with self._lock:
+            self.misses += 1
+        return _MISS
+
+    def get_or_fetch(self, key, fetch, ttl):
+        """Return the cached value for ``key`` or call ``fetch()`` and store it.
+
+        Stale entries are returned immediately while ``fetch`` runs in the
+        background to refresh them.
+        """
+        value = self._cached(key, fetch, ttl)
+        if value is _MISS:
+            value = fetch()
+            self.set(key, value, ttl)
+        return value
+
+    async def get_or_fetch_async(self, key, fetch, ttl, refresh):
+        """Like ``get_or_fetch``, awaiting ``fetch()`` on a miss.
+
+        Stale entries are refreshed in the background with the synchronous
+        ``refresh`` callable.
+        """
+        value = self._cached(key, refresh, ttl)
+        if value is _MISS:
+            value = await fetch()
+            self.set(key, value, ttl)
+        return value
+
+    def _schedule_revalidate(self, key, fetch, ttl):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            self.revalidations += 1
+        self._executor.submit(self._revalidate, key, fetch, ttl)
+
+    def _revalidate(self, key, fetch, ttl):
+        try:
+            self.set(key, fetch(), ttl)
+        except Exception as e:
+            with self._lock:
+                self.revalidation_errors += 1
+            logger.warning(f"Background refresh of cached response failed: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits + self.stale_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': (hits / lookups) if lookups else 0.0,
+                'revalidations': self.revalidations,
+                'revalidation_errors': self.revalidation_errors,
+                'memory_entries': len(self.memory),
+                'memory_evictions': self.memory.evictions,
+                'disk_entries': self.disk.count() if self.disk is not None else None,
+                'disk_evictions': self.disk.evictions if self.disk is not None else None,
+            }
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
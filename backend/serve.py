@@ -0,0 +1,205 @@
+"""Production entry point: ``python -m backend.serve``.
+
+Runs the app under gunicorn instead of the debug server started by
+``python -m backend.app``. The worker model is configurable:
+
+- ``gthread`` (default): ``workers`` processes with ``threads`` threads each.
+  Uploads spend most of their time waiting on the detection model and the
+  book APIs, so threads keep a process busy while requests wait.
+- ``gevent``: cooperative greenlets (``worker_connections`` per process), for
+  many slow concurrent uploads. Needs the optional ``gevent`` package.
+- ``sync``: one request per process at a time.
+
+The database schema is created and upgraded (``init_database``) once, in a
+short-lived child process, before gunicorn starts. The gunicorn master
+never imports the app, so workers do not inherit database connections or
+pool threads across ``fork``. gevent can also patch the standard library
+before the app is imported.
+
+SIGTERM stops accepting connections and gives in-flight requests
+``graceful_timeout`` seconds to finish. Idle keep-alive connections are
+held for ``keepalive`` seconds.
+
+Every option has an environment variable (``SERVE_WORKERS`` etc.) that a
+command-line flag overrides.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Optional dependency
+    BaseApplication = None
+
+try:
+    import gevent
+except ImportError:  # Optional dependency
+    gevent = None
+
+logger = logging.getLogger(__name__)
+
+WORKER_CLASSES = ('gthread', 'gevent', 'sync')
+
+
+class ServeConfig:
+    """Server settings.
+
+    Args:
+        bind (str): ``host:port`` to listen on.
+        workers (int): Worker processes (default ``2 * cores + 1``).
+        worker_class (str): ``gthread``, ``gevent`` or ``sync``.
+        threads (int): Threads per worker for ``gthread``.
+        worker_connections (int): Concurrent greenlets per worker for ``gevent``.
+        timeout (int): Seconds a worker may be silent before it is restarted;
+            must cover a slow upload (LLM queue wait plus detection).
+        graceful_timeout (int): Seconds in-flight requests get after SIGTERM.
+        keepalive (int): Seconds to hold an idle keep-alive connection.
+        max_requests (int): Requests after which a worker is recycled (0 = never),
+            with up to ``max_requests_jitter`` added so workers do not restart together.
+        init_db (bool): Create/upgrade the schema before starting workers.
+    """
+
+    def __init__(self, bind='0.0.0.0:5001', workers=None, worker_class='gthread', threads=8,
+                 worker_connections=200, timeout=120, graceful_timeout=30, keepalive=5,
+                 max_requests=0, max_requests_jitter=0, init_db=True):
+        if worker_class not in WORKER_CLASSES:
+            raise ValueError(f"Unknown worker class '{worker_class}' (choose from {', '.join(WORKER_CLASSES)})")
+        self.bind = bind
+        self.workers = workers or (os.cpu_count() or 1) * 2 + 1
+        self.worker_class = worker_class
+        self.threads = threads
+        self.worker_connections = worker_connections
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.init_db = init_db
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            bind=os.getenv('SERVE_BIND', '0.0.0.0:5001'),
+            workers=int(os.getenv('SERVE_WORKERS', '0')) or None,
+            worker_class=os.getenv('SERVE_WORKER_CLASS', 'gthread').lower(),
+            threads=int(os.getenv('SERVE_THREADS', '8')),
+            worker_connections=int(os.getenv('SERVE_WORKER_CONNECTIONS', '200')),
+            timeout=int(os.getenv('SERVE_TIMEOUT', '120')),
+            graceful_timeout=int(os.getenv('SERVE_GRACEFUL_TIMEOUT', '30')),
+            keepalive=int(os.getenv('SERVE_KEEPALIVE', '5')),
+            max_requests=int(os.getenv('SERVE_MAX_REQUESTS', '0')),
+            max_requests_jitter=int(os.getenv('SERVE_MAX_REQUESTS_JITTER', '0')),
+            init_db=os.getenv('SERVE_INIT_DB', 'true').lower() != 'false',
+        )
+
+    def gunicorn_options(self):
+        """Return the settings passed to gunicorn."""
+        options = {
+            'bind': self.bind,
+            'workers': self.workers,
+            'worker_class': self.worker_class,
+            'timeout': self.timeout,
+            'graceful_timeout': self.graceful_timeout,
+            'keepalive': self.keepalive,
+            'max_requests': self.max_requests,
+            'max_requests_jitter': self.max_requests_jitter,
+            'loglevel': os.getenv('LOG_LEVEL', 'INFO').lower(),
+            'preload_app': False,  # Each worker imports the app after fork (and after gevent patching)
+            'worker_exit': _worker_exit,
+        }
+        if self.worker_class == 'gthread':
+            options['threads'] = self.threads
+        elif self.worker_class == 'gevent':
+            options['worker_connections'] = self.worker_connections
+        return options
+
+
+def _worker_exit(server, worker):
+    # Only workers that served requests have imported the app
+    app_module = sys.modules.get('backend.app')
+    if app_module is not None:
+        app_module.shutdown_executors()
+
+
+if BaseApplication is not None:
+    class BookshelfApplication(BaseApplication):
+        """Embedded gunicorn application serving ``backend.app:app``."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from backend.app import create_app
+            return create_app()
+
+
+def run_init_db():
+    """Create/upgrade the schema in a child process so this process never imports the app."""
+    subprocess.run([sys.executable, '-m', 'backend.serve', '--init-db-only'], check=True)
+
+
+def parse_args(argv=None):
+    config = ServeConfig.from_env()
+    parser = argparse.ArgumentParser(description='Serve the Bookshelf Recommender API with gunicorn.')
+    parser.add_argument('--bind', default=config.bind, help='host:port (SERVE_BIND)')
+    parser.add_argument('--workers', type=int, default=config.workers, help='worker processes (SERVE_WORKERS)')
+    parser.add_argument('--worker-class', choices=WORKER_CLASSES, default=config.worker_class,
+                        help='worker model (SERVE_WORKER_CLASS)')
+    parser.add_argument('--threads', type=int, default=config.threads, help='threads per gthread worker (SERVE_THREADS)')
+    parser.add_argument('--worker-connections', type=int, default=config.worker_connections,
+                        help='greenlets per gevent worker (SERVE_WORKER_CONNECTIONS)')
+    parser.add_argument('--timeout', type=int, default=config.timeout, help='worker timeout in seconds (SERVE_TIMEOUT)')
+    parser.add_argument('--graceful-timeout', type=int, default=config.graceful_timeout,
+                        help='seconds to finish requests after SIGTERM (SERVE_GRACEFUL_TIMEOUT)')
+    parser.add_argument('--keepalive', type=int, default=config.keepalive,
+                        help='idle keep-alive seconds (SERVE_KEEPALIVE)')
+    parser.add_argument('--max-requests', type=int, default=config.max_requests,
+                        help='recycle workers after this many requests (SERVE_MAX_REQUESTS)')
+    parser.add_argument('--max-requests-jitter', type=int, default=config.max_requests_jitter,
+                        help='random extra requests before recycling (SERVE_MAX_REQUESTS_JITTER)')
+    parser.add_argument('--no-init-db', dest='init_db', action='store_false', default=config.init_db,
+                        help='skip creating/upgrading the schema (SERVE_INIT_DB=false)')
+    parser.add_argument('--init-db-only', action='store_true', help='create/upgrade the schema and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()  # SERVE_* settings may live in .env like the rest of the configuration
+    logging.basicConfig(level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    if args.init_db_only:
+        from backend.app import init_database
+        init_database()
+        return 0
+
+    config = ServeConfig(
+        bind=args.bind, workers=args.workers, worker_class=args.worker_class, threads=args.threads,
+        worker_connections=args.worker_connections, timeout=args.timeout,
+        graceful_timeout=args.graceful_timeout, keepalive=args.keepalive, max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter, init_db=args.init_db,
+    )
+    if BaseApplication is None:
+        sys.exit("gunicorn is not installed; run: pip install gunicorn")
+    if config.worker_class == 'gevent' and gevent is None:
+        sys.exit("The gevent worker class needs gevent; run: pip install gevent")
+
+    if config.init_db:
+        run_init_db()
+    logger.info(f"Serving on {config.bind}: {config.workers} {config.worker_class} workers")
+    BookshelfApplication(config.gunicorn_options()).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
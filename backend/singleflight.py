@@ -0,0 +1,88 @@
+"""Request coalescing for identical in-flight calls.
+
+When several callers ask for the same key at the same time, only the first
+one (the leader) runs the function; the others wait for it and receive the
+same result or exception. Threads (``do``) and coroutines (``do_async``)
+share the same in-flight calls, and a coroutine waiting on a call started
+elsewhere does not block its event loop. Cancelling a waiting coroutine
+cancels only that waiter, never the shared call.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0  # Calls that reused another caller's in-flight result
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def _join(self, key):
+        """Return ``(future, leader)`` for ``key``, registering a new call if none is in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                return call, False
+            call = Future()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        if call.done():
+            return
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers using ``key``."""
+        call, leader = self._join(key)
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result)
+        return result
+
+    async def do_async(self, key, fn):
+        """Await ``fn()`` (a coroutine function) once for all concurrent callers using ``key``."""
+        call, leader = self._join(key)
+        if not leader:
+            # Shielded so a cancelled waiter (a lost hedge, an overdue stage)
+            # does not cancel the call shared with the leader and other waiters
+            return await asyncio.shield(asyncio.wrap_future(call))
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled; waiters get an ordinary error instead
+            self._finish(key, call, error=RuntimeError(f"Shared call for {key!r} was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'shared': self.shared,
+                'in_flight': len(self._calls),
+            }
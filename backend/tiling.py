@@ -0,0 +1,92 @@
+"""Tiled detection helpers for wide or very high-resolution shelf images.
+
+Panorama shots of long shelves are split into overlapping strips along their
+long axis so every detection call sees legible spines at a bounded payload
+size. Titles found in neighbouring strips are merged with the shelf's title
+matching (``TitleIndex``), because a spine cut by a strip edge shows up in
+both strips.
+"""
+import math
+import os
+from backend.title_matching import TitleIndex
+
+
+class TilingConfig:
+    """Settings deciding when and how an image is tiled.
+
+    Args:
+        mode (str): ``auto`` to tile large/wide images, ``off`` to never tile.
+        max_side (int): Images whose long side exceeds this many pixels are tiled.
+        max_aspect (float): Images more elongated than this ratio are tiled.
+        overlap (float): Fraction of a strip shared with its neighbour.
+    """
+
+    def __init__(self, mode='auto', max_side=4096, max_aspect=2.5, overlap=0.15):
+        self.mode = mode
+        self.max_side = max_side
+        self.max_aspect = max_aspect
+        self.overlap = overlap
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv('DETECTION_TILING', 'auto').lower(),
+            max_side=int(os.getenv('DETECTION_TILE_MAX_SIDE', '4096')),
+            max_aspect=float(os.getenv('DETECTION_TILE_MAX_ASPECT', '2.5')),
+            overlap=float(os.getenv('DETECTION_TILE_OVERLAP', '0.15')),
+        )
+
+    def should_tile(self, size):
+        if self.mode == 'off':
+            return False
+        width, height = size
+        long_side, short_side = max(width, height), max(1, min(width, height))
+        return long_side > self.max_side or long_side / short_side > self.max_aspect
+
+
+def tile_spans(length, tile_length, overlap):
+    """Return ``(start, end)`` spans of ``tile_length`` covering ``length`` with overlap."""
+    if length <= tile_length:
+        return [(0, length)]
+    step = max(1, int(tile_length * (1 - overlap)))
+    count = math.ceil((length - tile_length) / step) + 1
+    spans = []
+    for i in range(count):
+        start = min(i * step, length - tile_length)
+        spans.append((start, start + tile_length))
+    return spans
+
+
+def split_into_tiles(img, config):
+    """Split a Pillow image into overlapping strips along its long axis."""
+    width, height = img.size
+    horizontal = width >= height
+    long_side, short_side = (width, height) if horizontal else (height, width)
+    # Keep strips at most ~max_aspect:1 so spines stay legible
+    tile_length = max(1, min(config.max_side, int(short_side * config.max_aspect)))
+    tiles = []
+    for start, end in tile_spans(long_side, tile_length, config.overlap):
+        box = (start, 0, end, height) if horizontal else (0, start, width, end)
+        tiles.append(img.crop(box))
+    return tiles
+
+
+def merge_titles(title_lists, index=None):
+    """Merge per-tile title lists, collapsing titles that match across overlaps.
+
+    Titles match by the same rules as shelf duplicates (``TitleIndex``, from
+    env by default). When two titles match, the longer one is kept since a
+    spine cut by a tile edge is usually the shorter reading.
+    """
+    index = TitleIndex.from_env() if index is None else index
+    merged = []
+    for titles in title_lists:
+        for title in titles:
+            position = index.find(title)
+            if position is None:
+                if index.add(title, len(merged)):
+                    merged.append(title)
+            elif len(title) > len(merged[position]):
+                merged[position] = title
+                index.add(title, position)  # Later readings can match either form
+    return merged
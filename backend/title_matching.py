@@ -0,0 +1,207 @@
+"""Book title normalization and fuzzy matching.
+
+Detected and recommended titles arrive in many spellings: "The Hobbit",
+"Hobbit, The", "THE HOBBIT!" or "Sapiens: A Brief History of Humankind".
+``normalize_title`` folds Unicode, case, punctuation and leading/trailing
+articles into a comparable key (stored in ``Book.normalized_title``), and
+``TitleIndex`` finds near-matches among many titles using MinHash
+locality-sensitive hashing over character trigrams, so a lookup only
+compares against a handful of candidates instead of every title.
+
+``TitleIndex.match_keys`` and ``candidate_keys`` turn the same buckets into
+integers for a database index (``book_match_keys``), so titles stored on a
+shelf can be matched without loading and hashing all of them.
+"""
+import hashlib
+import os
+import random
+import re
+import unicodedata
+import zlib
+from difflib import SequenceMatcher
+
+ARTICLES = ('the', 'a', 'an', 'le', 'la', 'les', 'el', 'los', 'las')
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_TRAILING_ARTICLE = re.compile(r',\s*(' + '|'.join(ARTICLES) + r')\s*$')
+_SUBTITLE_SPLIT = re.compile(r'\s*(?::|\s[-–—]\s|\(|\[)')
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def fold(text):
+    """Strip accents and compatibility forms and casefold (``Émile`` -> ``emile``)."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def normalize_title(title):
+    """Return the comparison key for a title.
+
+    Unicode is folded, "&" becomes "and", a leading article ("The Hobbit") or
+    a trailing one ("Hobbit, The") is dropped and punctuation collapses to
+    single spaces.
+    """
+    if not title:
+        return ''
+    text = _TRAILING_ARTICLE.sub('', fold(title).strip()).replace('&', ' and ')
+    words = _NON_ALNUM.sub(' ', text).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def main_title_key(title):
+    """Return the key of the title without its subtitle or parenthetical."""
+    if not title:
+        return ''
+    main = _SUBTITLE_SPLIT.split(title.strip(), maxsplit=1)[0]
+    # A leading-article form such as "Hobbit, The: Illustrated" still normalizes the same way
+    return normalize_title(main) or normalize_title(title)
+
+
+def _lookup_int(label, value):
+    """Stable signed 64-bit integer for ``label:value`` (fits an SQL BIGINT column)."""
+    digest = hashlib.blake2b(f'{label}:{value}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def shingles(key, size=3):
+    """Character n-grams of a key, padded so short keys still produce some."""
+    padded = f" {key} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+class MinHasher:
+    """Compute MinHash signatures of shingle sets with ``num_perm`` hash functions."""
+
+    def __init__(self, num_perm=32, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                        for _ in range(num_perm)]
+
+    def signature(self, items):
+        hashes = [zlib.crc32(item.encode('utf-8')) for item in items]
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._params)
+
+
+class TitleIndex:
+    """Set of titles supporting exact-key and fuzzy lookups.
+
+    Two titles match when their normalized keys are equal, when their keys
+    are at least ``threshold`` similar, or when one of them is the other's
+    main title without a subtitle ("Sapiens" and "Sapiens: A Brief History").
+    Titles that both carry different subtitles ("Star Wars: A New Hope" and
+    "Star Wars: The Empire Strikes Back") do not match.
+
+    Args:
+        threshold (float): Similarity (0-1) of normalized keys treated as a match.
+        num_perm (int): MinHash signature length.
+        bands (int): LSH bands; ``num_perm`` must be divisible by it. More bands
+            find more (and lower-similarity) candidates.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=32, bands=8, hasher=None):
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = hasher or MinHasher(num_perm)
+        self._by_key = {}
+        self._by_main = {}  # Main-title key -> first entry with that main title
+        self._buckets = [{} for _ in range(bands)]
+        self._entries = []  # (key, value)
+
+    @classmethod
+    def from_env(cls):
+        return cls(threshold=float(os.getenv('TITLE_MATCH_THRESHOLD', '0.85')))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _candidates(self, key):
+        signature = self.hasher.signature(shingles(key))
+        found = set()
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            found.update(self._buckets[band].get(chunk, ()))
+        return signature, found
+
+    def _band_keys(self, key):
+        signature = self.hasher.signature(shingles(key))
+        return [_lookup_int(f'band{band}', signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)]
+
+    def match_keys(self, title, key=None):
+        """Integer keys to store for a title: one per LSH band and one for its main title.
+
+        They depend on ``num_perm``, ``bands`` and the hasher seed, not on
+        ``threshold``; stored keys must be rebuilt if those change.
+        """
+        key = normalize_title(title) if key is None else key
+        if not key:
+            return []
+        return self._band_keys(key) + [_lookup_int('main', main_title_key(title))]
+
+    def candidate_keys(self, title):
+        """Return ``(normalized keys, match keys)`` that find every stored title able to match ``title``.
+
+        A stored title can match only if its normalized key is in the first
+        set (same key, or ``title``'s main title) or one of its ``match_keys``
+        is in the second (a shared LSH bucket, or ``title`` is its main title).
+        """
+        key = normalize_title(title)
+        if not key:
+            return set(), set()
+        return {key, main_title_key(title)}, set(self._band_keys(key)) | {_lookup_int('main', key)}
+
+    def find(self, title, key=None):
+        """Return the value stored for a matching title, or None."""
+        key = normalize_title(title) if key is None else key
+        if not key:
+            return None
+        if key in self._by_key:
+            return self._entries[self._by_key[key]][1]
+        main = main_title_key(title)
+        # A title with a subtitle matches its bare main title; a bare title matches any subtitled form
+        index = self._by_key.get(main) if main != key else self._by_main.get(key)
+        if index is not None:
+            return self._entries[index][1]
+        _, candidates = self._candidates(key)
+        for i in sorted(candidates):
+            other_key, value = self._entries[i]
+            if SequenceMatcher(None, key, other_key).ratio() >= self.threshold:
+                return value
+        return None
+
+    def add(self, title, value=None, key=None):
+        """Index a title (without checking for matches); returns its key."""
+        key = normalize_title(title) if key is None else key
+        if not key:
+            return key
+        index = len(self._entries)
+        self._entries.append((key, title if value is None else value))
+        self._by_key.setdefault(key, index)
+        self._by_main.setdefault(main_title_key(title), index)
+        signature, _ = self._candidates(key)
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            self._buckets[band].setdefault(chunk, []).append(index)
+        return key
+
+    def add_if_new(self, title, value=None):
+        """Add a title unless it matches one already indexed; returns True if added."""
+        key = normalize_title(title)
+        if not key or self.find(title, key) is not None:
+            return False
+        self.add(title, value, key)
+        return True
+
+
+def titles_match(first, second, threshold=0.85):
+    """Return True if two titles refer to the same book by the rules of ``TitleIndex``."""
+    index = TitleIndex(threshold)
+    index.add(first)
+    return index.find(second) is not None
@@ -0,0 +1,90 @@
+"""Cache of verified JWT claims.
+
+Every authenticated request used to verify its bearer token's HMAC
+signature and parse its claims, even though a client sends the same token
+many times during its lifetime. Verified claims are kept in a bounded LRU
+for ``ttl`` seconds, and never past the token's own ``exp``, so an expired
+token is always decoded again and rejected. Entries are keyed by a hash of
+the signing secret and the token, so a secret rotation invalidates them.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class VerifiedTokenCache:
+    """LRU of token -> claims with per-entry expiry.
+
+    Args:
+        max_entries (int): Tokens kept before the least recently used is evicted.
+        ttl (float): Seconds a verified token is trusted without decoding it
+            again. ``0`` disables the cache.
+    """
+
+    def __init__(self, max_entries=4096, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (claims, expiry as a Unix timestamp)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('TOKEN_CACHE_ENTRIES', '4096')),
+            ttl=float(os.getenv('TOKEN_CACHE_TTL', '300')),
+        )
+
+    @staticmethod
+    def _key(token, secret):
+        return hashlib.sha256(f"{secret}\0{token}".encode('utf-8')).digest()
+
+    def get(self, token, secret):
+        """Return the cached claims of a previously verified token, or None."""
+        if self.ttl <= 0:
+            return None
+        key = self._key(token, secret)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, secret, claims):
+        """Remember claims returned by a successful ``jwt.decode``."""
+        if self.ttl <= 0:
+            return
+        expires = time.time() + self.ttl
+        if 'exp' in claims:
+            expires = min(expires, float(claims['exp']))
+        key = self._key(token, secret)
+        with self._lock:
+            self._entries[key] = (claims, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
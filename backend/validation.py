@@ -0,0 +1,228 @@
+"""Declarative validation of JSON request bodies.
+
+A ``Schema`` maps field names to ``Field`` declarations. Each field is
+compiled once, when the schema is created, into a single check function,
+so validating a body is a flat loop over the declared fields and the work
+per request is bounded by the declared lengths and item counts.
+
+Validation collects every problem instead of stopping at the first one.
+It raises ``ValidationError`` with a list of ``{'field', 'message'}``
+entries. List fields (``Field('array', items=...)``) validate each item
+against a nested schema and report paths like ``books[3].title``, so a bulk
+payload is checked in one pass. The same declarations produce the OpenAPI
+``requestBody`` of each endpoint (``Schema.to_openapi``).
+
+String fields are stripped (unless ``strip=False``) and sanitized with
+``backend.sanitize`` (unless ``clean=False``). Optional strings that end up
+empty become ``None``. A ``required`` field in a ``partial`` schema may be
+omitted but not sent empty.
+"""
+from backend.sanitize import sanitize_input
+
+MISSING = object()
+
+_OPENAPI_TYPES = {'string': 'string', 'boolean': 'boolean', 'integer': 'integer', 'array': 'array'}
+
+
+class ValidationError(Exception):
+    """Raised when a request body does not match its schema.
+
+    Attributes:
+        errors (list): ``{'field': <path>, 'message': <text>}`` entries.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors[0]['message'] if errors else 'Invalid request')
+        self.errors = errors
+
+    def to_dict(self):
+        return {'error': str(self), 'errors': self.errors}
+
+
+class Field:
+    """Declaration of one body field.
+
+    Args:
+        type (str): ``string``, ``boolean``, ``integer`` or ``array``.
+        required (bool): The field must be present (and, for strings, non-empty).
+        default: Value used when an optional field is absent; omitted from the
+            result if not given.
+        min_length / max_length (int): Bounds on string length after stripping.
+        format (str): ``email`` or ``url`` for additional string checks.
+        clean (bool): Sanitize strings with ``sanitize_input``.
+        strip (bool): Strip surrounding whitespace from strings.
+        lower (bool): Lower-case strings.
+        items (Schema): Schema of each element of an ``array`` field.
+        min_items / max_items (int): Bounds on the number of array elements.
+        description (str): Text for the OpenAPI spec.
+    """
+
+    def __init__(self, type='string', required=False, default=MISSING, min_length=None, max_length=None,
+                 format=None, clean=True, strip=True, lower=False, items=None, min_items=None, max_items=None,
+                 description=None):
+        if type not in _OPENAPI_TYPES:
+            raise ValueError(f"Unsupported field type '{type}'")
+        if type == 'array' and items is None:
+            raise ValueError('Array fields need an items schema')
+        self.type = type
+        self.required = required
+        self.default = default
+        self.min_length = min_length
+        self.max_length = max_length
+        self.format = format
+        self.clean = clean
+        self.strip = strip
+        self.lower = lower
+        self.items = items
+        self.min_items = min_items
+        self.max_items = max_items
+        self.description = description
+
+    def compile(self):
+        """Return ``check(value, path, errors) -> value`` for this declaration."""
+        if self.type == 'boolean':
+            def check(value, path, errors):
+                if not isinstance(value, bool):
+                    errors.append({'field': path, 'message': f'{path} must be true or false'})
+                return value
+            return check
+
+        if self.type == 'integer':
+            def check(value, path, errors):
+                if isinstance(value, bool) or not isinstance(value, int):
+                    errors.append({'field': path, 'message': f'{path} must be an integer'})
+                return value
+            return check
+
+        if self.type == 'array':
+            items, min_items, max_items = self.items, self.min_items, self.max_items
+
+            def check(value, path, errors):
+                if not isinstance(value, list):
+                    errors.append({'field': path, 'message': f'{path} must be a list'})
+                    return value
+                if max_items is not None and len(value) > max_items:
+                    # Checked before the items so oversized payloads cost no per-item work
+                    errors.append({'field': path, 'message': f'{path} must contain at most {max_items} items'})
+                    return value
+                if min_items is not None and len(value) < min_items:
+                    errors.append({'field': path, 'message': f'{path} must contain at least {min_items} items'})
+                return [items.check(item, f'{path}[{i}]', errors) for i, item in enumerate(value)]
+            return check
+
+        steps = []
+        if self.clean:
+            steps.append(sanitize_input)
+        if self.lower:
+            steps.append(str.lower)
+        required, strip, min_length, max_length, fmt = (self.required, self.strip, self.min_length,
+                                                        self.max_length, self.format)
+
+        def check(value, path, errors):
+            if value is None and not required:
+                return None
+            if not isinstance(value, str):
+                errors.append({'field': path, 'message': f'{path} must be a string'})
+                return value
+            if strip:
+                value = value.strip()
+            if not value:
+                if required:
+                    errors.append({'field': path, 'message': f'{path} cannot be empty'})
+                return None
+            # Lengths count what the client sent; escaping "&" or quotes must not push a value over
+            if min_length is not None and len(value) < min_length:
+                errors.append({'field': path, 'message': f'{path} must be at least {min_length} characters long'})
+                return value
+            if max_length is not None and len(value) > max_length:
+                errors.append({'field': path, 'message': f'{path} must be at most {max_length} characters long'})
+                return value
+            for step in steps:
+                value = step(value)
+            if fmt == 'email' and ('@' not in value or '.' not in value):
+                errors.append({'field': path, 'message': f'{path} must be a valid email address'})
+            elif fmt == 'url' and not value.lower().startswith(('http://', 'https://')):
+                errors.append({'field': path, 'message': f'{path} must be an http(s) URL'})
+            return value
+        return check
+
+    def to_openapi(self):
+        spec = {'type': _OPENAPI_TYPES[self.type]}
+        if self.type == 'array':
+            spec['items'] = self.items.to_openapi()
+            if self.min_items is not None:
+                spec['minItems'] = self.min_items
+            if self.max_items is not None:
+                spec['maxItems'] = self.max_items
+        if self.min_length is not None:
+            spec['minLength'] = self.min_length
+        if self.max_length is not None:
+            spec['maxLength'] = self.max_length
+        if self.format == 'email':
+            spec['format'] = 'email'
+        elif self.format == 'url':
+            spec['format'] = 'uri'
+        if self.default is not MISSING:
+            spec['default'] = self.default
+        if self.description:
+            spec['description'] = self.description
+        return spec
+
+
+class Schema:
+    """A compiled set of field declarations for a JSON object.
+
+    Args:
+        fields (dict): Field name -> ``Field``.
+        partial (bool): Every field is optional and absent fields are left
+            out of the result (for updates).
+    """
+
+    def __init__(self, fields, partial=False):
+        self.fields = fields
+        self.partial = partial
+        self._steps = [(name, field.required and not partial, field.default, field.compile())
+                       for name, field in fields.items()]
+
+    def check(self, data, prefix, errors):
+        """Validate one object, appending problems to ``errors``; returns the cleaned values."""
+        if not isinstance(data, dict):
+            errors.append({'field': prefix or 'body', 'message': f"{prefix or 'Request body'} must be a JSON object"})
+            return {}
+        cleaned = {}
+        for name, required, default, check in self._steps:
+            path = f'{prefix}.{name}' if prefix else name
+            if name not in data:
+                if required:
+                    errors.append({'field': path, 'message': f'{path} is required'})
+                elif default is not MISSING and not self.partial:
+                    cleaned[name] = default
+                continue
+            cleaned[name] = check(data[name], path, errors)
+        return cleaned
+
+    def validate(self, data):
+        """Return the cleaned body or raise ``ValidationError`` listing every problem."""
+        errors = []
+        cleaned = self.check(data, '', errors)
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def to_openapi(self):
+        spec = {'type': 'object', 'properties': {name: field.to_openapi() for name, field in self.fields.items()}}
+        required = [name for name, field in self.fields.items() if field.required and not self.partial]
+        if required:
+            spec['required'] = required
+        return spec
+
+
+def add_request_bodies(spec, schemas):
+    """Fill ``requestBody`` of an OpenAPI spec from ``{(path, method): Schema}``."""
+    for (path, method), schema in schemas.items():
+        operation = spec['paths'].setdefault(path, {}).setdefault(method, {})
+        operation['requestBody'] = {
+            'required': True,
+            'content': {'application/json': {'schema': schema.to_openapi()}},
+        }
+    return spec
@@ -0,0 +1,57 @@
+"""Measure cold start of the app: import alone versus import plus client warm-up.
+
+Each sample is a fresh interpreter, as for a newly booted worker. "import"
+is what a worker that never serves an upload pays; "create_app(warm=True)"
+also imports ``google.generativeai``, creates the Gemini model and imports
+the provider HTTP clients, which is what every import used to cost. The
+Gemini model is created with a placeholder API key when ``GOOGLE_API_KEY``
+is unset; creating it makes no network calls.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import backend.app
+imported = time.perf_counter()
+if {warm}:
+    backend.app.create_app(warm=True)
+done = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'total': done - start,
+                  'genai': 'google.generativeai' in sys.modules}}))
+"""
+
+
+def sample(warm):
+    env = dict(os.environ, DETECTION_BACKEND='gemini', LOG_LEVEL='WARNING')
+    env.setdefault('SECRET_KEY', 'benchmark-secret')
+    env.setdefault('GOOGLE_API_KEY', 'benchmark-placeholder-key')
+    output = subprocess.run([sys.executable, '-c', CHILD.format(warm=warm)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per variant')
+    args = parser.parse_args(argv)
+
+    print(f"{'variant':<26}{'median ms':>12}{'min ms':>10}{'gemini loaded':>16}")
+    for label, warm in (('import', False), ('create_app(warm=True)', True)):
+        samples = [sample(warm) for _ in range(args.runs)]
+        totals = sorted(s['total'] * 1000 for s in samples)
+        print(f'{label:<26}{totals[len(totals) // 2]:>12.0f}{totals[0]:>10.0f}{str(samples[0]["genai"]):>16}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Microbenchmarks of the upload hot paths, checked against a JSON baseline.
+
+- ``get_recommendations`` for five detected books against recorded provider
+  responses (``fixtures/provider_responses.json``), with an empty response
+  cache (cold) and with every response cached (warm).
+- Building recommendation dicts from a Google Books payload.
+- Title dedupe: search terms from detections with title variants, and a
+  ``TitleIndex`` over 500 titles.
+- Saving upload results (``_save_upload_results``: the shelf lookup, fuzzy
+  dedupe against the shelf and commit in ``upload_file``) on shelves of 10,
+  1k and 10k books.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_hotpaths --compare            # fail on >25% slower medians
+    python -m benchmarks.bench_hotpaths --save               # record a new baseline
+    python -m benchmarks.bench_hotpaths -k save_upload --compare --threshold 0.5
+"""
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+DATABASE = os.path.join(tempfile.mkdtemp(prefix='bench-hotpaths-'), 'bench.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+os.environ['DATABASE_NAME'] = DATABASE
+os.environ['DETECTION_BACKEND'] = 'local'
+os.environ['PROVIDER_CACHE_BACKEND'] = 'memory'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import backend.app as app_module  # noqa: E402
+from backend.app import (Book, Bookshelf, User, app, book_match_key_rows, book_match_keys, db,  # noqa: E402
+                         init_database, shelf_books)
+from backend.providers import (GoogleBooksCategoryProvider, GoogleBooksTitleProvider,  # noqa: E402
+                               OpenLibraryProvider, RecommendationPipeline)
+from backend.response_cache import MemoryTier, TieredCache  # noqa: E402
+from backend.title_matching import TitleIndex, normalize_title  # noqa: E402
+from benchmarks import microbench  # noqa: E402
+from benchmarks.microbench import parametrize  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, 'baselines', 'hotpaths.json')
+
+with open(os.path.join(HERE, 'fixtures', 'provider_responses.json')) as f:
+    FIXTURES = json.load(f)
+DETECTED = [{'title': title, 'author': None, 'confidence': None} for title in FIXTURES['detected']]
+
+
+# --- Recorded providers ---
+
+class _Recorded:
+    """Serves the recorded response for each URL instead of calling the API."""
+
+    def fetch_json(self, url, timeout):
+        return FIXTURES['responses'][url]
+
+
+class RecordedTitleProvider(_Recorded, GoogleBooksTitleProvider):
+    pass
+
+
+class RecordedCategoryProvider(_Recorded, GoogleBooksCategoryProvider):
+    pass
+
+
+class RecordedOpenLibraryProvider(_Recorded, OpenLibraryProvider):
+    pass
+
+
+def recorded_pipeline():
+    cache = TieredCache(MemoryTier(), None)
+    providers = [cls(cache=cache) for cls in (RecordedTitleProvider, RecordedCategoryProvider,
+                                              RecordedOpenLibraryProvider)]
+    return RecommendationPipeline(providers, cache=cache)
+
+
+# --- Recommendations ---
+
+def bench_get_recommendations_cold(benchmark):
+    def setup():
+        app_module.recommendation_pipeline = recorded_pipeline()
+
+    result = benchmark.pedantic(app_module.get_recommendations, args=(DETECTED,), setup=setup, rounds=200)
+    assert len(result) == 6 and not result[0]['title'].startswith('Sample Rec')
+
+
+def bench_get_recommendations_warm(benchmark):
+    app_module.recommendation_pipeline = recorded_pipeline()
+    app_module.get_recommendations(DETECTED)  # Fill the cache
+    misses = app_module.recommendation_pipeline.cache.misses
+    result = benchmark(app_module.get_recommendations, DETECTED)
+    assert len(result) == 6 and app_module.recommendation_pipeline.cache.misses == misses
+
+
+def bench_book_dicts_from_google_payload(benchmark):
+    provider = GoogleBooksTitleProvider()
+    payload = FIXTURES['responses'][provider.build_url('Dune')]
+    books = benchmark(provider.parse, payload)
+    assert len(books) == 8
+
+
+# --- Title dedupe ---
+
+TITLE_WORDS = ['Amber', 'Harbor', 'Lantern', 'Meridian', 'Orchard', 'Quarry', 'Saffron', 'Tundra', 'Velvet',
+               'Willow', 'Cobalt', 'Falcon', 'Granite', 'Juniper', 'Marble', 'Nomad', 'Pilgrim', 'Raven',
+               'Sparrow', 'Thistle', 'Umber', 'Vesper', 'Zephyr', 'Cinder', 'Glacier', 'Hollow', 'Ivory',
+               'Jasper', 'Kestrel', 'Lagoon', 'Monsoon', 'Nettle', 'Obsidian', 'Prairie', 'Quill', 'Russet']
+
+
+def _title_variants(count):
+    """``count`` titles; every third one is spelled as a variant of the one before it."""
+    rng = random.Random(0)
+    titles = []
+    for i in range(count):
+        if i % 3 == 1:
+            titles.append(f'{titles[-1]}, The')
+        elif i % 3 == 2:
+            titles.append(f'THE {titles[-2].upper()}!')
+        else:
+            first, second, third = rng.sample(TITLE_WORDS, 3)
+            titles.append(f'{first} {second} and the {third}')
+    return titles
+
+
+def bench_search_terms_dedupe(benchmark):
+    detections = [{'title': t, 'author': None, 'confidence': None} for t in _title_variants(30)]
+    terms = benchmark(app_module._search_terms, detections)
+    assert len(terms) == app_module.MAX_SEARCH_TERMS
+
+
+def bench_title_index_500(benchmark):
+    titles = _title_variants(500)
+
+    def dedupe():
+        index = TitleIndex.from_env()
+        return sum(index.add_if_new(title) for title in titles)
+
+    assert benchmark(dedupe) <= 500 // 3 + 1  # Variants never count as new titles
+
+
+# --- Upload persistence ---
+
+SAVE_ROUNDS = {10: 30, 1000: 10, 10000: 3}
+SYLLABLES = ['ka', 'lo', 'mer', 'ith', 'dun', 'sa', 'vel', 'orn', 'bri', 'tas', 'qu', 'em', 'gar', 'phi', 'nox',
+             'ul', 'rea', 'zan', 'cor', 'if']
+
+
+def _shelf_titles(shelf_name, size):
+    """``size`` distinct made-up titles, few of them near each other (like a real shelf)."""
+    rng = random.Random(shelf_name)
+    titles = set()
+    while len(titles) < size:
+        words = [''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).capitalize()
+                 for _ in range(rng.randint(2, 5))]
+        titles.add(' '.join(words))
+    return sorted(titles)
+
+
+def _user_with_shelves(size):
+    """Create a user whose detected and recommendations shelves hold ``size`` books each."""
+    with app.app_context():
+        user = User(username=f'bench_{size}', email=f'bench_{size}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        book_id = db.session.query(db.func.coalesce(db.func.max(Book.id), 0)).scalar()
+        for shelf_name in ('Detected from Upload', 'Recommendations from Upload'):
+            shelf = Bookshelf(name=shelf_name, user_id=user.id)
+            db.session.add(shelf)
+            db.session.flush()
+            rows = []
+            for title in _shelf_titles(shelf_name, size):
+                book_id += 1
+                rows.append({'id': book_id, 'title': title, 'normalized_title': normalize_title(title),
+                             'authors': 'Bench Author'})
+            if rows:
+                db.session.execute(Book.__table__.insert(), rows)
+                db.session.execute(shelf_books.insert(),
+                                   [{'bookshelf_id': shelf.id, 'book_id': row['id']} for row in rows])
+                db.session.execute(book_match_keys.insert(), [
+                    key for row in rows for key in book_match_key_rows(row['id'], row['title'], row['normalized_title'])
+                ])
+        db.session.commit()
+        return user.id
+
+
+@parametrize('shelf_size', [10, 1000, 10000])
+def bench_save_upload_results(benchmark, shelf_size):
+    user_id = _user_with_shelves(shelf_size)
+    recommendations = [dict(book) for book in recorded_pipeline().recommend(FIXTURES['detected'])]
+    rounds = iter(range(10 ** 6))
+    on_shelf = _shelf_titles('Detected from Upload', shelf_size)[3]
+
+    def setup():
+        # Fresh session per round, like a request; previous round's books removed so sizes stay fixed
+        db.session.remove()
+        added = db.select(Book.id).where(Book.authors == 'Bench Round')
+        db.session.execute(shelf_books.delete().where(shelf_books.c.book_id.in_(added)))
+        db.session.execute(book_match_keys.delete().where(book_match_keys.c.book_id.in_(added)))
+        db.session.execute(Book.__table__.delete().where(Book.authors == 'Bench Round'))
+        db.session.commit()
+        db.session.remove()
+        rng = random.Random(next(rounds))
+        detections = [{'title': ' '.join(rng.sample(TITLE_WORDS, 3)), 'author': 'Bench Round', 'confidence': 0.9}
+                      for _ in range(5)]
+        detections.append({'title': on_shelf, 'author': None, 'confidence': 0.9})  # Already on the shelf
+        recs = [dict(rec, authors=['Bench Round']) for rec in recommendations]
+        return (user_id, detections, recs), {}
+
+    with app.app_context():
+        message = benchmark.pedantic(app_module._save_upload_results, setup=setup,
+                                     rounds=SAVE_ROUNDS[shelf_size], warmup_rounds=1 if shelf_size < 10000 else 0)
+    assert message.startswith('Added 5 detected and 6 recommended'), message
+
+
+def main(argv=None):
+    init_database()
+    try:
+        return microbench.main(sys.modules[__name__], BASELINE, argv)
+    finally:
+        app_module.shutdown_executors()
+        shutil.rmtree(os.path.dirname(DATABASE), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Report password verifications (logins) per second per core for each hash setting.
+
+Each setting is timed twice: on one worker, which gives the per-core rate,
+and on ``PasswordHasher`` pools with one worker per core driven by as many
+concurrent callers, which shows how the rate scales with cores.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_password_hashing --seconds 3
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.passwords import HashSettings, PasswordHasher, argon2  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def candidate_settings():
+    settings = [
+        HashSettings(iterations=600_000),
+        HashSettings(iterations=1_000_000),
+        HashSettings(method='scrypt', scrypt_n=2 ** 14),
+        HashSettings(method='scrypt', scrypt_n=2 ** 15),
+    ]
+    if argon2 is not None:
+        settings.append(HashSettings(method='argon2', argon2_memory_cost=19456, argon2_time_cost=2,
+                                     argon2_parallelism=1))
+        settings.append(HashSettings(method='argon2'))
+    return settings
+
+
+def logins_per_second(hasher, stored, seconds, callers):
+    """Verify ``stored`` from ``callers`` threads for ``seconds``; return verifications/s."""
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            assert hasher.verify(stored, PASSWORD)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as callers_pool:
+        total = sum(callers_pool.map(lambda _: worker(), range(callers)))
+    return total / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0, help='Measuring time per run')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--processes', action='store_true', help='Use a process pool')
+    args = parser.parse_args(argv)
+    if argon2 is None:
+        print('argon2-cffi is not installed; argon2 settings are skipped')
+
+    print(f"{'setting':<40}{'ms/login':>10}{'logins/s/core':>15}{f'{args.cores}-core total':>16}")
+    for settings in candidate_settings():
+        stored = settings.hash(PASSWORD)
+        single = PasswordHasher(settings, workers=1, use_processes=args.processes)
+        pooled = PasswordHasher(settings, workers=args.cores, use_processes=args.processes)
+        try:
+            per_core = logins_per_second(single, stored, args.seconds, callers=1)
+            total = logins_per_second(pooled, stored, args.seconds, callers=args.cores * 2)
+        finally:
+            single.shutdown()
+            pooled.shutdown()
+        print(f'{settings.label():<40}{1000 / per_core:>10.1f}{per_core:>15.1f}{total:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
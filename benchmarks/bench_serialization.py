@@ -0,0 +1,122 @@
+"""Compare JSON serialization time of the stdlib and orjson providers.
+
+Builds a temporary SQLite database with one large shelf and many public
+shelves, then times both the bare serialization of representative payloads
+and the full endpoints (shelf details and the public list, with the public
+response cache bypassed) under each provider.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serialization --books 5000 --shelves 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import Book, Bookshelf, User, app, db, public_cache  # noqa: E402
+from backend.json_provider import OrjsonProvider, StdlibJSONProvider, orjson  # noqa: E402
+
+
+def timed(func, repeat):
+    """Return the median wall time of ``func()`` in milliseconds."""
+    func()  # Warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def seed(books, shelves):
+    """Create a user owning one shelf of ``books`` books and ``shelves`` public shelves."""
+    user = User(username='benchmark', email='benchmark@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    big = Bookshelf(name='Large shelf', user_id=user.id, is_public=True)
+    big.books = [Book(title=f'Benchmark title number {i}', authors='Author Name',
+                      isbn=str(9780000000000 + i)) for i in range(books)]
+    db.session.add(big)
+    for i in range(shelves):
+        db.session.add(Bookshelf(name=f'Public shelf {i}', description='Shared shelf',
+                                 user_id=user.id, is_public=True))
+    db.session.commit()
+    return user.id, big.id
+
+
+def sample_payloads(books, shelves):
+    now = datetime.now()
+    shelf = {
+        'id': 1, 'name': 'Large shelf', 'description': '', 'is_public': True,
+        'created_at': now, 'updated_at': now,
+        'books': [{'id': i, 'title': f'Benchmark title number {i}', 'author': 'Author Name',
+                   'isbn': str(9780000000000 + i), 'cover_image_url': None, 'added_at': now}
+                  for i in range(books)],
+    }
+    public_list = [{'id': i, 'name': f'Public shelf {i}', 'description': 'Shared shelf',
+                    'owner': {'id': 1, 'username': 'benchmark'}, 'book_count': 0, 'created_at': now}
+                   for i in range(shelves)]
+    return {'shelf payload': shelf, 'public list payload': public_list}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--shelves', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    providers = [('stdlib', StdlibJSONProvider(app))]
+    if orjson is not None:
+        providers.append(('orjson', OrjsonProvider(app)))
+    else:
+        print('orjson is not installed; only the stdlib provider is measured')
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    public_cache.ttl = 0  # Rebuild public responses on every request
+    results = {}
+    try:
+        with app.app_context():
+            db.create_all()
+            user_id, shelf_id = seed(args.books, args.shelves)
+            token = jwt.encode({'user_id': user_id, 'exp': datetime.now(timezone.utc) + timedelta(hours=1)},
+                               app.config['SECRET_KEY'], algorithm='HS256')
+        headers = {'Authorization': f'Bearer {token}'}
+        endpoints = {
+            'GET /api/bookshelves/<id>': (f'/api/bookshelves/{shelf_id}', headers),
+            'GET /api/public/bookshelves': ('/api/public/bookshelves', {}),
+        }
+        payloads = sample_payloads(args.books, args.shelves)
+        client = app.test_client()
+        for name, provider in providers:
+            app.json = provider
+            with app.app_context():
+                for label, payload in payloads.items():
+                    results[(label, name)] = timed(lambda: provider.response(payload), args.repeat)
+            for label, (path, request_headers) in endpoints.items():
+                assert client.get(path, headers=request_headers).status_code == 200
+                results[(label, name)] = timed(lambda: client.get(path, headers=request_headers), args.repeat)
+        with app.app_context():
+            db.drop_all()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+    names = [name for name, _ in providers]
+    print(f"{'median ms':<32}" + ''.join(f'{name:>10}' for name in names))
+    for label in list(payloads) + list(endpoints):
+        print(f'{label:<32}' + ''.join(f'{results[(label, name)]:>10.1f}' for name in names))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Compare the sync and async upload paths under concurrent uploads.
+
+Uses the local stand-in detection model and book provider
+(``LocalProvider``), both with fixed latency, so the numbers reflect how
+each path waits rather than network variance. The sync path runs each upload's detection and
+recommendations on a thread pool (one thread per concurrent upload, as
+under a threaded server); the async path runs every upload as a coroutine
+on one event loop.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_upload_async --uploads 200 --threads 32 --latency-ms 200
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+os.environ['DETECTION_BACKEND'] = 'local'
+os.environ['PROVIDER_CACHE_BACKEND'] = 'memory'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import backend.app as app_module  # noqa: E402
+from backend.detection import LocalBackend  # noqa: E402
+from backend.llm_executor import AdaptiveLLMExecutor  # noqa: E402
+from backend.providers import LocalProvider, RecommendationPipeline  # noqa: E402
+
+
+def write_images(directory, count):
+    """Write ``count`` distinct PNGs so identical-image coalescing does not kick in."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'shelf-{i}.png')
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32), (i % 256, (i // 256) % 256, 128)).save(buffer, format='PNG')
+        with open(path, 'wb') as f:
+            f.write(buffer.getvalue())
+        paths.append(path)
+    return paths
+
+
+def configure(args, run):
+    """Fresh model, limiter and provider (with an empty cache) for one run."""
+    # Per-run title prefix so provider results are never served from the previous run's cache
+    title_sets = [[f'{run} book {i} {j}' for j in range(args.books)] for i in range(args.uploads)]
+    app_module.llm_model = LocalBackend(title_sets=title_sets, latency=args.latency_ms / 1000.0)
+    app_module.llm_executor = AdaptiveLLMExecutor(max_in_flight=args.uploads, max_queue=args.uploads,
+                                                 latency_target=3600)
+    app_module.recommendation_pipeline = RecommendationPipeline(
+        [LocalProvider(delay=args.provider_ms / 1000.0, budget=30.0)])
+
+
+class PeakThreads:
+    """Samples ``threading.active_count()`` in the background."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(paths, threads):
+    def upload(path):
+        detections = app_module.detect_books_detailed(path)
+        return app_module.get_recommendations(detections)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(upload, paths))
+
+
+def run_async(paths):
+    async def upload(path):
+        detections = await app_module.detect_books_detailed_async(path)
+        return await app_module.get_recommendations_async(detections)
+
+    async def all_uploads():
+        return await asyncio.gather(*(upload(path) for path in paths))
+
+    return asyncio.run(all_uploads())
+
+
+def report(label, func, uploads):
+    with PeakThreads() as threads:
+        start = time.perf_counter()
+        results = func()
+        elapsed = time.perf_counter() - start
+    assert len(results) == uploads and all(results)
+    print(f'{label:<28}{elapsed:>10.2f}{uploads / elapsed:>12.1f}{threads.peak:>14}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=200, help='Concurrent uploads per run')
+    parser.add_argument('--threads', type=int, default=32, help='Thread pool size of the sync run')
+    parser.add_argument('--books', type=int, default=3, help='Books detected per upload')
+    parser.add_argument('--latency-ms', type=float, default=200, help='Stand-in model latency')
+    parser.add_argument('--provider-ms', type=float, default=100, help='Stand-in provider latency')
+    args = parser.parse_args(argv)
+
+    print(f"{'path':<28}{'seconds':>10}{'uploads/s':>12}{'peak threads':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_images(directory, args.uploads)
+        configure(args, 'sync')
+        report(f'sync ({args.threads} threads)', lambda: run_sync(paths, args.threads), args.uploads)
+        configure(args, 'async')
+        report('async (one event loop)', lambda: run_async(paths), args.uploads)
+    app_module.shutdown_executors()
+
+
+if __name__ == '__main__':
+    main()
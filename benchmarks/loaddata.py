@@ -0,0 +1,163 @@
+"""Generate a SQLite database of users, shelves, books, friendships and communities.
+
+The data set is deterministic for a given ``--seed``. Rows are written with
+bulk inserts (bypassing the change log hooks), and every user shares one
+password hash, so generating tens of thousands of rows takes seconds. A
+manifest (``<database>.manifest.json``) records the ids the load test
+scenarios use: users, public shelves and the large shelf with its owner.
+
+Run from the repository root:
+
+    python -m benchmarks.loaddata --database /tmp/load.db --users 1000 --large-shelf-books 10000
+
+Serve it with ``DATABASE_NAME=/tmp/load.db`` and the same ``SECRET_KEY``
+that ``benchmarks.loadtest`` uses to mint tokens.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+os.environ.setdefault('SECRET_KEY', 'load-test-secret-key-0123456789abcdef')
+os.environ.setdefault('DETECTION_BACKEND', 'local')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PASSWORD = 'load-test-password'
+
+WORDS = ['Shadow', 'River', 'Glass', 'Winter', 'Garden', 'Iron', 'Silent', 'Empire', 'Letters', 'Night',
+         'Ocean', 'Crown', 'Forgotten', 'Stone', 'Summer', 'Machine', 'Library', 'Storm', 'Paper', 'House']
+SURNAMES = ['Okafor', 'Lindqvist', 'Moreau', 'Tanaka', 'Alvarez', 'Novak', 'Haddad', 'Byrne', 'Sato', 'Kowalski']
+
+
+def _title(rng, n):
+    return f'The {rng.choice(WORDS)} {rng.choice(WORDS)} of {rng.choice(WORDS)} {n}'
+
+
+def _author(rng):
+    return f'{rng.choice("ABCDEFGHJKLMNPRST")}. {rng.choice(SURNAMES)}'
+
+
+def manifest_path(database):
+    return f'{database}.manifest.json'
+
+
+def generate(database, users=200, shelves_per_user=3, books_per_shelf=20, friends_per_user=5,
+             communities=20, members_per_community=25, large_shelf_books=5000, public_fraction=0.5,
+             seed=0):
+    """Create ``database`` (replacing an existing file) and return the manifest.
+
+    Must run in a process whose ``DATABASE_NAME`` is ``database`` (set before
+    ``backend.app`` is imported; ``main`` does this).
+    """
+    from backend.app import Book, Bookshelf, Community, FriendRequest, User, app, book_match_key_rows, \
+        book_match_keys, community_members, db, init_database, normalize_title, password_hasher, shelf_books
+
+    for path in (database, f'{database}-wal', f'{database}-shm', manifest_path(database)):
+        if os.path.exists(path):
+            os.remove(path)
+    init_database()
+    rng = random.Random(seed)
+    password_hash = password_hasher.hash(PASSWORD)
+
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'load_user_{i}', 'email': f'load_user_{i}@example.com',
+             'password_hash': password_hash}
+            for i in range(1, users + 1)
+        ])
+
+        shelves, links, books = [], [], []
+        book_id = 0
+
+        def add_books(shelf_id, count):
+            nonlocal book_id
+            for _ in range(count):
+                book_id += 1
+                title = _title(rng, book_id)
+                books.append({'id': book_id, 'title': title, 'normalized_title': normalize_title(title),
+                              'authors': _author(rng)})
+                links.append({'bookshelf_id': shelf_id, 'book_id': book_id})
+
+        for user_id in range(1, users + 1):
+            for n in range(shelves_per_user):
+                shelf_id = len(shelves) + 1
+                shelves.append({'id': shelf_id, 'name': f'Shelf {n + 1} of load_user_{user_id}',
+                                'description': 'Generated for load testing', 'user_id': user_id,
+                                'is_public': rng.random() < public_fraction})
+                add_books(shelf_id, books_per_shelf)
+        large_shelf_id = len(shelves) + 1
+        shelves.append({'id': large_shelf_id, 'name': 'Large shelf', 'description': 'Generated for load testing',
+                        'user_id': 1, 'is_public': True})
+        add_books(large_shelf_id, large_shelf_books)
+
+        db.session.execute(Bookshelf.__table__.insert(), shelves)
+        db.session.execute(Book.__table__.insert(), books)
+        db.session.execute(shelf_books.insert(), links)
+        db.session.execute(book_match_keys.insert(), [
+            row for book in books for row in book_match_key_rows(book['id'], book['title'], book['normalized_title'])
+        ])
+
+        pairs = set()
+        for user_id in range(1, users + 1):
+            for friend_id in rng.sample(range(1, users + 1), min(friends_per_user, users - 1) + 1):
+                if friend_id != user_id and (friend_id, user_id) not in pairs:
+                    pairs.add((user_id, friend_id))
+        if pairs:
+            db.session.execute(FriendRequest.__table__.insert(), [
+                {'requester_id': a, 'addressee_id': b, 'status': 'accepted'} for a, b in sorted(pairs)
+            ])
+
+        memberships = []
+        if communities:
+            db.session.execute(Community.__table__.insert(), [
+                {'id': c, 'name': f'Load community {c}', 'description': 'Generated for load testing',
+                 'owner_id': rng.randint(1, users)}
+                for c in range(1, communities + 1)
+            ])
+            for c in range(1, communities + 1):
+                memberships.extend({'community_id': c, 'user_id': u}
+                                   for u in rng.sample(range(1, users + 1), min(members_per_community, users)))
+            db.session.execute(community_members.insert(), memberships)
+        db.session.commit()
+        db.engine.dispose()
+
+    manifest = {
+        'users': users,
+        'password': PASSWORD,
+        'public_shelves': [s['id'] for s in shelves if s['is_public']],
+        'large_shelf': {'id': large_shelf_id, 'owner': 1, 'books': large_shelf_books},
+        'counts': {'users': users, 'shelves': len(shelves), 'books': len(books), 'friendships': len(pairs),
+                   'communities': communities, 'memberships': len(memberships)},
+    }
+    with open(manifest_path(database), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLite file to create (replaced if it exists)')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--shelves-per-user', type=int, default=3)
+    parser.add_argument('--books-per-shelf', type=int, default=20)
+    parser.add_argument('--friends-per-user', type=int, default=5)
+    parser.add_argument('--communities', type=int, default=20)
+    parser.add_argument('--members-per-community', type=int, default=25)
+    parser.add_argument('--large-shelf-books', type=int, default=5000)
+    parser.add_argument('--public-fraction', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    database = os.path.abspath(args.database)
+    os.environ['DATABASE_NAME'] = database
+    manifest = generate(database, users=args.users, shelves_per_user=args.shelves_per_user,
+                        books_per_shelf=args.books_per_shelf, friends_per_user=args.friends_per_user,
+                        communities=args.communities, members_per_community=args.members_per_community,
+                        large_shelf_books=args.large_shelf_books, public_fraction=args.public_fraction,
+                        seed=args.seed)
+    print(f"Wrote {database}: {json.dumps(manifest['counts'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""Load test the API over HTTP and report latency percentiles and throughput.
+
+Scenarios:
+
+- ``upload_burst``: ``POST /api/upload`` with distinct shelf images from many users.
+- ``public_browse``: pages of ``/api/public/bookshelves`` and single public shelves.
+- ``friend_list``: ``GET /api/friends`` for random users.
+- ``large_shelf``: ``GET /api/bookshelves/<id>`` of a shelf with thousands of books.
+
+By default a fresh database is generated (``benchmarks.loaddata``) and the
+app is served in this process by a threaded WSGI server, with the local
+stand-ins for the detection model (``DETECTION_BACKEND=local``) and the
+book APIs (``RECOMMENDATION_PROVIDERS=local``) at the given latencies and
+rate limiting disabled. With ``--url`` the scenarios run against a server
+started separately (for example ``python -m backend.serve``) on a database
+made by ``benchmarks.loaddata``; it must use the same ``SECRET_KEY``, the
+stand-ins and a ``RATE_LIMIT`` high enough for the test.
+
+Each scenario reports requests, errors (non-2xx, by status), requests per
+second and p50/p95/p99/max latency. ``--output`` writes the report as JSON
+with the current commit; ``--compare`` prints the change against such a file.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest --requests 500 --concurrency 16 --output load.json
+    python -m benchmarks.loadtest --requests 500 --concurrency 16 --compare load.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import requests
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'load-test-secret-key-0123456789abcdef')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.loaddata import manifest_path  # noqa: E402
+
+# --- Scenarios ---
+# Each takes (session, base_url, context, i) and returns the response of one request.
+
+
+def upload_burst(session, base_url, context, i):
+    user_id = context['rng'].randint(1, context['manifest']['users'])
+    image = context['images'][i % len(context['images'])]
+    return session.post(f'{base_url}/api/upload', headers=context['auth'](user_id),
+                        files={'bookshelfImage': ('shelf.png', image, 'image/png')})
+
+
+def public_browse(session, base_url, context, i):
+    shelves = context['manifest']['public_shelves']
+    if i % 2 == 0:
+        pages = max(1, len(shelves) // 20)
+        return session.get(f'{base_url}/api/public/bookshelves', params={'page': i // 2 % pages + 1})
+    return session.get(f"{base_url}/api/public/bookshelves/{context['rng'].choice(shelves)}")
+
+
+def friend_list(session, base_url, context, i):
+    user_id = context['rng'].randint(1, context['manifest']['users'])
+    return session.get(f'{base_url}/api/friends', headers=context['auth'](user_id))
+
+
+def large_shelf(session, base_url, context, i):
+    shelf = context['manifest']['large_shelf']
+    return session.get(f"{base_url}/api/bookshelves/{shelf['id']}", headers=context['auth'](shelf['owner']))
+
+
+SCENARIOS = {
+    'upload_burst': upload_burst,
+    'public_browse': public_browse,
+    'friend_list': friend_list,
+    'large_shelf': large_shelf,
+}
+
+
+# --- Runner ---
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100.0 * len(sorted_values) + 0.4999)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(name, base_url, context, requests_total, concurrency):
+    """Send ``requests_total`` requests from ``concurrency`` threads; return the summary."""
+    scenario = SCENARIOS[name]
+    counter = iter(range(requests_total))
+    counter_lock = threading.Lock()
+    latencies, statuses = [], Counter()
+    results_lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                status = scenario(session, base_url, context, i).status_code
+            except requests.RequestException:
+                status = 'connection error'
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    errors = {str(status): count for status, count in statuses.items()
+              if not (isinstance(status, int) and 200 <= status < 300)}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def make_context(manifest, uploads, seed):
+    secret = os.environ['SECRET_KEY']
+    tokens = {}
+
+    def auth(user_id):
+        token = tokens.get(user_id)
+        if token is None:
+            token = tokens[user_id] = jwt.encode(
+                {'user_id': user_id, 'username': f'load_user_{user_id}',
+                 'exp': datetime.now(timezone.utc) + timedelta(hours=2)},
+                secret, algorithm='HS256')
+        return {'Authorization': f'Bearer {token}'}
+
+    images = []
+    for i in range(uploads):
+        buffer = io.BytesIO()
+        Image.new('RGB', (48, 32), (i % 256, (i // 256) % 256, 200)).save(buffer, format='PNG')
+        images.append(buffer.getvalue())
+    return {'manifest': manifest, 'auth': auth, 'images': images, 'rng': random.Random(seed)}
+
+
+def serve_in_process(database, args):
+    """Generate ``database`` and serve the app on a local port; returns ``(base_url, server, manifest)``."""
+    os.environ.update({
+        'DATABASE_NAME': database,
+        'DETECTION_BACKEND': 'local',
+        'LOCAL_DETECTION_LATENCY_MS': str(args.model_ms),
+        'RECOMMENDATION_PROVIDERS': 'local',
+        'LOCAL_PROVIDER_LATENCY_MS': str(args.provider_ms),
+        'PROVIDER_CACHE_BACKEND': 'memory',
+    })
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from benchmarks.loaddata import generate
+    manifest = generate(database, users=args.users, large_shelf_books=args.large_shelf_books, seed=args.seed)
+
+    import backend.app as app_module
+    app_module.limiter.enabled = False
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server, manifest
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    header = f"{'scenario':<16}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    for name, result in report['scenarios'].items():
+        errors = sum(result['errors'].values())
+        print(f"{name:<16}{result['requests']:>9}{errors:>8}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}"
+              f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['max_ms']:>9.1f}")
+        if result['errors']:
+            print(f"{'':<16}errors by status: {result['errors']}")
+    if baseline:
+        print(f"\nChange against {baseline.get('commit') or 'baseline'} (negative latency / positive rps is better):")
+        for name, result in report['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if before[key]:
+                    changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+            print(f"{name:<16}{'  '.join(changes)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenario names')
+    parser.add_argument('--requests', type=int, default=300, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--url', help='Base URL of a running server (default: serve in this process)')
+    parser.add_argument('--database', help='Database made by benchmarks.loaddata (required with --url)')
+    parser.add_argument('--users', type=int, default=200, help='Generated users (in-process only)')
+    parser.add_argument('--large-shelf-books', type=int, default=5000, help='Books on the large shelf')
+    parser.add_argument('--model-ms', type=float, default=300, help='Stand-in model latency (in-process)')
+    parser.add_argument('--provider-ms', type=float, default=50, help='Stand-in provider latency (in-process)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    parser.add_argument('--compare', help='Print the change against a report written with --output')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            if not args.database:
+                parser.error('--database is required with --url')
+            with open(manifest_path(os.path.abspath(args.database))) as f:
+                manifest = json.load(f)
+            base_url = args.url.rstrip('/')
+        else:
+            base_url, server, manifest = serve_in_process(os.path.join(directory, 'load.db'), args)
+
+        context = make_context(manifest, uploads=args.requests, seed=args.seed)
+        report = {
+            'commit': current_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'scenarios': {},
+        }
+        for name in names:
+            report['scenarios'][name] = run_scenario(name, base_url, context, args.requests, args.concurrency)
+
+        if server is not None:
+            server.shutdown()
+            import backend.app as app_module
+            app_module.shutdown_executors()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
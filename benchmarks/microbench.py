@@ -0,0 +1,194 @@
+"""Small microbenchmark harness with JSON baselines.
+
+Benchmarks are functions named ``bench_*`` that take a ``benchmark``
+argument and call it the way pytest-benchmark's fixture is called:
+``benchmark(fn, *args)`` times repeated calls, and
+``benchmark.pedantic(fn, setup=..., rounds=...)`` runs ``setup`` before
+every round. ``@parametrize('name', values)`` runs a benchmark once per
+value, reported as ``bench_x[value]``.
+
+``main`` runs the benchmarks of a module and prints min/median/mean/stddev
+per benchmark. ``--save`` writes the results to a JSON baseline.
+``--compare`` checks them against one and exits with status 1 when a
+median is more than ``--threshold`` slower than in the baseline. Timings
+only compare meaningfully on the machine that recorded the baseline, so
+the baseline records the machine and a mismatch is reported.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Fast functions are called in batches so each timed round lasts at least this long
+MIN_ROUND_SECONDS = 0.0005
+
+
+def parametrize(name, values):
+    """Run the decorated benchmark once per value, passed as keyword ``name``."""
+    def decorator(func):
+        func.parameters = (name, list(values))
+        return func
+    return decorator
+
+
+class Benchmark:
+    """Times a function; called like pytest-benchmark's ``benchmark`` fixture.
+
+    Args:
+        min_time (float): Keep running rounds for at least this many seconds.
+        min_rounds / max_rounds (int): Bounds on the number of rounds.
+    """
+
+    def __init__(self, min_time=0.5, min_rounds=5, max_rounds=10000):
+        self.min_time = min_time
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.samples = []
+        self.iterations = 1
+
+    def __call__(self, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)  # Warm up and calibrate
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        once = time.perf_counter() - start
+        self.iterations = max(1, int(MIN_ROUND_SECONDS / once)) if once > 0 else 1000
+        deadline = time.perf_counter() + self.min_time
+        while len(self.samples) < self.max_rounds and (
+                len(self.samples) < self.min_rounds or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            for _ in range(self.iterations):
+                result = fn(*args, **kwargs)
+            self.samples.append((time.perf_counter() - start) / self.iterations)
+        return result
+
+    def pedantic(self, target, args=(), kwargs=None, setup=None, rounds=1, iterations=1, warmup_rounds=0):
+        """Run ``rounds`` timed rounds of ``iterations`` calls, calling ``setup`` before each.
+
+        ``setup`` may return ``(args, kwargs)`` for the round, as in pytest-benchmark.
+        """
+        result = None
+        self.iterations = iterations
+        for round_number in range(warmup_rounds + rounds):
+            call_args, call_kwargs = args, kwargs or {}
+            if setup is not None:
+                prepared = setup()
+                if prepared is not None:
+                    call_args, call_kwargs = prepared
+            start = time.perf_counter()
+            for _ in range(iterations):
+                result = target(*call_args, **call_kwargs)
+            if round_number >= warmup_rounds:
+                self.samples.append((time.perf_counter() - start) / iterations)
+        return result
+
+    def stats(self):
+        samples = self.samples
+        return {
+            'min': min(samples),
+            'max': max(samples),
+            'mean': statistics.fmean(samples),
+            'median': statistics.median(samples),
+            'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            'rounds': len(samples),
+            'iterations': self.iterations,
+        }
+
+
+def collect(module):
+    """Return ``[(name, func, kwargs)]`` for the module's ``bench_*`` functions."""
+    cases = []
+    for name, func in vars(module).items():
+        if not name.startswith('bench_') or not callable(func):
+            continue
+        parameters = getattr(func, 'parameters', None)
+        if parameters is None:
+            cases.append((name, func, {}))
+        else:
+            param, values = parameters
+            cases.extend((f'{name}[{value}]', func, {param: value}) for value in values)
+    return cases
+
+
+def machine():
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count()}
+
+
+def _format(seconds):
+    if seconds >= 1:
+        return f'{seconds:.3f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.3f} ms'
+    return f'{seconds * 1e6:.2f} us'
+
+
+def compare(results, baseline, threshold):
+    """Print the change per benchmark; return the names slower than ``threshold``."""
+    if baseline.get('machine') != machine():
+        print(f"Note: the baseline was recorded on a different machine ({baseline.get('machine')}); "
+              "re-record it with --save on this one for reliable checks.")
+    regressions = []
+    print(f"\n{'benchmark':<44}{'baseline':>14}{'now':>14}{'change':>10}")
+    for name, stats in results.items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            print(f"{name:<44}{'-':>14}{_format(stats['median']):>14}{'new':>10}")
+            continue
+        change = (stats['median'] - before['median']) / before['median']
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{name:<44}{_format(before['median']):>14}{_format(stats['median']):>14}{change:>+10.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(module, default_baseline, argv=None):
+    parser = argparse.ArgumentParser(description=(module.__doc__ or '').splitlines()[0])
+    parser.add_argument('-k', dest='keyword', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=default_baseline, help='Baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='Write the results to the baseline file')
+    parser.add_argument('--compare', action='store_true', help='Fail on regressions against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown of the median before a benchmark counts as regressed')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds per benchmark (non-pedantic)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'benchmark':<44}{'min':>14}{'median':>14}{'mean':>14}{'stddev':>14}{'rounds':>8}")
+    for name, func, kwargs in collect(module):
+        if args.keyword and args.keyword not in name:
+            continue
+        benchmark = Benchmark(min_time=args.min_time)
+        func(benchmark, **kwargs)
+        stats = results[name] = benchmark.stats()
+        print(f"{name:<44}{_format(stats['min']):>14}{_format(stats['median']):>14}{_format(stats['mean']):>14}"
+              f"{_format(stats['stddev']):>14}{stats['rounds']:>8}")
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            status = 1
+    if args.save:
+        baseline = {'machine': machine(), 'benchmarks': results}
+        if args.keyword and os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)
+            saved['benchmarks'].update(results)
+            baseline = dict(saved, machine=machine())
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'\nWrote {args.baseline}')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit('Run a benchmark module instead, e.g. python -m benchmarks.bench_hotpaths')
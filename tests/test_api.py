@@ -1,3 +1,5 @@
+import gzip
+import io
 import os
 import sys
 import tempfile
@@ -5,10 +7,15 @@ import json
 import pytest
 from datetime import datetime, timezone
 import jwt
+from sqlalchemy import event
+from PIL import Image
 
 os.environ.setdefault('SECRET_KEY', 'test-secret')
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.app import app, db, limiter
+import backend.app as app_module
+from backend.llm_executor import AdaptiveLLMExecutor
+from backend.passwords import HashSettings, PasswordHasher
 
 @app.route('/error-test')
 def error_test_route():
@@ -107,12 +114,62 @@ def test_health_endpoint(client):
     assert resp.get_json()['status'] == 'ok'
 
 
+def test_health_reports_degraded_dependencies(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'llm_model', None)
+    data = client.get('/api/health').get_json()
+    assert data['status'] == 'ok'
+    assert data['checks']['database'] == 'ok'
+    assert data['degraded'] == ['detection']
+
+
+def test_metrics_endpoint_times_requests_and_counts_queries(client):
+    durations = app_module.request_metrics.duration
+    queries = app_module.request_metrics.queries
+    shelves = {'method': 'GET', 'endpoint': '/api/bookshelves'}
+    before = durations.count(status='200', **shelves), queries.sum(**shelves)
+    commits = app_module.commit_seconds.count()
+
+    token = register_and_login(client)
+    assert client.get('/api/bookshelves', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    client.get('/error-test')
+
+    assert durations.count(status='200', **shelves) == before[0] + 1
+    assert queries.sum(**shelves) > before[1]
+    assert durations.count(method='GET', endpoint='/error-test', status='500') >= 1
+    assert app_module.commit_seconds.count() > commits
+    assert app_module.request_metrics.in_flight.value() == 0
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain; version=0.0.4')
+    text = resp.get_data(as_text=True)
+    assert 'bookshelf_http_request_duration_seconds_count{method="GET",endpoint="/api/bookshelves",status="200"}' in text
+    assert 'bookshelf_cache_hits_total{cache="tokens"}' in text
+
+
 def test_api_spec_endpoint(client):
     resp = client.get('/api/spec')
     assert resp.status_code == 200
     data = resp.get_json()
     assert data['openapi'].startswith('3.')
     assert '/api/register' in data['paths']
+    body = data['paths']['/api/bookshelves/{id}/books/bulk']['post']['requestBody']
+    assert body['content']['application/json']['schema']['required'] == ['books']
+
+
+def test_provider_stats_endpoint(client):
+    resp = client.get('/api/providers/stats')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert 'google_title' in data['providers']
+    assert data['providers']['google_title']['breaker'] == 'closed'
+
+
+def test_cache_stats_endpoint(client):
+    resp = client.get('/api/cache/stats')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert {'memory_hits', 'misses', 'hit_ratio'} <= set(data)
 
 
 def test_login_respects_token_expiry_env(client, monkeypatch):
@@ -131,6 +188,57 @@ def test_login_respects_token_expiry_env(client, monkeypatch):
     assert 1.9 < delta.total_seconds() / 3600 <= 2.1
 
 
+def test_verified_tokens_are_cached_and_user_loaded_once(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    app_module.token_cache.clear()
+    before = app_module.token_cache.stats()
+    assert client.get('/api/verify_token', headers=headers).get_json()['user']['username'] == 'tester'
+    assert client.get('/api/verify_token', headers=headers).status_code == 200
+    after = app_module.token_cache.stats()
+    assert after['misses'] == before['misses'] + 1  # Decoded once, then served from the cache
+    assert after['hits'] > before['hits']
+    assert client.get('/api/verify_token', headers={'Authorization': f'Bearer {token}x'}).status_code == 401
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    with app.test_request_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            app_module.g.user_id = 1
+            first = app_module.g.user
+            assert app_module.g.user is first and first.username == 'tester'
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+    assert len(statements) == 1
+
+
+def test_login_upgrades_outdated_password_hash(client, monkeypatch):
+    register_and_login(client)
+    with app.app_context():
+        assert app_module.User.query.filter_by(username='tester').one().password_hash.startswith('pbkdf2:')
+    hasher = PasswordHasher(HashSettings(method='scrypt', scrypt_n=2 ** 10))
+    monkeypatch.setattr(app_module, 'password_hasher', hasher)
+    assert client.post('/api/login', json={'identifier': 'tester', 'password': 'password123'}).status_code == 200
+    with app.app_context():
+        stored = app_module.User.query.filter_by(username='tester').one().password_hash
+    assert stored.startswith('scrypt:1024:8:1$')
+    assert hasher.stats()['rehashed'] == 1
+    assert client.post('/api/login', json={'identifier': 'tester', 'password': 'password123'}).status_code == 200
+    assert hasher.stats()['rehashed'] == 1
+
+
+def test_login_returns_503_when_hashing_pool_busy(client, monkeypatch):
+    register_and_login(client)
+    busy = PasswordHasher(workers=1, max_queue=0, queue_timeout=0.01)
+    busy._slots.acquire()
+    monkeypatch.setattr(app_module, 'password_hasher', busy)
+    resp = client.post('/api/login', json={'identifier': 'tester', 'password': 'password123'})
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '1'
+
+
 def test_login_rate_limit(client):
     client.post('/api/register', json={
         'username': 'limituser',
@@ -147,6 +255,15 @@ def test_login_rate_limit(client):
     assert resp.get_json()['error'] == 'Too many requests'
 
 
+def test_rate_limit_key_uses_token_subject(client):
+    token = register_and_login(client)
+    with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        assert app_module.rate_limit_key() == 'user:1'
+    with app.test_request_context(headers={'Authorization': 'Bearer invalid'},
+                                  environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+        assert app_module.rate_limit_key() == '10.0.0.7'
+
+
 def test_friend_request_and_accept(client):
     # create two users
     client.post('/api/register', json={
@@ -232,6 +349,250 @@ def test_public_bookshelves_access(client):
     assert resp.get_json()['id'] == shelf_id
 
 
+def test_public_shelf_cache_etag_and_invalidation(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers,
+                           json={'name': 'Shared', 'is_public': True}).get_json()['id']
+
+    first = client.get(f'/api/public/bookshelves/{shelf_id}')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('"')
+    hits_before = client.get('/api/cache/stats').get_json()['public']['hits']
+    again = client.get(f'/api/public/bookshelves/{shelf_id}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert client.get('/api/cache/stats').get_json()['public']['hits'] == hits_before + 1
+
+    # Adding a book bumps the shelf version, so the body and ETag change
+    client.post(f'/api/bookshelves/{shelf_id}/books', headers=headers, json={'title': 'Dune'})
+    changed = client.get(f'/api/public/bookshelves/{shelf_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert [b['title'] for b in changed.get_json()['books']] == ['Dune']
+    assert client.get('/api/public/bookshelves').get_json()[0]['book_count'] == 1
+
+    # Making the shelf private removes it from the public endpoints
+    client.put(f'/api/bookshelves/{shelf_id}', headers=headers, json={'is_public': False})
+    assert client.get(f'/api/public/bookshelves/{shelf_id}').status_code == 404
+    assert client.get('/api/public/bookshelves').get_json() == []
+
+
+def test_public_cache_sees_writes_from_other_workers(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers,
+                           json={'name': 'Shared', 'is_public': True}).get_json()['id']
+    etag = client.get(f'/api/public/bookshelves/{shelf_id}').headers['ETag']
+    assert len(client.get('/api/public/bookshelves').get_json()) == 1
+
+    # What another worker process commits when it makes the shelf private; none of this process's hooks run
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(db.text('UPDATE bookshelf SET is_public = 0, version = version + 1 WHERE id = :id'),
+                         {'id': shelf_id})
+            conn.execute(app_module.ChangeLog.__table__.insert(), [{
+                'entity': 'shelf', 'entity_id': shelf_id, 'action': 'updated',
+                'created_at': datetime.now(timezone.utc).replace(tzinfo=None)}])
+
+    assert client.get(f'/api/public/bookshelves/{shelf_id}', headers={'If-None-Match': etag}).status_code == 404
+    assert client.get('/api/public/bookshelves').get_json() == []
+
+
+def test_bookshelf_conditional_get(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'Mine'}).get_json()['id']
+    with app.app_context():
+        db.session.execute(db.text("UPDATE bookshelf SET updated_at = '2020-01-01 00:00:00'"))
+        db.session.commit()
+
+    first = client.get(f'/api/bookshelves/{shelf_id}', headers=headers)
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert client.get(f'/api/bookshelves/{shelf_id}',
+                      headers={**headers, 'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/api/bookshelves/{shelf_id}',
+                      headers={**headers, 'If-Modified-Since': last_modified}).status_code == 304
+
+    # Adding a book touches the shelf: new version and updated_at
+    book_id = client.post(f'/api/bookshelves/{shelf_id}/books', headers=headers,
+                          json={'title': 'Dune'}).get_json()['id']
+    after_add = client.get(f'/api/bookshelves/{shelf_id}', headers={**headers, 'If-None-Match': etag})
+    assert after_add.status_code == 200
+    assert after_add.headers['ETag'] != etag
+    assert not after_add.get_json()['updated_at'].startswith('2020')
+
+    etag = after_add.headers['ETag']
+    client.delete(f'/api/books/{book_id}', headers=headers)
+    after_delete = client.get(f'/api/bookshelves/{shelf_id}', headers={**headers, 'If-None-Match': etag})
+    assert after_delete.status_code == 200
+    assert after_delete.get_json()['books'] == []
+
+
+def test_book_and_shelf_updates_are_sanitized(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'Clean'}).get_json()['id']
+    book = client.post(f'/api/bookshelves/{shelf_id}/books', headers=headers, json={
+        'title': '<script>x</script>Dune', 'author': 'Frank <b onclick="y">Herbert</b>',
+        'cover_image_url': 'https://covers.example.com/b?id=1&size=L'}).get_json()
+    assert book['title'] == 'xDune'
+    assert book['author'] == 'Frank <b>Herbert</b>'
+    assert book['cover_image_url'] == 'https://covers.example.com/b?id=1&size=L'
+    updated = client.put(f'/api/bookshelves/{shelf_id}', headers=headers,
+                         json={'name': '<script>s</script>Renamed', 'description': ' Tom & Jerry '}).get_json()
+    assert updated['name'] == 'sRenamed'
+    assert updated['description'] == 'Tom &amp; Jerry'
+
+
+def test_invalid_bodies_get_uniform_errors(client):
+    resp = client.post('/api/register', json={'username': 'ab', 'email': 'bad', 'password': 123})
+    assert resp.status_code == 400
+    data = resp.get_json()
+    assert data['error'] == 'username must be at least 3 characters long'
+    assert [e['field'] for e in data['errors']] == ['username', 'email', 'password']
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = client.post('/api/bookshelves', headers=headers, data='not json', content_type='application/json')
+    assert resp.status_code == 400
+    assert resp.get_json()['errors'][0]['field'] == 'body'
+    resp = client.post('/api/bookshelves', headers=headers, json={'name': 'Shelf', 'is_public': 'yes'})
+    assert resp.get_json()['error'] == 'is_public must be true or false'
+
+
+def test_bulk_add_books(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'Bulk'}).get_json()['id']
+    client.post(f'/api/bookshelves/{shelf_id}/books', headers=headers, json={'title': 'Dune', 'isbn': '9780441013593'})
+
+    # One bad item rejects the whole batch, with every problem listed
+    resp = client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers, json={'books': [
+        {'title': 'Emma'}, {'title': ''}, {'title': 'Ulysses', 'cover_image_url': 'ftp://x'}]})
+    assert resp.status_code == 400
+    assert [e['field'] for e in resp.get_json()['errors']] == ['books[1].title', 'books[2].cover_image_url']
+
+    resp = client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers, json={'books': [
+        {'title': 'Emma', 'author': 'Jane <script>x</script>Austen'},
+        {'title': 'dune'},
+        {'title': 'Other', 'isbn': '9780441013593'},
+        {'title': 'Emma'},
+        {'title': 'Persuasion', 'isbn': ''},
+    ]})
+    assert resp.status_code == 201
+    data = resp.get_json()
+    assert [b['title'] for b in data['added']] == ['Emma', 'Persuasion']
+    assert data['added'][0]['author'] == 'Jane xAusten'
+    assert data['added'][1]['isbn'] is None
+    assert [(s['index'], s['reason']) for s in data['skipped']] == [
+        (1, 'already on shelf'), (2, 'isbn already exists'), (3, 'already on shelf')]
+    shelf = client.get(f'/api/bookshelves/{shelf_id}', headers=headers).get_json()
+    assert len(shelf['books']) == 3
+
+    resp = client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers,
+                       json={'books': [{'title': 't'}] * (app_module.BULK_MAX_BOOKS + 1)})
+    assert resp.status_code == 400
+
+
+def test_bulk_add_dedupes_through_stored_match_keys(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'Keys'}).get_json()['id']
+    client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers, json={'books': [
+        {'title': "Harry Potter and the Philosopher's Stone"}, {'title': 'Sapiens: A Brief History of Humankind'},
+        {'title': 'Dune'}]})
+
+    resp = client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers, json={'books': [
+        {'title': 'Harry Poter and the Philosophers Stone'},  # Fuzzy: found through a shared MinHash band
+        {'title': 'Sapiens'},  # Main title of a stored title
+        {'title': 'Dune: Deluxe Edition'},  # Stored title is its main title
+        {'title': 'Dune Messiah'},
+    ]})
+    assert [b['title'] for b in resp.get_json()['added']] == ['Dune Messiah']
+
+    dune = next(b for b in client.get(f'/api/bookshelves/{shelf_id}', headers=headers).get_json()['books']
+                if b['title'] == 'Dune')
+    client.delete(f'/api/books/{dune["id"]}', headers=headers)
+    with app.app_context():
+        keys = db.session.query(app_module.book_match_keys).filter_by(book_id=dune['id']).count()
+    assert keys == 0
+    resp = client.post(f'/api/bookshelves/{shelf_id}/books/bulk', headers=headers,
+                       json={'books': [{'title': 'Dune: Deluxe Edition'}]})
+    assert [b['title'] for b in resp.get_json()['added']] == ['Dune: Deluxe Edition']
+
+
+def test_bookshelf_fields_encodings_and_compression(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'Big'}).get_json()['id']
+    with app.app_context():
+        shelf = db.session.get(app_module.Bookshelf, shelf_id)
+        shelf.books.extend(app_module.Book(title=f'Book number {i}', authors='Some Author') for i in range(300))
+        db.session.commit()
+
+    full = client.get(f'/api/bookshelves/{shelf_id}', headers=headers)
+    assert full.headers.get('Content-Encoding') is None
+    assert set(full.get_json()['books'][0]) == {'id', 'title', 'author', 'isbn', 'cover_image_url', 'added_at'}
+
+    sparse = client.get(f'/api/bookshelves/{shelf_id}?fields=id,title', headers=headers)
+    assert sparse.get_json()['books'][0] == {'id': full.get_json()['books'][0]['id'], 'title': 'Book number 0'}
+    assert sparse.headers['ETag'] != full.headers['ETag']
+    assert client.get(f'/api/bookshelves/{shelf_id}?fields=id,nope', headers=headers).status_code == 400
+
+    columnar = client.get(f'/api/bookshelves/{shelf_id}?fields=title,author',
+                          headers={**headers, 'Accept': 'application/vnd.bookshelf.columnar+json'})
+    assert columnar.mimetype == 'application/vnd.bookshelf.columnar+json'
+    books = json.loads(columnar.data)['books']
+    assert books['columns'] == ['title', 'author']
+    assert books['rows'][0] == ['Book number 0', 'Some Author']
+    assert len(columnar.data) < len(full.data) / 2
+
+    gzipped = client.get(f'/api/bookshelves/{shelf_id}', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+    assert len(gzipped.data) < len(full.data) / 4
+    assert gzip.decompress(gzipped.data) == full.data
+    # The compressed variant's weak ETag still validates
+    assert client.get(f'/api/bookshelves/{shelf_id}', headers={
+        **headers, 'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']}).status_code == 304
+
+
+def test_bookshelf_lists_conditional_get(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    shelf_id = client.post('/api/bookshelves', headers=headers, json={'name': 'One'}).get_json()['id']
+
+    etag = client.get('/api/bookshelves', headers=headers).headers['ETag']
+    assert client.get('/api/bookshelves', headers={**headers, 'If-None-Match': etag}).status_code == 304
+    client.post(f'/api/bookshelves/{shelf_id}/books', headers=headers, json={'title': 'Emma'})
+    changed = client.get('/api/bookshelves', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert next(s for s in changed.get_json() if s['id'] == shelf_id)['book_count'] == 1
+
+    # Another user's view only covers public shelves
+    client.post('/api/register', json={'username': 'viewer', 'email': 'v@example.com', 'password': 'password1'})
+    viewer_token = client.post('/api/login', json={'identifier': 'viewer', 'password': 'password1'}).get_json()['token']
+    viewer = {'Authorization': f'Bearer {viewer_token}'}
+    public_etag = client.get('/api/users/1/bookshelves', headers=viewer).headers['ETag']
+    assert client.get('/api/users/1/bookshelves', headers={**viewer, 'If-None-Match': public_etag}).status_code == 304
+    client.put(f'/api/bookshelves/{shelf_id}', headers=headers, json={'is_public': True})
+    resp = client.get('/api/users/1/bookshelves', headers={**viewer, 'If-None-Match': public_etag})
+    assert resp.status_code == 200
+    assert [s['id'] for s in resp.get_json()] == [shelf_id]
+
+
+def test_public_bookshelves_pagination(client):
+    token = register_and_login(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    for i in range(3):
+        client.post('/api/bookshelves', headers=headers, json={'name': f'Shelf {i}', 'is_public': True})
+
+    page1 = client.get('/api/public/bookshelves?page=1&per_page=2').get_json()
+    page2 = client.get('/api/public/bookshelves?page=2&per_page=2').get_json()
+    assert [s['name'] for s in page1 + page2] == ['Shelf 2', 'Shelf 1', 'Shelf 0']
+    assert client.get('/api/public/bookshelves?page=0').status_code == 400
+
+
 def test_view_friend_bookshelves(client):
     # create two users
     client.post('/api/register', json={'username': 'erin', 'email': 'erin@example.com', 'password': 'password1'})
@@ -349,3 +710,25 @@ def test_update_community_non_owner_forbidden(client):
     resp = client.put(f'/api/communities/{comm_id}', headers=headers_b, json={'name': 'Hack'})
     assert resp.status_code == 403
 
+
+
+def test_upload_returns_503_when_llm_queue_full(client, monkeypatch):
+    class FakeModel:
+        def generate_content(self, contents, **kwargs):
+            raise AssertionError('model must not be called when the queue is full')
+
+    executor = AdaptiveLLMExecutor(max_in_flight=1, max_queue=0)
+    monkeypatch.setattr(app_module, 'llm_model', FakeModel())
+    monkeypatch.setattr(app_module, 'llm_executor', executor)
+    token = register_and_login(client)
+
+    image = io.BytesIO()
+    Image.new('RGB', (10, 10), 'white').save(image, format='PNG')
+    image.seek(0)
+
+    with executor.slot():
+        resp = client.post('/api/upload', headers={'Authorization': f'Bearer {token}'},
+                           data={'bookshelfImage': (image, 'shelf.png', 'image/png')},
+                           content_type='multipart/form-data')
+    assert resp.status_code == 503
+    assert int(resp.headers['Retry-After']) >= 1
@@ -0,0 +1,246 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import backend.app as app_module
+from backend.app import app, db, limiter
+from backend.detection import GeminiBackend, LocalBackend, LocalDetectionError, create_detection_backend
+from backend.llm_executor import AdaptiveLLMExecutor
+from backend.providers import BookProvider, BookQuery, RecommendationPipeline, make_book
+
+
+def _png_bytes(color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 20), color).save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+class CannedProvider(BookProvider):
+    name = 'canned'
+
+    def build_url(self, query):
+        return query
+
+    def fetch_json(self, url, timeout):
+        return [f"Like {url}"]
+
+    def parse(self, payload):
+        return [make_book(title=t, authors=['Someone']) for t in payload]
+
+
+@pytest.fixture()
+def client():
+    db_fd, db_path = tempfile.mkstemp()
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'test-secret-key'
+    with app.app_context():
+        db.create_all()
+    with app.test_client() as client:
+        yield client
+    with app.app_context():
+        db.drop_all()
+    limiter.reset()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+def test_local_backend_cycles_fixture_titles(tmp_path, monkeypatch):
+    fixture = tmp_path / 'titles.json'
+    fixture.write_text(json.dumps([['Dune'], ['Emma', 'Ulysses']]))
+    monkeypatch.setenv('DETECTION_BACKEND', 'local')
+    monkeypatch.setenv('LOCAL_DETECTION_FIXTURE', str(fixture))
+    backend = create_detection_backend()
+
+    assert backend.name == 'local'
+    assert backend.generate_content(['prompt']).text == 'Dune'
+    assert backend.generate_content(['prompt']).text == 'Emma\nUlysses'
+    assert backend.generate_content(['prompt']).text == 'Dune'
+
+
+def test_local_backend_latency_and_error_injection():
+    backend = LocalBackend(latency=0.05)
+    started = time.monotonic()
+    backend.generate_content([])
+    assert time.monotonic() - started >= 0.05
+
+    failing = LocalBackend(error_rate=1.0)
+    with pytest.raises(LocalDetectionError):
+        failing.generate_content([])
+
+
+def test_upload_pipeline_runs_offline_with_local_backend(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'llm_model', LocalBackend(title_sets=[['Dune', 'Emma']]))
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([CannedProvider()]))
+
+    client.post('/api/register', json={'username': 'offline', 'email': 'off@example.com', 'password': 'pass1234'})
+    token = client.post('/api/login', json={'identifier': 'offline', 'password': 'pass1234'}).get_json()['token']
+    resp = client.post('/api/upload', headers={'Authorization': f'Bearer {token}'},
+                       data={'bookshelfImage': (_png_bytes(), 'shelf.png', 'image/png')},
+                       content_type='multipart/form-data')
+
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['detected_books'] == ['Dune', 'Emma']
+    assert [r['title'] for r in data['recommendations']] == ['Like Dune', 'Like Emma']
+    assert 'Added 2 detected and 2 recommended' in data['save_message']
+
+
+def test_structured_detection_streams_books_and_uses_authors(client, monkeypatch):
+    searched = []
+
+    class RecordingProvider(CannedProvider):
+        def build_url(self, query):
+            searched.append(query)
+            return str(query)
+
+    backend = LocalBackend(title_sets=[[{'title': 'Dune', 'author': 'Frank Herbert', 'confidence': 0.95},
+                                        {'title': 'Emma', 'author': None, 'confidence': 0.8}]])
+    monkeypatch.setattr(app_module, 'llm_model', backend)
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'detection_output', 'json')
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([RecordingProvider()]))
+
+    client.post('/api/register', json={'username': 'structured', 'email': 'st@example.com', 'password': 'pass1234'})
+    token = client.post('/api/login', json={'identifier': 'structured', 'password': 'pass1234'}).get_json()['token']
+    resp = client.post('/api/upload', headers={'Authorization': f'Bearer {token}'},
+                       data={'bookshelfImage': (_png_bytes('red'), 'shelf.png', 'image/png')},
+                       content_type='multipart/form-data')
+
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['detected_books'] == ['Dune', 'Emma']
+    assert data['detections'][0] == {'title': 'Dune', 'author': 'Frank Herbert', 'confidence': 0.95}
+    assert BookQuery('Dune', 'Frank Herbert') in searched
+    assert 'Emma' in searched
+
+    with app.app_context():
+        assert app_module.Book.query.filter_by(title='Dune').first().authors == 'Frank Herbert'
+
+
+def test_structured_detection_reports_books_before_stream_ends(tmp_path, monkeypatch):
+    backend = LocalBackend(title_sets=[[{'title': 'Dune', 'author': 'Frank Herbert'},
+                                        {'title': 'Neuromancer', 'author': 'William Gibson'}]],
+                           chunk_delay=0.05)
+    monkeypatch.setattr(app_module, 'llm_model', backend)
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'detection_output', 'json')
+    path = tmp_path / 'shelf.png'
+    Image.new('RGB', (10, 10), 'blue').save(path)
+
+    arrivals = []
+    started = time.monotonic()
+    books = app_module.detect_books_detailed(str(path), on_book=lambda b: arrivals.append(time.monotonic()))
+    finished = time.monotonic()
+
+    assert [b['title'] for b in books] == ['Dune', 'Neuromancer']
+    assert len(arrivals) == 2
+    # The first book is reported while later chunks are still being generated
+    assert arrivals[0] - started < finished - started - 0.05
+
+
+def test_upload_dedupes_title_variants(client, monkeypatch):
+    backend = LocalBackend(title_sets=[['The Hobbit', 'Hobbit, The', 'Dune'], ['THE HOBBIT!', 'Emma']])
+    monkeypatch.setattr(app_module, 'llm_model', backend)
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([CannedProvider()]))
+
+    client.post('/api/register', json={'username': 'dedupe', 'email': 'dd@example.com', 'password': 'pass1234'})
+    token = client.post('/api/login', json={'identifier': 'dedupe', 'password': 'pass1234'}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    first = client.post('/api/upload', headers=headers,
+                        data={'bookshelfImage': (_png_bytes('green'), 'a.png', 'image/png')},
+                        content_type='multipart/form-data').get_json()
+    second = client.post('/api/upload', headers=headers,
+                         data={'bookshelfImage': (_png_bytes('yellow'), 'b.png', 'image/png')},
+                         content_type='multipart/form-data').get_json()
+
+    # Only the first variant is searched, so recommendations are not repeated
+    assert [r['title'] for r in first['recommendations']] == ['Like The Hobbit', 'Like Dune']
+    assert 'Added 2 detected' in first['save_message']
+    assert 'Added 1 detected' in second['save_message']
+
+
+def test_async_detection_and_recommendations_match_sync(tmp_path, monkeypatch):
+    backend = LocalBackend(title_sets=[[{'title': 'Dune', 'author': 'Frank Herbert'}, {'title': 'Emma'}]],
+                           latency=0.05, chunk_delay=0.01)
+    monkeypatch.setattr(app_module, 'llm_model', backend)
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor(max_in_flight=8))
+    monkeypatch.setattr(app_module, 'detection_output', 'json')
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([CannedProvider()]))
+    paths = []
+    for i, color in enumerate(['red', 'green', 'blue', 'red']):
+        path = tmp_path / f'shelf{i}.png'
+        Image.new('RGB', (10, 10), color).save(path)
+        paths.append(str(path))
+
+    async def upload(path, reported):
+        detections = await app_module.detect_books_detailed_async(path, on_book=reported.append)
+        return detections, await app_module.get_recommendations_async(detections)
+
+    async def main():
+        reported = []
+        results = await asyncio.gather(*(upload(path, reported) for path in paths))
+        return results, reported
+
+    started = time.monotonic()
+    results, reported = asyncio.run(main())
+    assert time.monotonic() - started < 0.2  # Four model calls of 50 ms ran concurrently on one thread
+    sync_detections = app_module.detect_books_detailed(paths[0])
+    for detections, recommendations in results:
+        assert detections == sync_detections
+        assert [r['title'] for r in recommendations] == ['Like Dune by Frank Herbert', 'Like Emma']
+    assert backend.calls == 4  # The repeated image was coalesced; one more call for the sync check
+    assert len(reported) == 6
+
+
+def test_async_upload_route(client, monkeypatch):
+    pytest.importorskip('asgiref')  # Flask's async extra
+    monkeypatch.setattr(app_module, 'llm_model', LocalBackend(title_sets=[['Dune', 'Emma']]))
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([CannedProvider()]))
+
+    client.post('/api/register', json={'username': 'asyncer', 'email': 'as@example.com', 'password': 'pass1234'})
+    token = client.post('/api/login', json={'identifier': 'asyncer', 'password': 'pass1234'}).get_json()['token']
+    assert client.post('/api/upload/async').status_code == 401
+    resp = client.post('/api/upload/async', headers={'Authorization': f'Bearer {token}'},
+                       data={'bookshelfImage': (_png_bytes('purple'), 'shelf.png', 'image/png')},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 200
+    assert resp.get_json()['detected_books'] == ['Dune', 'Emma']
+
+
+def test_async_upload_view_on_plain_event_loop(client, monkeypatch):
+    # Runs the view coroutine directly, so the async path is covered without Flask's async extra
+    monkeypatch.setattr(app_module, 'llm_model', LocalBackend(title_sets=[['Dune', 'Emma']]))
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor())
+    monkeypatch.setattr(app_module, 'recommendation_pipeline', RecommendationPipeline([CannedProvider()]))
+
+    client.post('/api/register', json={'username': 'looper', 'email': 'lp@example.com', 'password': 'pass1234'})
+    token = client.post('/api/login', json={'identifier': 'looper', 'password': 'pass1234'}).get_json()['token']
+    with app.test_request_context('/api/upload/async', method='POST', headers={'Authorization': f'Bearer {token}'},
+                                  data={'bookshelfImage': (_png_bytes('orange'), 'shelf.png', 'image/png')},
+                                  content_type='multipart/form-data'):
+        resp = app.make_response(asyncio.run(app_module.upload_file_async()))
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['detected_books'] == ['Dune', 'Emma']
+    assert [r['title'] for r in data['recommendations']] == ['Like Dune', 'Like Emma']
+    assert 'Added 2 detected' in data['save_message']
+
+
+def test_gemini_backend_without_key_is_unavailable():
+    backend = GeminiBackend(None)
+    assert not backend.available
+    assert backend.load() is None
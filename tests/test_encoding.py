@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify
+from werkzeug.datastructures import MIMEAccept
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.encoding import (COLUMNAR_MIMETYPE, JSON_MIMETYPE, CompressionConfig, FieldsError,
+                              compress_response, encode_rows, negotiate_encoding, parse_fields)
+
+ALLOWED = ('id', 'title', 'author')
+
+
+def test_parse_fields():
+    assert parse_fields(None, ALLOWED) == ['id', 'title', 'author']
+    assert parse_fields('title, id,title', ALLOWED) == ['title', 'id']
+    with pytest.raises(FieldsError):
+        parse_fields('id,isbn', ALLOWED)
+
+
+def test_negotiate_and_encode_rows():
+    assert negotiate_encoding(MIMEAccept()) == JSON_MIMETYPE
+    assert negotiate_encoding(MIMEAccept([('*/*', 1)])) == JSON_MIMETYPE
+    assert negotiate_encoding(MIMEAccept([(COLUMNAR_MIMETYPE, 1), (JSON_MIMETYPE, 0.5)])) == COLUMNAR_MIMETYPE
+    rows = [(1, 'Dune'), (2, 'Emma')]
+    assert encode_rows(rows, ['id', 'title'], JSON_MIMETYPE) == [{'id': 1, 'title': 'Dune'}, {'id': 2, 'title': 'Emma'}]
+    assert encode_rows(rows, ['id', 'title'], COLUMNAR_MIMETYPE) == {
+        'columns': ['id', 'title'], 'rows': [[1, 'Dune'], [2, 'Emma']]}
+
+
+def test_compress_response_threshold_and_etag():
+    app = Flask(__name__)
+    config = CompressionConfig(min_size=100)
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip'}) as ctx:
+        small = compress_response(jsonify(ok=True), ctx.request.accept_encodings, config)
+        assert 'Content-Encoding' not in small.headers
+        big = jsonify(items=['x' * 20] * 50)
+        big.set_etag('abc')
+        compress_response(big, ctx.request.accept_encodings, config)
+        assert big.headers['Content-Encoding'] == 'gzip'
+        assert big.get_etag() == ('abc', True)
+    with app.test_request_context() as ctx:
+        identity = compress_response(jsonify(items=['x' * 20] * 50), ctx.request.accept_encodings, config)
+        assert 'Content-Encoding' not in identity.headers
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+from datetime import date, datetime, timezone
+
+import pytest
+from flask import Flask
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.json_provider import OrjsonProvider, StdlibJSONProvider, create_json_provider, orjson
+
+PAYLOAD = {
+    'id': 7,
+    'name': 'Shelf',
+    'created_at': datetime(2024, 5, 1, 12, 30, 0),
+    'updated_at': datetime(2024, 5, 2, 8, 0, 0, 250, tzinfo=timezone.utc),
+    'books': [{'title': 'Dune', 'added_at': date(2024, 5, 1), 'isbn': None}],
+}
+
+
+def test_stdlib_provider_uses_iso_dates():
+    provider = StdlibJSONProvider(Flask(__name__))
+    data = json.loads(provider.dumps_bytes(PAYLOAD))
+    assert data['created_at'] == PAYLOAD['created_at'].isoformat()
+    assert data['updated_at'] == PAYLOAD['updated_at'].isoformat()
+    assert data['books'][0]['added_at'] == '2024-05-01'
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson not installed')
+def test_orjson_provider_matches_stdlib():
+    app = Flask(__name__)
+    fast, stdlib = OrjsonProvider(app), StdlibJSONProvider(app)
+    assert fast.dumps_bytes(PAYLOAD) == stdlib.dumps_bytes(PAYLOAD)
+    assert fast.dumps({'big': 2 ** 70}) == '{"big":1180591620717411303424}'  # Falls back to stdlib
+    assert fast.loads(b'{"a": [1, 2]}') == {'a': [1, 2]}
+    with app.app_context():
+        response = fast.response(PAYLOAD)
+    assert response.mimetype == 'application/json'
+    assert response.data == stdlib.dumps_bytes(PAYLOAD)
+
+
+def test_create_json_provider_selection(monkeypatch):
+    app = Flask(__name__)
+    assert isinstance(create_json_provider(app, 'stdlib'), StdlibJSONProvider)
+    monkeypatch.setattr('backend.json_provider.orjson', None)
+    provider = create_json_provider(app, 'orjson')
+    assert type(provider) is StdlibJSONProvider
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.json_stream import JSONArrayStreamParser
+from backend.detection import normalize_detection
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('```json\n[{"title": "Du') == []
+    assert parser.feed('ne", "author": "Frank Herbert"}, {"title"') == [
+        {'title': 'Dune', 'author': 'Frank Herbert'}]
+    assert parser.feed(': "Emma [\\"}\\"]"}]\n```') == [{'title': 'Emma ["}"]'}]
+    assert parser.done
+
+
+def test_wrapping_object_and_malformed_elements():
+    parser = JSONArrayStreamParser()
+    items = parser.feed('{"books": [{"title": "Dune"}, {"title": bad}, {"title": "Emma"}]}')
+    assert items == [{'title': 'Dune'}, {'title': 'Emma'}]
+
+
+def test_normalize_detection_filters_and_cleans():
+    assert normalize_detection({'title': ' Dune ', 'author': 'unknown', 'confidence': 1.7}) == {
+        'title': 'Dune', 'author': None, 'confidence': 1.0}
+    assert normalize_detection({'title': 'Dune'}) == {'title': 'Dune', 'author': None, 'confidence': None}
+    assert normalize_detection({'title': 'Abc'}) is None
+    assert normalize_detection({'title': 'Dune', 'confidence': 0.2}, min_confidence=0.5) is None
+    assert normalize_detection(['Dune']) is None
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.llm_executor import AdaptiveLLMExecutor, LLMOverloaded
+
+
+class FakeModel:
+    """Stand-in for the Gemini model tracking peak concurrency."""
+
+    def __init__(self, delay=0.05, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError('429 Resource has been exhausted')
+            return 'ok'
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_executor_caps_concurrent_calls():
+    model = FakeModel()
+    executor = AdaptiveLLMExecutor(max_in_flight=2, max_queue=10, queue_timeout=5)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda _: executor.call(model.generate_content, []), range(6)))
+    assert results == ['ok'] * 6
+    assert model.peak == 2
+    assert executor.stats()['successes'] == 6
+
+
+def test_full_queue_rejects_with_retry_after():
+    executor = AdaptiveLLMExecutor(max_in_flight=1, max_queue=0)
+    with executor.slot():
+        with pytest.raises(LLMOverloaded) as exc:
+            executor.call(lambda: 'never')
+    assert exc.value.retry_after >= 1
+    assert executor.stats()['rejected'] == 1
+
+
+def test_queued_call_times_out():
+    executor = AdaptiveLLMExecutor(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    with executor.slot():
+        with pytest.raises(LLMOverloaded):
+            executor.call(lambda: 'never')
+    assert executor.stats()['timeouts'] == 1
+
+
+def test_limit_decreases_on_errors_and_recovers():
+    model = FakeModel(delay=0, fail=True)
+    executor = AdaptiveLLMExecutor(max_in_flight=8)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            executor.call(model.generate_content, [])
+    assert executor.stats()['limit'] == 2
+
+    model.fail = False
+    for _ in range(20):
+        executor.call(model.generate_content, [])
+    assert executor.stats()['limit'] > 2
+
+
+def test_slow_calls_shrink_limit():
+    executor = AdaptiveLLMExecutor(max_in_flight=4, latency_target=0.01)
+    executor.call(FakeModel(delay=0.05).generate_content, [])
+    assert executor.stats()['limit'] == 2
+
+
+def test_async_slot_shares_limit_and_queue():
+    executor = AdaptiveLLMExecutor(max_in_flight=2, max_queue=3, queue_timeout=5)
+    active = peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with executor.async_slot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.05)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(5)))
+        with pytest.raises(LLMOverloaded):
+            await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert executor.stats()['rejected'] == 1
+    assert executor.stats()['in_flight'] == 0
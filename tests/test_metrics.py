@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.metrics import MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('op_seconds', 'Op time', ('op',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, op='read')
+    text = registry.render()
+    assert '# TYPE op_seconds histogram' in text
+    assert 'op_seconds_bucket{op="read",le="0.1"} 2' in text
+    assert 'op_seconds_bucket{op="read",le="1.0"} 3' in text
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 4' in text
+    assert 'op_seconds_sum{op="read"} 3.65' in text
+    assert 'op_seconds_count{op="read"} 4' in text
+
+
+def test_counter_gauge_and_label_escaping():
+    registry = MetricsRegistry()
+    counter = registry.counter('things_total', 'Things\nseen', ('name',))
+    counter.inc(name='a "quoted"\\ value')
+    counter.inc(2, name='a "quoted"\\ value')
+    gauge = registry.gauge('depth', 'Queue depth')
+    gauge.inc()
+    gauge.dec(3)
+    assert registry.counter('things_total', 'Things', ('name',)) is counter
+    with pytest.raises(ValueError):
+        registry.gauge('things_total', 'Things', ('name',))
+    with pytest.raises(ValueError):
+        counter.inc(other='x')
+    text = registry.render()
+    assert '# HELP things_total Things\\nseen' in text
+    assert 'things_total{name="a \\"quoted\\"\\\\ value"} 3' in text
+    assert 'depth -2' in text
+
+
+def test_collectors_are_read_at_scrape_time():
+    registry = MetricsRegistry()
+    hits = {'count': 0}
+    registry.add_collector(lambda: [('cache_hits_total', 'counter', 'Hits', [({'cache': 'x'}, hits['count'])])])
+
+    def broken():
+        raise RuntimeError('boom')
+    registry.add_collector(broken)
+
+    hits['count'] = 7
+    assert 'cache_hits_total{cache="x"} 7' in registry.render()
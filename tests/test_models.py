@@ -5,7 +5,7 @@ import pytest
 
 os.environ.setdefault('SECRET_KEY', 'test-secret')
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from backend.app import app, db, User, Bookshelf
+from backend.app import app, db, upgrade_schema, Book, User, Bookshelf
 
 @pytest.fixture()
 def app_context():
@@ -28,3 +28,24 @@ def test_user_password_hashing(app_context):
     assert user.check_password('password123')
     assert not user.check_password('wrong')
 
+
+def test_book_normalized_title_and_schema_upgrade(app_context):
+    book = Book(title='Hobbit, The')
+    db.session.add(book)
+    db.session.commit()
+    assert book.normalized_title == 'hobbit'
+    book_id = book.id
+    count_keys = db.text('SELECT COUNT(*) FROM book_match_keys WHERE book_id = :id')
+    with db.engine.connect() as conn:
+        assert conn.execute(count_keys, {'id': book_id}).scalar() == 9  # 8 MinHash bands and the main title
+
+    # Simulate a database created before the column and match keys existed
+    with db.engine.begin() as conn:
+        conn.execute(db.text('DROP INDEX ix_book_normalized_title'))
+        conn.execute(db.text('ALTER TABLE book DROP COLUMN normalized_title'))
+        conn.execute(db.text('DELETE FROM book_match_keys'))
+    db.session.remove()
+    upgrade_schema()
+    with db.engine.connect() as conn:
+        assert conn.execute(db.text('SELECT normalized_title FROM book')).scalar() == 'hobbit'
+        assert conn.execute(count_keys, {'id': book_id}).scalar() == 9
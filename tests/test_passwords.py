@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.passwords import HashSettings, HasherBusy, PasswordHasher, verify_hash
+
+FAST_PBKDF2 = HashSettings(iterations=1000)
+FAST_SCRYPT = HashSettings(method='scrypt', scrypt_n=2 ** 10)
+
+
+def test_hashes_verify_across_methods_and_report_rehash():
+    pbkdf2_hash = FAST_PBKDF2.hash('secret-password')
+    scrypt_hash = FAST_SCRYPT.hash('secret-password')
+    assert pbkdf2_hash.startswith('pbkdf2:sha256:1000$')
+    assert scrypt_hash.startswith('scrypt:1024:8:1$')
+    assert verify_hash(pbkdf2_hash, 'secret-password') and verify_hash(scrypt_hash, 'secret-password')
+    assert not verify_hash(scrypt_hash, 'wrong') and not verify_hash('', 'secret-password')
+    assert not FAST_PBKDF2.needs_rehash(pbkdf2_hash)
+    assert FAST_SCRYPT.needs_rehash(pbkdf2_hash)
+    assert HashSettings(iterations=2000).needs_rehash(pbkdf2_hash)
+
+
+def test_unknown_method_rejected():
+    with pytest.raises(ValueError):
+        HashSettings(method='md5')
+
+
+@pytest.mark.parametrize('use_processes', [False, True])
+def test_hasher_runs_on_pool(use_processes):
+    hasher = PasswordHasher(FAST_SCRYPT, workers=2, use_processes=use_processes)
+    try:
+        stored = hasher.hash('secret-password')
+        assert hasher.verify(stored, 'secret-password')
+        assert not hasher.verify(stored, 'nope')
+    finally:
+        hasher.shutdown()
+
+
+def test_hasher_rejects_when_queue_full():
+    hasher = PasswordHasher(FAST_PBKDF2, workers=1, max_queue=0, queue_timeout=0.01)
+    hasher._slots.acquire()  # Occupy the only worker
+    with pytest.raises(HasherBusy) as excinfo:
+        hasher.hash('secret-password')
+    assert excinfo.value.retry_after >= 1
+    assert hasher.stats()['rejected'] == 1
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import sys
+import time
+import pytest
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import backend.providers as providers
+from backend.providers import (
+    BookProvider, BookQuery, CircuitBreaker, GoogleBooksTitleProvider, HedgePolicy, LocalProvider,
+    OpenLibraryProvider, ProviderError, RecommendationPipeline, make_book,
+)
+
+
+class FakeProvider(BookProvider):
+    """Provider returning canned titles per query instead of calling an API."""
+
+    def __init__(self, name, results, stage=1, delay=0.0, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.stage = stage
+        self.results = results
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    def build_url(self, query):
+        return query
+
+    def fetch_json(self, url, timeout):
+        self.calls.append(url)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('boom')
+        return self.results.get(url, [])
+
+    def parse(self, payload):
+        return [make_book(title=t, categories=['Fiction']) for t in payload]
+
+
+def test_pipeline_merges_in_priority_order_and_dedupes():
+    first = FakeProvider('first', {'Dune': ['Dune', 'Hyperion', 'Foundation']})
+    first.exclude_self = True
+    second = FakeProvider('second', {'Dune': ['hyperion', 'Neuromancer']})
+    pipeline = RecommendationPipeline([first, second], limit=6)
+
+    titles = [b['title'] for b in pipeline.recommend(['Dune'])]
+    assert titles == ['Hyperion', 'Foundation', 'Neuromancer']
+
+
+def test_later_stage_receives_categories():
+    titles = FakeProvider('titles', {'Dune': ['Hyperion']})
+    titles.collects_categories = True
+
+    class CategoryProvider(FakeProvider):
+        def queries(self, context):
+            return [f"subject:{c}" for c in context['categories']]
+
+    categories = CategoryProvider('categories', {'subject:fiction': ['Solaris']}, stage=2)
+    pipeline = RecommendationPipeline([titles, categories])
+    assert [b['title'] for b in pipeline.recommend(['Dune'])] == ['Hyperion', 'Solaris']
+    assert categories.calls == ['subject:fiction']
+
+
+def test_circuit_breaker_skips_failing_provider():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    broken = FakeProvider('broken', {}, fail=True, breaker=breaker)
+    pipeline = RecommendationPipeline([broken])
+
+    pipeline.recommend(['A', 'B', 'C'])
+    assert breaker.state == 'open'
+    assert len(broken.calls) == 2
+
+    pipeline.recommend(['A'])
+    assert len(broken.calls) == 2  # skipped while open
+    with pytest.raises(ProviderError):
+        broken.search('A')
+
+
+def test_circuit_breaker_half_open_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_parallel_pipeline_enforces_budget():
+    fast = FakeProvider('fast', {'Dune': ['Hyperion']})
+    slow = FakeProvider('slow', {'Dune': ['Solaris']}, delay=0.5, budget=0.05)
+    pipeline = RecommendationPipeline([slow, fast], parallel=True)
+
+    started = time.monotonic()
+    titles = [b['title'] for b in pipeline.recommend(['Dune'])]
+    assert titles == ['Hyperion']
+    assert time.monotonic() - started < 0.4
+
+
+def test_async_pipeline_matches_sync_and_enforces_budget():
+    first = FakeProvider('first', {'Dune': ['Dune', 'Hyperion'], 'Emma': ['Persuasion']})
+    first.exclude_self = True
+    later = FakeProvider('later', {'subject:fiction': ['Solaris']}, stage=2)
+    pipeline = RecommendationPipeline([first, later], limit=6)
+    expected = [b['title'] for b in pipeline.recommend(['Dune', 'Emma'])]
+    assert [b['title'] for b in asyncio.run(pipeline.recommend_async(['Dune', 'Emma']))] == expected
+
+    fast = FakeProvider('fast', {'Dune': ['Hyperion']})
+    slow = FakeProvider('slow', {'Dune': ['Solaris']}, delay=0.5, budget=0.05)
+    pipeline = RecommendationPipeline([slow, fast])
+
+    async def timed():
+        started = time.monotonic()
+        books = await pipeline.recommend_async(['Dune'])
+        return [b['title'] for b in books], time.monotonic() - started
+
+    titles, elapsed = asyncio.run(timed())
+    assert titles == ['Hyperion']
+    assert elapsed < 0.4
+
+
+def test_from_env_orders_and_disables_providers(monkeypatch):
+    monkeypatch.setenv('RECOMMENDATION_PROVIDERS', 'openlibrary, google_title, unknown')
+    monkeypatch.setenv('PROVIDER_TIMEOUT_OPENLIBRARY', '2.5')
+    pipeline = RecommendationPipeline.from_env()
+    assert [p.name for p in pipeline.providers] == ['openlibrary', 'google_title']
+    assert pipeline.providers[0].timeout == 2.5
+
+
+def test_hedge_wins_when_primary_is_slow():
+    slow = FakeProvider('slow', {'Dune': ['Hyperion']}, delay=0.5)
+    backup = FakeProvider('backup', {'Dune': ['Solaris']})
+    slow.hedge_target = backup
+    policy = HedgePolicy(budget_percent=100, default_delay=0.05)
+    pipeline = RecommendationPipeline([slow], hedge_policy=policy)
+
+    started = time.monotonic()
+    assert [b['title'] for b in pipeline.recommend(['Dune'])] == ['Solaris']
+    assert time.monotonic() - started < 0.4
+    stats = pipeline.stats()['hedging']
+    assert stats['hedges_fired'] == 1
+    assert stats['hedge_wins'] == 1
+
+
+def test_async_hedge_wins_when_primary_is_slow():
+    slow = FakeProvider('slow', {'Dune': ['Hyperion']}, delay=0.5)
+    backup = FakeProvider('backup', {'Dune': ['Solaris']})
+    slow.hedge_target = backup
+    pipeline = RecommendationPipeline([slow], hedge_policy=HedgePolicy(budget_percent=100, default_delay=0.05))
+
+    async def timed():
+        started = time.monotonic()
+        books = await pipeline.recommend_async(['Dune'])
+        return [b['title'] for b in books], time.monotonic() - started
+
+    titles, elapsed = asyncio.run(timed())
+    assert titles == ['Solaris']
+    assert elapsed < 0.4
+    assert pipeline.stats()['hedging']['hedge_wins'] == 1
+
+
+def test_async_http_scope_shares_and_closes_one_client(monkeypatch):
+    clients = []
+
+    class FakeResponse:
+        def __init__(self, url):
+            self.url = url
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'docs': [{'title': 'From ' + self.url.split('q=')[1].split('&')[0]}]}
+
+    class FakeAsyncClient:
+        def __init__(self):
+            self.urls, self.closed = [], False
+            clients.append(self)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            self.closed = True
+
+        async def get(self, url, timeout):
+            assert not self.closed
+            self.urls.append(url)
+            return FakeResponse(url)
+
+    monkeypatch.setitem(sys.modules, 'httpx', type(sys)('httpx'))
+    monkeypatch.setattr(sys.modules['httpx'], 'AsyncClient', FakeAsyncClient, raising=False)
+    monkeypatch.setattr(providers, 'HTTPX_AVAILABLE', True)
+    pipeline = RecommendationPipeline([OpenLibraryProvider()])
+
+    async def upload():
+        async with providers.async_http_scope():
+            return await pipeline.recommend_async(['Dune', 'Emma'])
+
+    for _ in range(2):
+        assert [b['title'] for b in asyncio.run(upload())] == ['From Dune', 'From Emma']
+    # One client per upload, used for all of its queries and closed when it ends
+    assert [len(c.urls) for c in clients] == [2, 2]
+    assert all(c.closed for c in clients)
+
+
+def test_hedging_respects_budget():
+    slow = FakeProvider('slow', {'Dune': ['Hyperion']}, delay=0.1)
+    slow.hedge_target = slow
+    policy = HedgePolicy(budget_percent=10, default_delay=0.01)
+    pipeline = RecommendationPipeline([slow], hedge_policy=policy)
+
+    for _ in range(3):
+        pipeline.search(slow, 'Dune')
+    stats = policy.snapshot()
+    assert stats['hedges_fired'] == 0
+    assert stats['budget_denied'] == 3
+
+
+def test_hedge_delay_uses_latency_percentile():
+    provider = FakeProvider('p', {})
+    policy = HedgePolicy(percentile=95, min_samples=5, default_delay=2.0)
+    assert policy.delay_for(provider) == 2.0
+    for ms in range(1, 21):
+        provider.latency.record(ms / 1000.0)
+    assert policy.delay_for(provider) == pytest.approx(0.019)
+
+
+def test_title_author_queries_build_precise_urls():
+    query = BookQuery('Dune', 'Frank Herbert')
+    google_url = GoogleBooksTitleProvider().build_url(query)
+    assert 'q=intitle%3A%22Dune%22%20inauthor%3A%22Frank%20Herbert%22' in google_url
+    assert OpenLibraryProvider().build_url(query).startswith(
+        'https://openlibrary.org/search.json?title=Dune&author=Frank%20Herbert')
+    assert 'q=Dune&' in OpenLibraryProvider().build_url(BookQuery('Dune', None))
+
+
+def test_self_exclusion_uses_query_title():
+    provider = FakeProvider('first', {BookQuery('Dune', 'Frank Herbert'): ['Dune', 'Hyperion']})
+    provider.exclude_self = True
+    pipeline = RecommendationPipeline([provider])
+    assert [b['title'] for b in pipeline.recommend([BookQuery('Dune', 'Frank Herbert')])] == ['Hyperion']
+
+
+def test_prefetch_warms_shared_cache():
+    from backend.response_cache import MemoryTier, TieredCache
+    cache = TieredCache(MemoryTier(), disk=None)
+    provider = FakeProvider('first', {'Dune': ['Hyperion']}, cache=cache)
+    pipeline = RecommendationPipeline([provider])
+    pipeline.prefetch('Dune')
+    deadline = time.monotonic() + 1
+    while not provider.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert [b['title'] for b in pipeline.recommend(['Dune'])] == ['Hyperion']
+    assert provider.calls == ['Dune']
+
+
+def test_merger_dedupes_title_variants():
+    provider = FakeProvider('first', {'Dune': ['The Hobbit', 'Hobbit, The', 'Dune: Deluxe Edition', 'Emma']})
+    provider.exclude_self = True
+    pipeline = RecommendationPipeline([provider])
+    assert [b['title'] for b in pipeline.recommend(['Dune'])] == ['The Hobbit', 'Emma']
+
+
+def test_local_provider_stand_in(monkeypatch):
+    monkeypatch.setenv('RECOMMENDATION_PROVIDERS', 'local')
+    monkeypatch.setenv('LOCAL_PROVIDER_LATENCY_MS', '20')
+    monkeypatch.setenv('LOCAL_PROVIDER_RESULTS', '2')
+    monkeypatch.setenv('PROVIDER_CACHE_BACKEND', 'memory')
+    pipeline = RecommendationPipeline.from_env()
+    assert [p.name for p in pipeline.providers] == ['local']
+
+    started = time.monotonic()
+    titles = [b['title'] for b in pipeline.recommend([BookQuery('Dune', 'Frank Herbert')])]
+    assert time.monotonic() - started >= 0.02
+    assert len(titles) == 2
+    assert titles == [b['title'] for b in pipeline.recommend([BookQuery('Dune', 'Frank Herbert')])]
+
+    failing = LocalProvider(error_rate=1.0, breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(ProviderError):
+        failing.search('Emma')
+    assert not failing.breaker.allow_request()
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.rate_limit_storage import SQLiteStorage
+
+
+def test_sliding_window_shared_between_storages(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'limits.sqlite'}"
+    first, second = storage_from_string(uri), storage_from_string(uri)  # e.g. two workers
+    assert isinstance(first, SQLiteStorage)
+    limit = parse('5 per minute')
+    workers = [SlidingWindowCounterRateLimiter(first), SlidingWindowCounterRateLimiter(second)]
+    assert all(workers[i % 2].hit(limit, 'client') for i in range(5))
+    assert not workers[0].hit(limit, 'client')
+    assert not workers[1].hit(limit, 'client')
+    assert workers[1].hit(limit, 'other-client')
+    # Rejected hits are not recorded
+    assert first.get_sliding_window(limit.key_for('client'), limit.get_expiry())[2] == 5
+    assert workers[0].get_window_stats(limit, 'client').remaining == 0
+    workers[0].clear(limit, 'client')
+    assert workers[1].hit(limit, 'client')
+
+
+def test_previous_window_is_weighted(tmp_path, monkeypatch):
+    storage = SQLiteStorage(f"sqlite:///{tmp_path / 'limits.sqlite'}")
+    key, expiry = 'k', 60
+    now = 1_000_000 * expiry + 30  # Halfway through a window
+    monkeypatch.setattr(time, 'time', lambda: now)
+    previous_key, _ = storage.sliding_window_keys(key, expiry, now)
+    storage.incr(previous_key, 2 * expiry, amount=10)
+    assert storage.get_sliding_window(key, expiry)[:3] == (10, 30.0, 0)
+    # Half of the previous window's 10 hits still count against a limit of 10
+    assert storage.acquire_sliding_window_entry(key, 10, expiry, amount=5)
+    assert not storage.acquire_sliding_window_entry(key, 10, expiry)
+
+
+def test_fixed_window_and_reset(tmp_path):
+    storage = SQLiteStorage(f"sqlite:///{tmp_path / 'limits.sqlite'}", trim_interval=2)
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse('2 per second')
+    assert limiter.hit(limit, 'a') and limiter.hit(limit, 'a')
+    assert not limiter.hit(limit, 'a')
+    assert storage.check()
+    assert storage.reset() >= 1
+    assert limiter.hit(limit, 'a')
@@ -0,0 +1,68 @@
+import os
+import sys
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.response_cache import MemoryTier, SQLiteTier, TieredCache
+from backend.providers import BookProvider, make_book
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = TieredCache(MemoryTier(max_entries=2))
+    cache.set('a', 1, ttl=60)
+    cache.set('b', 2, ttl=60)
+    assert cache.get_or_fetch('a', lambda: 'fetched', ttl=60) == 1
+    cache.set('c', 3, ttl=60)  # evicts 'b', the least recently used
+    assert cache.get_or_fetch('b', lambda: 'fetched', ttl=60) == 'fetched'
+    assert cache.memory.evictions >= 1
+
+
+def test_sqlite_tier_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    first = TieredCache(MemoryTier(), SQLiteTier(path))
+    first.set('key', {'items': [1, 2]}, ttl=60)
+
+    second = TieredCache(MemoryTier(), SQLiteTier(path))
+    assert second.get_or_fetch('key', lambda: None, ttl=60) == {'items': [1, 2]}
+    assert second.stats()['disk_hits'] == 1
+    mode = second.disk._connection().execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_sqlite_tier_trims_to_max_entries(tmp_path):
+    tier = SQLiteTier(str(tmp_path / 'cache.sqlite'), max_entries=3, trim_interval=1)
+    cache = TieredCache(MemoryTier(), tier)
+    for i in range(6):
+        cache.set(f'k{i}', i, ttl=60)
+    assert tier.count() == 3
+
+
+def test_stale_entry_served_while_revalidating():
+    cache = TieredCache(MemoryTier(), stale_ttl=60)
+    cache.set('key', 'old', ttl=0)
+    assert cache.get_or_fetch('key', lambda: 'new', ttl=60) == 'old'
+    cache._executor.shutdown(wait=True)
+    assert cache.memory.get('key').value == 'new'
+    assert cache.stats()['stale_hits'] == 1
+
+
+def test_provider_uses_cache_for_repeated_queries():
+    class CountingProvider(BookProvider):
+        name = 'counting'
+        calls = 0
+
+        def build_url(self, query):
+            return query
+
+        def fetch_json(self, url, timeout):
+            CountingProvider.calls += 1
+            return [url]
+
+        def parse(self, payload):
+            return [make_book(title=t) for t in payload]
+
+    provider = CountingProvider(cache=TieredCache(MemoryTier()), cache_ttl=60)
+    provider.search('Dune')
+    provider.search('Dune')
+    assert CountingProvider.calls == 1
+    assert provider.cache.stats()['memory_hits'] == 1
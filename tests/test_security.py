@@ -1,14 +1,30 @@
 import os
 import sys
 import tempfile
+import bleach
 import pytest
 
 os.environ.setdefault('SECRET_KEY', 'test-secret')
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.app import sanitize_input
+from backend.sanitize import cache_stats
 
 
 def test_sanitize_input_strips_tags():
     malicious = "<script>alert('hack')</script> Hello"
     assert sanitize_input(malicious) == "alert('hack') Hello"
 
+
+def test_sanitize_input_fast_path_matches_bleach():
+    plain = 'The Left Hand of Darkness'
+    assert sanitize_input(plain) is plain  # Returned without parsing
+    for text in ['Tom & Jerry', 'a > b', '<b>Bold</b> <img src=x onerror=1>', 'x < y', 'Émile "quoted"',
+                 'Line\r\nbreak', 'Car\rriage', 'Nul\x00byte', 'Form\x0cfeed', 'Tab\tand\nnewline']:
+        assert sanitize_input(text) == bleach.clean(text, strip=True)
+    # Every single character below U+0100 cleans the same with and without the fast path
+    for code in range(0x100):
+        text = f'a{chr(code)}b'
+        assert sanitize_input(text) == bleach.clean(text, strip=True), hex(code)
+    before = cache_stats()['hits']
+    sanitize_input('Tom & Jerry')
+    assert cache_stats()['hits'] == before + 1
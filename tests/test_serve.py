@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend import serve
+from backend.serve import ServeConfig
+
+
+def test_config_from_env_and_cli_overrides(monkeypatch):
+    monkeypatch.setenv('SERVE_WORKERS', '3')
+    monkeypatch.setenv('SERVE_WORKER_CLASS', 'gevent')
+    monkeypatch.setenv('SERVE_KEEPALIVE', '10')
+    config = ServeConfig.from_env()
+    assert (config.workers, config.worker_class, config.keepalive) == (3, 'gevent', 10)
+    args = serve.parse_args(['--workers', '5', '--worker-class', 'gthread', '--threads', '16', '--no-init-db'])
+    assert (args.workers, args.worker_class, args.threads, args.keepalive, args.init_db) == (5, 'gthread', 16, 10, False)
+
+
+def test_gunicorn_options_per_worker_class():
+    options = ServeConfig(workers=2, threads=4, graceful_timeout=20).gunicorn_options()
+    assert options['threads'] == 4
+    assert options['graceful_timeout'] == 20
+    assert options['preload_app'] is False
+    assert 'worker_connections' not in options
+    options = ServeConfig(workers=2, worker_class='gevent', worker_connections=500).gunicorn_options()
+    assert options['worker_connections'] == 500
+    assert 'threads' not in options
+    with pytest.raises(ValueError):
+        ServeConfig(worker_class='eventlet')
+
+
+def test_missing_server_packages_exit(monkeypatch):
+    monkeypatch.setattr(serve, 'BaseApplication', None)
+    with pytest.raises(SystemExit, match='gunicorn is not installed'):
+        serve.main(['--no-init-db'])
+
+
+def test_init_database_is_idempotent():
+    from backend.app import app, db, init_database
+    init_database()
+    init_database()
+    with app.app_context():
+        assert 'normalized_title' in {c['name'] for c in db.inspect(db.engine).get_columns('book')}
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.singleflight import SingleFlight
+from backend.providers import BookProvider, make_book
+import backend.app as app_module
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(1)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flight.do, 'key', work) for _ in range(5)]
+        time.sleep(0.1)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'executions': 1, 'shared': 4, 'in_flight': 0}
+
+
+def test_errors_propagate_to_waiters_and_next_call_retries():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do('key', lambda: (_ for _ in ()).throw(ValueError('boom')))
+    assert flight.do('key', lambda: 'ok') == 'ok'
+    assert flight.executions == 2
+
+
+def test_async_callers_join_threaded_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(1)
+        return 'result'
+
+    async def waiters():
+        await asyncio.sleep(0.05)  # Let the thread become the leader
+        results = asyncio.gather(*(flight.do_async('key', lambda: asyncio.sleep(0, 'own')) for _ in range(3)))
+        await asyncio.sleep(0.05)  # The coroutines join the thread's call without blocking the loop
+        release.set()
+        return await results
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, 'key', work)
+        assert asyncio.run(waiters()) == ['result'] * 3
+        assert leader.result() == 'result'
+    assert flight.stats() == {'executions': 1, 'shared': 3, 'in_flight': 0}
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return 'result'
+
+        loop = asyncio.get_running_loop()
+        leader = asyncio.create_task(flight.do_async('key', work))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(flight.do_async('key', work))
+        waiter = asyncio.create_task(flight.do_async('key', work))
+        threaded = loop.run_in_executor(None, flight.do, 'key', lambda: 'own')
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(leader, waiter, threaded)
+        assert cancelled.cancelled()
+        return results
+
+    assert asyncio.run(main()) == ['result'] * 3
+    assert flight.stats() == {'executions': 1, 'shared': 3, 'in_flight': 0}
+
+
+def test_provider_coalesces_identical_queries():
+    class SlowProvider(BookProvider):
+        name = 'slow'
+        fetches = 0
+
+        def build_url(self, query):
+            return query
+
+        def fetch_json(self, url, timeout):
+            SlowProvider.fetches += 1
+            time.sleep(0.1)
+            return [url]
+
+        def parse(self, payload):
+            return [make_book(title=t) for t in payload]
+
+    provider = SlowProvider()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: provider.search('Dune'), range(4)))
+    assert all(r[0]['title'] == 'Dune' for r in results)
+    assert SlowProvider.fetches == 1
+
+
+def test_identical_images_share_one_llm_call(tmp_path, monkeypatch):
+    class FakeModel:
+        calls = 0
+
+        def generate_content(self, contents, **kwargs):
+            FakeModel.calls += 1
+            time.sleep(0.1)
+            return SimpleNamespace(text='The Hobbit\nDune',
+                                   candidates=[SimpleNamespace(finish_reason=1)])
+
+    monkeypatch.setattr(app_module, 'llm_model', FakeModel())
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'shelf{i}.png'
+        Image.new('RGB', (10, 10), 'white').save(path)
+        paths.append(str(path))
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(app_module.detect_books_with_llm, paths))
+    assert results == [['The Hobbit', 'Dune']] * 3
+    assert FakeModel.calls == 1
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Importing the app used to take ~1.4s, most of it google.generativeai; it now
+# takes ~0.9s here. The budget leaves room for slower machines.
+IMPORT_BUDGET_SECONDS = float(os.getenv('IMPORT_BUDGET_SECONDS', '2.5'))
+
+CHILD = """
+import json, logging, sys, threading, time
+start = time.perf_counter()
+import backend.app as app_module
+elapsed = time.perf_counter() - start
+loaded = [m for m in ('google.generativeai', 'requests', 'httpx') if m in sys.modules]
+report = {'elapsed': elapsed, 'loaded': loaded, 'handlers': len(logging.getLogger().handlers),
+          'available': app_module.llm_model is not None,
+          'pipeline': app_module.recommendation_pipeline is not None,
+          'pools': [t.name for t in threading.enumerate() if t is not threading.main_thread()]}
+app_module.create_app(warm=True)
+report['warm_pipeline'] = app_module.recommendation_pipeline is not None
+report['warm_loaded'] = 'google.generativeai' in sys.modules and 'requests' in sys.modules
+report['model'] = app_module.detection_backend._model is not None
+print(json.dumps(report))
+"""
+
+
+def test_import_is_lazy_and_within_budget():
+    env = dict(os.environ, SECRET_KEY='test-secret', DETECTION_BACKEND='gemini',
+               GOOGLE_API_KEY='placeholder-key')
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+
+    assert report['loaded'] == []  # Gemini and HTTP clients wait for first use
+    assert report['handlers'] == 0  # Logging is configured by create_app, not on import
+    assert report['available']  # An API key is enough to accept uploads
+    assert not report['pipeline'] and report['pools'] == []  # No provider pools or cache database yet
+    assert report['elapsed'] < IMPORT_BUDGET_SECONDS
+    assert report['warm_loaded'] and report['model'] and report['warm_pipeline']
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.app import app, db, limiter, ChangeLog
+
+
+@pytest.fixture()
+def client():
+    db_fd, db_path = tempfile.mkstemp()
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'test-secret-key'
+    with app.app_context():
+        db.create_all()
+    with app.test_client() as client:
+        yield client
+    with app.app_context():
+        db.drop_all()
+    limiter.reset()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+def _login(client, name):
+    client.post('/api/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'password1'})
+    token = client.post('/api/login', json={'identifier': name, 'password': 'password1'}).get_json()['token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_sync_returns_only_new_changes(client):
+    alice = _login(client, 'alice')
+    cursor = client.get('/api/sync', headers=alice).get_json()['cursor']
+
+    shelf_id = client.post('/api/bookshelves', headers=alice, json={'name': 'Sci-fi'}).get_json()['id']
+    book_id = client.post(f'/api/bookshelves/{shelf_id}/books', headers=alice, json={'title': 'Dune'}).get_json()['id']
+    data = client.get(f'/api/sync?since={cursor}', headers=alice).get_json()
+    summary = [(c['entity'], c['action']) for c in data['changes']]
+    assert ('shelf', 'created') in summary
+    assert ('membership', 'added') in summary
+    added = next(c for c in data['changes'] if c['entity'] == 'membership')
+    assert added['data']['title'] == 'Dune' and added['shelf_id'] == shelf_id
+
+    cursor = data['cursor']
+    assert client.get(f'/api/sync?since={cursor}', headers=alice).get_json()['changes'] == []
+    client.delete(f'/api/books/{book_id}', headers=alice)
+    changes = client.get(f'/api/sync?since={cursor}', headers=alice).get_json()['changes']
+    assert ('membership', 'removed', book_id) in [(c['entity'], c['action'], c['id']) for c in changes]
+
+
+def test_sync_visibility_covers_friends_and_communities(client):
+    alice = _login(client, 'alice')
+    bob = _login(client, 'bob')
+    carol = _login(client, 'carol')
+    client.post('/api/friends/2', headers=alice)
+    client.post('/api/friends/1', headers=bob)
+    comm_id = client.post('/api/communities', headers=carol, json={'name': 'Readers'}).get_json()['id']
+    client.post(f'/api/communities/{comm_id}/join', headers=alice)
+    cursor = client.get('/api/sync', headers=alice).get_json()['cursor']
+
+    client.post('/api/bookshelves', headers=bob, json={'name': 'Bob shelf'})
+    client.post('/api/bookshelves', headers=carol, json={'name': 'Carol shelf'})
+    client.put(f'/api/communities/{comm_id}', headers=carol, json={'description': 'Monthly club'})
+    changes = client.get(f'/api/sync?since={cursor}', headers=alice).get_json()['changes']
+    names = [c['data'].get('name') for c in changes if c['data']]
+    assert 'Bob shelf' in names
+    assert 'Carol shelf' not in names
+    assert any(c['entity'] == 'community' and c['action'] == 'updated' for c in changes)
+
+
+def test_sync_paginates_and_rejects_pruned_cursors(client):
+    alice = _login(client, 'alice')
+    for i in range(3):
+        client.post('/api/bookshelves', headers=alice, json={'name': f'Shelf {i}'})
+    page = client.get('/api/sync?since=0&limit=2', headers=alice).get_json()
+    assert page['has_more'] and len(page['changes']) == 2
+
+    with app.app_context():
+        ChangeLog.query.filter(ChangeLog.id <= page['cursor'] + 1).delete()
+        db.session.commit()
+    assert client.get(f"/api/sync?since={page['cursor'] - 1}", headers=alice).status_code == 410
@@ -0,0 +1,69 @@
+import os
+import sys
+
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import backend.app as app_module
+from backend.detection import LocalBackend
+from backend.llm_executor import AdaptiveLLMExecutor
+from backend.tiling import TilingConfig, merge_titles, split_into_tiles, tile_spans
+from backend.title_matching import titles_match
+
+
+def test_tile_spans_cover_length_with_overlap():
+    spans = tile_spans(1000, 400, 0.25)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == 1000
+    for (_, prev_end), (start, _) in zip(spans, spans[1:]):
+        assert start < prev_end  # neighbours overlap
+    assert all(end - start == 400 for start, end in spans)
+
+
+def test_should_tile_only_wide_or_huge_images():
+    config = TilingConfig(max_side=4096, max_aspect=2.5)
+    assert not config.should_tile((4032, 3024))
+    assert config.should_tile((6000, 1200))
+    assert config.should_tile((5000, 4000))
+    assert not TilingConfig(mode='off').should_tile((6000, 1200))
+
+
+def test_split_into_strips_along_long_axis():
+    img = Image.new('RGB', (1000, 100))
+    tiles = split_into_tiles(img, TilingConfig(max_aspect=2.5, overlap=0.2))
+    assert len(tiles) > 1
+    assert all(t.size == (250, 100) for t in tiles)
+
+
+def test_merge_titles_dedupes_across_overlaps():
+    merged = merge_titles([
+        ['The Hobbit', 'Dune Messiah'],
+        ['The Hobbit,', 'Dune Messia', 'Emma'],
+    ])
+    assert merged == ['The Hobbit,', 'Dune Messiah', 'Emma']
+
+
+def test_merge_titles_agrees_with_shelf_matching():
+    pairs = [('Sapiens', 'Sapiens: A Brief History of Humankind'), ('Hobbit, The', 'THE HOBBIT!'),
+             ('Harry Potter', 'Harry Potter and the Chamber of Secrets'),
+             ('Star Wars: A New Hope', 'Star Wars: The Empire Strikes Back')]
+    for first, second in pairs:
+        merged = merge_titles([[first], [second]])
+        assert (len(merged) == 1) == titles_match(first, second), (first, second)
+    assert merge_titles([['Sapiens'], ['Sapiens: A Brief History of Humankind']]) == \
+        ['Sapiens: A Brief History of Humankind']
+
+
+def test_wide_image_detected_per_tile_and_merged(tmp_path, monkeypatch):
+    backend = LocalBackend(title_sets=[['Dune', 'Emma'], ['Emma', 'Ulysses'], ['Ulysses', 'Middlemarch']])
+    monkeypatch.setattr(app_module, 'llm_model', backend)
+    monkeypatch.setattr(app_module, 'llm_executor', AdaptiveLLMExecutor(max_in_flight=2))
+    monkeypatch.setattr(app_module, 'tiling_config', TilingConfig(max_aspect=2.5, overlap=0.1))
+
+    path = tmp_path / 'panorama.png'
+    Image.new('RGB', (700, 100), 'white').save(path)
+    titles = app_module.detect_books_with_llm(str(path))
+
+    assert backend.calls == 3
+    assert titles == ['Dune', 'Emma', 'Ulysses', 'Middlemarch']
@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.title_matching import TitleIndex, main_title_key, normalize_title, titles_match
+
+
+def test_normalize_title_folds_variants():
+    assert normalize_title('The Hobbit') == 'hobbit'
+    assert normalize_title('Hobbit, The') == 'hobbit'
+    assert normalize_title('  THE HOBBIT! ') == 'hobbit'
+    assert normalize_title('Émile & the Détectives') == 'emile and the detectives'
+    assert normalize_title('A') == 'a'
+    assert main_title_key('Sapiens: A Brief History of Humankind') == 'sapiens'
+    assert main_title_key('Dune (Dune Chronicles, #1)') == 'dune'
+
+
+def test_subtitle_rules():
+    assert titles_match('Sapiens: A Brief History of Humankind', 'Sapiens')
+    assert titles_match('Sapiens', 'Sapiens: A Brief History of Humankind')
+    assert not titles_match('Star Wars: A New Hope', 'Star Wars: The Empire Strikes Back')
+    assert not titles_match('Dune', 'Dune Messiah')
+
+
+def test_index_finds_near_matches_among_many_titles():
+    rng = random.Random(7)
+    words = 'night sun moon river stone king queen war peace house shadow garden'.split()
+    index = TitleIndex()
+    for n in range(2000):
+        index.add(' '.join(rng.choice(words) for _ in range(3)) + f' volume {n}')
+    index.add("Harry Potter and the Philosopher's Stone", value='hp')
+
+    assert index.find('Harry Poter and the Philosophers Stone') == 'hp'
+    assert index.find('Completely Unrelated Title') is None
+    assert not index.add_if_new('HARRY POTTER AND THE PHILOSOPHER’S STONE')
+    assert len(index) == 2001
+
+
+def test_candidate_keys_find_every_stored_match():
+    stored = ['The Hobbit', "Harry Potter and the Philosopher's Stone", 'Sapiens: A Brief History of Humankind',
+              'Dune', 'Star Wars: A New Hope']
+    keys = TitleIndex()
+    rows = [(title, normalize_title(title), set(keys.match_keys(title))) for title in stored]
+    full = TitleIndex()
+    for title in stored:
+        full.add(title)
+
+    for probe in ['Hobbit, The', 'Harry Poter and the Philosophers Stone', 'Sapiens', 'Dune: Deluxe Edition',
+                  'Star Wars: The Empire Strikes Back', 'Dune Messiah', 'Emma']:
+        normalized, match_keys = keys.candidate_keys(probe)
+        candidates = TitleIndex()
+        for title, key, title_keys in rows:
+            if key in normalized or title_keys & match_keys:
+                candidates.add(title, key=key)
+        assert candidates.find(probe) == full.find(probe), probe
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.token_cache import VerifiedTokenCache
+
+
+def test_cached_claims_are_bound_to_secret():
+    cache = VerifiedTokenCache()
+    claims = {'user_id': 1, 'exp': time.time() + 3600}
+    cache.set('token', 'secret', claims)
+    assert cache.get('token', 'secret') is claims
+    assert cache.get('token', 'rotated') is None
+    assert cache.get('other', 'secret') is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_entries_never_outlive_token_expiry():
+    cache = VerifiedTokenCache(ttl=300)
+    cache.set('expired', 'secret', {'user_id': 1, 'exp': time.time() - 1})
+    assert cache.get('expired', 'secret') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_bound_and_disable():
+    cache = VerifiedTokenCache(max_entries=2)
+    for token in ('a', 'b', 'c'):
+        cache.set(token, 's', {'user_id': token})
+    assert cache.get('a', 's') is None
+    assert cache.get('c', 's') == {'user_id': 'c'}
+    disabled = VerifiedTokenCache(ttl=0)
+    disabled.set('a', 's', {'user_id': 1})
+    assert disabled.get('a', 's') is None
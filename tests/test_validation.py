@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.validation import Field, Schema, ValidationError, add_request_bodies
+
+BOOK = Schema({
+    'title': Field(required=True, max_length=10),
+    'isbn': Field(max_length=13),
+    'cover_image_url': Field(format='url', clean=False),
+})
+
+
+def test_validate_cleans_and_collects_every_error():
+    schema = Schema({
+        'email': Field(required=True, format='email', lower=True),
+        'name': Field(required=True, min_length=3),
+        'is_public': Field('boolean', default=False),
+    })
+    assert schema.validate({'email': ' A@B.COM ', 'name': ' <script>Ann</script> '}) == {
+        'email': 'a@b.com', 'name': 'Ann', 'is_public': False,
+    }
+    with pytest.raises(ValidationError) as exc:
+        schema.validate({'email': 'nope', 'is_public': 'yes'})
+    assert [e['field'] for e in exc.value.errors] == ['email', 'name', 'is_public']
+    assert exc.value.to_dict()['error'] == 'email must be a valid email address'
+    with pytest.raises(ValidationError, match='Request body must be a JSON object'):
+        schema.validate(None)
+
+
+def test_partial_schema_and_optional_empty_strings():
+    update = Schema(BOOK.fields, partial=True)
+    assert update.validate({'isbn': '  '}) == {'isbn': None}
+    with pytest.raises(ValidationError, match='title cannot be empty'):
+        update.validate({'title': ''})
+    with pytest.raises(ValidationError, match='cover_image_url must be an http'):
+        BOOK.validate({'title': 'Dune', 'cover_image_url': 'javascript:alert(1)'})
+
+
+def test_array_items_validated_in_one_pass():
+    bulk = Schema({'books': Field('array', required=True, items=BOOK, min_items=1, max_items=3)})
+    assert bulk.validate({'books': [{'title': 'Dune'}]}) == {'books': [{'title': 'Dune'}]}
+    with pytest.raises(ValidationError) as exc:
+        bulk.validate({'books': [{'title': 'Dune'}, {'title': ''}, 'x']})
+    assert [e['field'] for e in exc.value.errors] == ['books[1].title', 'books[2]']
+    with pytest.raises(ValidationError, match='at most 3 items'):
+        bulk.validate({'books': [{}] * 4})
+
+
+def test_request_bodies_added_to_spec():
+    spec = {'paths': {'/books': {'post': {'summary': 'Add'}}}}
+    add_request_bodies(spec, {('/books', 'post'): BOOK})
+    schema = spec['paths']['/books']['post']['requestBody']['content']['application/json']['schema']
+    assert schema['required'] == ['title']
+    assert schema['properties']['title'] == {'type': 'string', 'maxLength': 10}
+    assert schema['properties']['cover_image_url']['format'] == 'uri'
+
+
+def test_length_checked_before_escaping():
+    # 10 characters as sent; "&" becomes "&amp;" when sanitized
+    assert BOOK.validate({'title': 'Tom & Jery'}) == {'title': 'Tom &amp; Jery'}
+    with pytest.raises(ValidationError, match='title must be at most 10 characters long'):
+        BOOK.validate({'title': 'Tom & Jerry'})